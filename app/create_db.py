@@ -60,6 +60,9 @@ def default_values():
 		{'param': 'smon_keep_history_range', 'value': '14', 'section': 'smon', 'desc': 'Retention period for SMON history', 'group_id': '1'},
 		{'param': 'checker_keep_history_range', 'value': '14', 'section': 'monitoring', 'desc': 'Retention period for Checker history', 'group_id': '1'},
 		{'param': 'action_keep_history_range', 'value': '30', 'section': 'monitoring', 'desc': 'Retention period for Action history', 'group_id': '1'},
+		{'param': 'metrics_1m_keep_history_range', 'value': '7', 'section': 'monitoring', 'desc': 'Retention period for 1-minute metric rollups (in days)', 'group_id': '1'},
+		{'param': 'metrics_10m_keep_history_range', 'value': '60', 'section': 'monitoring', 'desc': 'Retention period for 10-minute metric rollups (in days)', 'group_id': '1'},
+		{'param': 'metrics_1h_keep_history_range', 'value': '365', 'section': 'monitoring', 'desc': 'Retention period for 1-hour metric rollups (in days)', 'group_id': '1'},
 		{'param': 'checker_maxconn_threshold', 'value': '90', 'section': 'monitoring', 'desc': 'Threshold value for alerting, in %', 'group_id': '1'},
 		{'param': 'checker_check_interval', 'value': '1', 'section': 'monitoring', 'desc': 'Check interval for Checker (in minutes)', 'group_id': '1'},
 		{'param': 'smon_ssl_expire_warning_alert', 'value': '14', 'section': 'smon', 'desc': 'Warning alert about a SSL certificate expiration (in days)', 'group_id': '1'},
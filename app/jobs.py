@@ -6,10 +6,17 @@ from app import scheduler
 import app.modules.db.sql as sql
 import app.modules.db.roxy as roxy_sql
 import app.modules.db.history as history_sql
+import app.modules.db.metric as metric_sql
+import app.modules.db.smon as smon_sql
+import app.modules.db.worker as worker_sql
 import app.modules.roxywi.roxy as roxy
+import app.modules.roxywi.overview as overview
+import app.modules.roxywi.log_index as log_index
+import app.modules.config.version_store as version_store
 import app.modules.common.common as common
 import app.modules.tools.common as tools_common
 import app.modules.roxy_wi_tools as roxy_wi_tools
+from app.modules.server.ssh_connection import pool as ssh_pool
 
 get_config = roxy_wi_tools.GetConfigVar()
 
@@ -61,6 +68,12 @@ def delete_old_logs():
                         os.remove(curpath)
         except Exception as e:
             print(f'error: cannot delete old log files: {e}')
+        index = log_index.get_index()
+        if index is not None:
+            try:
+                index.prune(time_storage)
+            except Exception as e:
+                print(f'error: cannot delete old entries from the log index: {e}')
 
 
 @scheduler.task('interval', id='update_owner_on_log', hours=12, misfire_grace_time=None)
@@ -84,3 +97,57 @@ def delete_ansible_artifacts():
                 shutil.rmtree(f'{ansible_path}/{folder}')
             except Exception as e:
                 raise Exception(f'error: Cron cannot delete ansible folders: {e}')
+
+
+@scheduler.task('interval', id='evict_idle_ssh_connections', minutes=1, misfire_grace_time=None)
+def evict_idle_ssh_connections():
+    ssh_pool.evict_idle()
+
+
+@scheduler.task('interval', id='flush_service_metrics', seconds=5, misfire_grace_time=None)
+def flush_service_metrics():
+    app = scheduler.app
+    with app.app_context():
+        metric_sql.flush_service_metrics()
+
+
+@scheduler.task('interval', id='rollup_metrics', minutes=1, misfire_grace_time=None)
+def rollup_metrics():
+    app = scheduler.app
+    with app.app_context():
+        metric_sql.rollup_metrics()
+
+
+@scheduler.task('interval', id='delete_metrics_rollups', hours=1, misfire_grace_time=None)
+def delete_metrics_rollups():
+    app = scheduler.app
+    with app.app_context():
+        metric_sql.delete_metrics_rollups()
+
+
+@scheduler.task('interval', id='rollup_smon_history', minutes=10, misfire_grace_time=None)
+def rollup_smon_history():
+    app = scheduler.app
+    with app.app_context():
+        smon_sql.rollup_smon_history()
+
+
+@scheduler.task('interval', id='publish_worker_heartbeats', seconds=worker_sql.WORKER_STALE // 3, misfire_grace_time=None)
+def publish_worker_heartbeats():
+    app = scheduler.app
+    with app.app_context():
+        overview.publish_worker_heartbeats()
+
+
+@scheduler.task('interval', id='delete_dead_workers', hours=1, misfire_grace_time=None)
+def delete_dead_workers():
+    app = scheduler.app
+    with app.app_context():
+        worker_sql.delete_dead_workers()
+
+
+@scheduler.task('interval', id='pack_config_versions', hours=1, misfire_grace_time=None)
+def pack_config_versions():
+    app = scheduler.app
+    with app.app_context():
+        version_store.pack_versions()
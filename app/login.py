@@ -2,7 +2,6 @@ from flask import render_template, request, redirect, make_response, abort
 from flask_jwt_extended import unset_jwt_cookies, jwt_required
 
 from app import app
-import app.modules.db.user as user_sql
 import app.modules.roxywi.roxy as roxy
 import app.modules.roxywi.auth as roxywi_auth
 import app.modules.roxywi.common as roxywi_common
@@ -23,7 +22,7 @@ def check_login():
             print(f'{e}')
             abort(401)
 
-        if not user_sql.is_user_active(user_params['user_id']):
+        if not user_params['enabled']:
             abort(401)
 
         try:
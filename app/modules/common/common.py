@@ -48,6 +48,21 @@ def get_time_zoned_date(date: datetime, fmt: str = '%Y-%m-%d %H:%M:%S') -> str:
 	return native.strftime(fmt)
 
 
+def get_time_zone_offset(date: datetime = None) -> int:
+	"""
+	Returns the offset of the configured time zone from UTC in seconds.
+
+	:param date: The UTC date to get the offset for, the current time by default.
+	:type date: datetime, optional
+
+	:return: The offset in seconds.
+	:rtype: int
+	"""
+	if date is None:
+		date = datetime.utcnow()
+	return int(_convert_to_time_zone(date).utcoffset().total_seconds())
+
+
 def get_present_time():
 	"""
 	Returns the current time in UTC.
@@ -100,16 +100,17 @@ def save_bwlist(list_name: str, list_con: str, color: str, group: str, server_ip
 		if master[0] is not None:
 			servers.append(master[0])
 
-	for serv in servers:
+	def upload_list(serv: str) -> str:
 		server_mod.ssh_command(serv, f"sudo mkdir {path}")
 		server_mod.ssh_command(serv, f"sudo chown $(whoami) {path}")
+		serv_output = ''
 		try:
 			config_mod.upload(serv, f'{path}/{list_name}', list_path)
 		except Exception as e:
 			roxywi_common.logging(serv, f'error: Upload fail: to {serv}: {e}', roxywi=1, login=1)
-			output += f'error: Upload fail: to {serv}: {e} , '
+			serv_output += f'error: Upload fail: to {serv}: {e} , '
 
-		output += f'success: Edited {color} list was uploaded to {serv} , '
+		serv_output += f'success: Edited {color} list was uploaded to {serv} , '
 		try:
 			roxywi_common.logging(serv, f'Has been edited the {color} list {list_name}', roxywi=1, login=1)
 		except Exception:
@@ -122,6 +123,13 @@ def save_bwlist(list_name: str, list_con: str, color: str, group: str, server_ip
 			server_mod.ssh_command(serv, f"sudo systemctl restart {haproxy_service_name}")
 		elif action == 'reload':
 			server_mod.ssh_command(serv, f"sudo systemctl reload {haproxy_service_name}")
+		return serv_output
+
+	for serv, result in server_mod.fan_out(servers, upload_list).items():
+		if result['status'] == 'ok':
+			output += result['output']
+		else:
+			output += f'error: Upload fail: to {serv}: {result["error"]} , '
 
 	return output
 
@@ -150,11 +158,10 @@ def delete_bwlist(list_name: str, color: str, group: str, server_ip: str) -> str
 		for s in server:
 			servers.append(s[2])
 
-	for serv in servers:
-		try:
-			server_mod.ssh_command(serv, f"sudo rm {path}/{list_name}")
-		except Exception as e:
-			return f'error: Deleting fail: {e} , '
+	for serv, result in server_mod.ssh_command_many(servers, f"sudo rm {path}/{list_name}").items():
+		if result['status'] != 'ok':
+			output += f'error: Deleting fail on {serv}: {result["error"]} , '
+			continue
 
 		output += f'success: the {color} list has been deleted on {serv} , '
 		roxywi_common.logging(serv, f'has been deleted the {color} list {list_name}', roxywi=1, login=1)
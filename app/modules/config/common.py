@@ -3,8 +3,6 @@ import app.modules.common.common as common
 import app.modules.roxy_wi_tools as roxy_wi_tools
 
 get_config_var = roxy_wi_tools.GetConfigVar()
-time_zone = sql.get_setting('time_zone')
-get_date = roxy_wi_tools.GetDate(time_zone)
 
 
 def get_file_format(service: str) -> str:
@@ -45,4 +43,5 @@ def generate_config_path(service: str, server_ip: str) -> str:
 	server_ip = common.is_ip_or_dns(server_ip)
 	file_format = get_file_format(service)
 	config_dir = get_config_dir(service)
+	get_date = roxy_wi_tools.GetDate(sql.get_setting('time_zone'))
 	return f"{config_dir}/{server_ip}-{get_date.return_date('config')}.{file_format}"
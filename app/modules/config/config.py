@@ -1,4 +1,6 @@
 import os
+import json
+import tempfile
 from pathlib import Path
 from typing import Any
 
@@ -17,9 +19,10 @@ import app.modules.roxy_wi_tools as roxy_wi_tools
 import app.modules.service.common as service_common
 import app.modules.service.action as service_action
 import app.modules.config.common as config_common
+import app.modules.config.diff as diff_mod
+import app.modules.config.config_mirror as config_mirror
+import app.modules.config.version_store as version_store
 
-time_zone = sql.get_setting('time_zone')
-get_date = roxy_wi_tools.GetDate(time_zone)
 get_config_var = roxy_wi_tools.GetConfigVar()
 
 
@@ -61,7 +64,8 @@ def get_config(server_ip, cfg, service='haproxy', **kwargs):
 
 	After determining the configuration path, the method validates that the configuration file exists using the 'common.check_is_conf' function.
 
-	Finally, the method establishes an SSH connection to the server IP using the 'mod_ssh.ssh_connect' function and retrieves the configuration file using the 'ssh.get_sftp' function. Any
+	Finally, the method establishes an SSH connection to the server IP using the 'mod_ssh.ssh_connect' function and retrieves the configuration file using the 'config_mirror.fetch' function,
+	* which copies it from the local mirror when its checksum on the server has not changed and downloads it with SFTP otherwise. Any
 	* exceptions that occur during this process are handled by the 'roxywi_common.handle_exceptions' function, displaying an error message with the relevant details.
 	"""
 	config_path = ''
@@ -78,7 +82,7 @@ def get_config(server_ip, cfg, service='haproxy', **kwargs):
 
 	try:
 		with mod_ssh.ssh_connect(server_ip) as ssh:
-			ssh.get_sftp(config_path, cfg)
+			config_mirror.fetch(ssh, service, server_ip, config_path, cfg)
 	except Exception as e:
 		roxywi_common.handle_exceptions(e, 'Roxy-WI server', 'Cannot get config in get config function')
 
@@ -99,6 +103,25 @@ def upload(server_ip: str, path: str, file: str) -> None:
 		roxywi_common.handle_exceptions(e, 'Roxy-WI server', f'Cannot upload {file} to {path} to server: {server_ip}')
 
 
+def upload_config(server_ip: str, path: str, file: str, service: str, config_path: str) -> None:
+	"""
+	Uploads a new config file to the server, to the path from where the commands of upload_and_restart move it to config_path.
+	When the config on the server is the same already, it is copied there instead of uploaded.
+
+	:param server_ip: The IP address or hostname of the remote server.
+	:param path: The remote path on the server where the file will be uploaded.
+	:param file: The config file to be uploaded.
+	:param service: The service name.
+	:param config_path: The path to the configuration file on the server.
+	:return: None
+	"""
+	try:
+		with mod_ssh.ssh_connect(server_ip) as ssh:
+			config_mirror.upload(ssh, service, server_ip, path, file, config_path)
+	except Exception as e:
+		roxywi_common.handle_exceptions(e, 'Roxy-WI server', f'Cannot upload {file} to {path} to server: {server_ip}')
+
+
 def _generate_command(service: str, server_id: int, just_save: str, config_path: str, tmp_file: str, cfg: str, server_ip: str) -> str:
 	"""
 	:param service: The name of the service.
@@ -166,30 +189,67 @@ def _create_config_version(server_id: int, server_ip: str, service: str, config_
 	:return: None
 	"""
 	diff = ''
+	diff_hunks = None
+	old_content = None
+	downloaded_cfg = None
 
-	if old_cfg:
-		path = Path(old_cfg)
+	if old_cfg and Path(old_cfg).is_file():
+		with open(old_cfg, 'rb') as f:
+			old_content = f.read()
 	else:
-		old_cfg = ''
-		path = Path(old_cfg)
-
-	if not path.is_file():
+		# The config as it was uploaded last is kept in the version store, so it does not have to be downloaded
+		try:
+			old_content = version_store.last_config(server_id, service, config_path)
+		except Exception as e:
+			roxywi_common.logging('Roxy-WI server', f'error: Cannot get last config version: {e}')
 		old_cfg = f'{tmp_file}.old'
+		if old_content is None:
+			try:
+				# Slaves are updated at the same time with the same tmp_file, so every server gets its own file
+				fd, downloaded_cfg = tempfile.mkstemp(
+					prefix=f'{os.path.basename(tmp_file)}.{server_ip}.', suffix='.old', dir=os.path.dirname(tmp_file)
+				)
+				os.close(fd)
+				old_cfg = downloaded_cfg
+				get_config(server_ip, old_cfg, service=service, config_file_name=config_path)
+				with open(old_cfg, 'rb') as f:
+					old_content = f.read()
+			except Exception:
+				roxywi_common.logging('Roxy-WI server', 'Cannot download config for diff')
+
+	if old_content is not None:
 		try:
-			get_config(server_ip, old_cfg, service=service, config_file_name=config_path)
-		except Exception:
-			roxywi_common.logging('Roxy-WI server', 'Cannot download config for diff')
+			with open(cfg, 'rb') as f:
+				hunks = diff_mod.diff_hunks(old_content, f.read(), ignore_whitespace=True)
+			diff = diff_mod.format_unified(hunks, diff_mod.file_label(old_cfg), diff_mod.file_label(cfg))
+			diff_hunks = json.dumps(hunks)
+		except Exception as e:
+			roxywi_common.logging('Roxy-WI server', f'error: Cannot create diff config version: {e}')
+	if downloaded_cfg:
+		try:
+			os.remove(downloaded_cfg)
+		except OSError:
+			pass
+
+	content_hash = None
 	try:
-		diff = diff_config(old_cfg, cfg)
+		content_hash = version_store.put_file(service, cfg)
 	except Exception as e:
-		roxywi_common.logging('Roxy-WI server', f'error: Cannot create diff config version: {e}')
+		roxywi_common.logging('Roxy-WI server', f'error: Cannot store config version: {e}')
 
 	try:
-		config_sql.insert_config_version(server_id, user_id, service, cfg, config_path, diff)
+		config_sql.insert_config_version(server_id, user_id, service, cfg, config_path, diff, content_hash, diff_hunks)
 	except Exception as e:
 		roxywi_common.logging('Roxy-WI server', f'error: Cannot insert config version: {e}')
 
 
+def _dos2unix(cfg: str) -> None:
+	try:
+		os.system(f"dos2unix -q {cfg}")
+	except OSError as e:
+		roxywi_common.handle_exceptions(e, 'Roxy-WI server', 'There is no dos2unix')
+
+
 def upload_and_restart(server_ip: str, cfg: str, just_save: str, service: str, **kwargs):
 	"""
 	:param server_ip: IP address of the server
@@ -204,6 +264,7 @@ def upload_and_restart(server_ip: str, cfg: str, just_save: str, service: str, *
 	user = user_sql.get_user_id(g.user_params['user_id'])
 	config_path = kwargs.get('config_file_name')
 	server_id = server_sql.get_server_by_ip(server_ip).server_id
+	get_date = roxy_wi_tools.GetDate(sql.get_setting('time_zone'))
 	tmp_file = f"{sql.get_setting('tmp_config_path')}/{get_date.return_date('config')}.{config_common.get_file_format(service)}"
 
 	if config_path and config_path != 'undefined':
@@ -214,13 +275,11 @@ def upload_and_restart(server_ip: str, cfg: str, just_save: str, service: str, *
 
 	common.check_is_conf(config_path)
 
-	try:
-		os.system(f"dos2unix -q {cfg}")
-	except OSError as e:
-		roxywi_common.handle_exceptions(e, 'Roxy-WI server', 'There is no dos2unix')
+	if not kwargs.get('converted'):
+		_dos2unix(cfg)
 
 	try:
-		upload(server_ip, tmp_file, cfg)
+		upload_config(server_ip, tmp_file, cfg, service, config_path)
 	except Exception as e:
 		roxywi_common.handle_exceptions(e, 'Roxy-WI server', 'Cannot upload config')
 
@@ -269,18 +328,25 @@ def master_slave_upload_and_restart(server_ip: str, cfg: str, just_save: str, se
 	waf = kwargs.get('waf')
 	server = server_sql.get_server_by_ip(server_ip)
 
-	for master in masters:
-		if master[0] is not None:
-			try:
-				slv_output = upload_and_restart(
-					master[0], cfg, just_save, service, waf=waf, config_file_name=config_file_name, slave=1
-				)
-				slave_output += f'<br>slave_server:\n{slv_output}'
-			except Exception as e:
-				slave_output += f'<br>slave_server:\n error: {e}'
+	_dos2unix(cfg)
+
+	def upload_to_slave(host: str) -> str:
+		return upload_and_restart(host, cfg, just_save, service, waf=waf, config_file_name=config_file_name, slave=1, converted=1)
+
+	# The slaves are done at the same time, the master only after all of them,
+	# so a bad config never takes down every node of the cluster at once
+	slaves = [master[0] for master in masters if master[0] is not None and master[0] != server_ip]
+	results = server_mod.fan_out(slaves, upload_to_slave)
+
+	for slave in slaves:
+		if results[slave]['status'] == 'ok':
+			slave_output += f'<br>slave_server:\n{results[slave]["output"]}'
+		else:
+			slave_output += f'<br>slave_server:\n error: {results[slave]["error"]}'
+
 	try:
 		output = upload_and_restart(
-			server_ip, cfg, just_save, service, waf=waf, config_file_name=config_file_name, oldcfg=old_cfg
+			server_ip, cfg, just_save, service, waf=waf, config_file_name=config_file_name, oldcfg=old_cfg, converted=1
 		)
 	except Exception as e:
 		output = f'error: {e}'
@@ -345,26 +411,27 @@ def _open_port_firewalld(cfg: str, server_ip: str, service: str) -> str:
 	return firewalld_commands
 
 
-def diff_config(old_cfg, cfg) -> str:
+def diff_config(old_cfg, cfg, ignore_whitespace: bool = True) -> str:
 	"""
 	Compute the difference between two configuration files and return the result as a string.
 
-	This function executes the `diff` command to compare two configuration files,
-	specified by their paths, and retrieves the resulting differences. The output
-	contains the line-by-line difference between `old_cfg` and `cfg` using the
-	unified diff format. This function is useful for auditing and comparing
-	configuration changes.
+	The files are compared in-process and the result is a minimal unified diff in the format of `diff -u`.
+	Hunks and line pairing may differ from GNU diff where several diffs of the same size are possible.
 
 	:param old_cfg: Path to the old configuration file to compare.
 	:param cfg: Path to the new configuration file to compare.
+	:param ignore_whitespace: Ignore changes in the amount of white space.
 	:return: Unified diff output showing the differences between `old_cfg` and `cfg`.
 	"""
-	cmd = f"/bin/diff -ub {old_cfg} {cfg}"
-	output, stderr = server_mod.subprocess_execute(cmd)
-	if stderr:
-		raise Exception(stderr)
-	output = '\n'.join(output)
-	return output
+	try:
+		with open(old_cfg, 'rb') as f:
+			old_content = f.read()
+		with open(cfg, 'rb') as f:
+			content = f.read()
+	except OSError as e:
+		raise Exception(f'error: Cannot read config file: {e}')
+	hunks = diff_mod.diff_hunks(old_content, content, ignore_whitespace=ignore_whitespace)
+	return diff_mod.format_unified(hunks, diff_mod.file_label(old_cfg), diff_mod.file_label(cfg))
 
 
 def _classify_line(line: str) -> str:
@@ -412,24 +479,24 @@ def show_compare_config(server_ip: str, service: str) -> str:
 	:return: Returns the rendered template as a string.
 	"""
 	lang = roxywi_common.get_user_lang_for_flask()
-	config_dir = config_common.get_config_dir(service)
-	file_format = config_common.get_file_format(service)
-	return_files = roxywi_common.get_files(config_dir, file_format, server_ip=server_ip)
+	return_files = version_store.list_versions(server_ip, service)
 
 	return render_template('ajax/show_compare_configs.html', serv=server_ip, return_files=return_files, lang=lang)
 
 
-def compare_config(service: str, left: str, right: str) -> str:
+def compare_config(service: str, left: str, right: str, ignore_whitespace: bool = True) -> str:
 	"""
 	Compares the configuration files of a service.
 
 	:param service: The name of the service.
 	:param left: The name of the left configuration file.
 	:param right: The name of the right configuration file.
+	:param ignore_whitespace: Ignore changes in the amount of white space.
 	:return: The rendered template with the diff output and the user language for Flask.
 	"""
-	config_dir = config_common.get_config_dir(service)
-	output = diff_config(f'{config_dir}{left}', f'{config_dir}{right}')
+	output = diff_config(
+		version_store.materialize(service, left), version_store.materialize(service, right), ignore_whitespace=ignore_whitespace
+	)
 	return output
 
 
@@ -469,7 +536,7 @@ def show_config(server_ip: str, service: str, config_file_name: str, configver:
 		except Exception as e:
 			raise Exception(e)
 	else:
-		cfg = configs_dir + configver
+		cfg = version_store.materialize(service, configver)
 
 	try:
 		with open(cfg, 'r', encoding='utf-8', errors='replace') as file:
@@ -539,13 +606,13 @@ def list_of_versions(server_ip: str, service: str, configver: str, for_delver: i
 	configs = config_sql.select_config_version(server_ip, service)
 	lang = roxywi_common.get_user_lang_for_flask()
 	action = f'/app/config/versions/{service}/{server_ip}'
-	config_dir = config_common.get_config_dir(service)
-	file_format = config_common.get_file_format(service)
-	files = roxywi_common.get_files(config_dir, file_format, server_ip)
+	files = version_store.version_files(configs)
+	# Versions saved with the diff hunks show the number of changed lines without parsing the diff
+	diff_stats = {c.id: diff_mod.stats(json.loads(c.diff_hunks)) for c in configs if c.diff_hunks}
 
 	return render_template(
 		'ajax/show_list_version.html', server_ip=server_ip, service=service, action=action, return_files=files,
-		configver=configver, for_delver=for_delver, configs=configs, users=users, lang=lang
+		configver=configver, for_delver=for_delver, configs=configs, users=users, lang=lang, diff_stats=diff_stats
 	)
 
 
@@ -570,6 +637,7 @@ def return_cfg(service: str, server_ip: str, config_file_name: str) -> str:
 	if service in ('nginx', 'apache'):
 		config_file_name = _replace_config_path_to_correct(config_file_name)
 		conf_file_name_short = config_file_name.split('/')[-1]
+		get_date = roxy_wi_tools.GetDate(sql.get_setting('time_zone'))
 		cfg = f"{config_dir}{server_ip}-{conf_file_name_short}-{get_date.return_date('config')}.{file_format}"
 	else:
 		cfg = config_common.generate_config_path(service, server_ip)
@@ -0,0 +1,101 @@
+import os
+import re
+import shlex
+import shutil
+import hashlib
+import tempfile
+from typing import Union
+
+import app.modules.config.common as config_common
+
+MIRROR_DIR = '.mirror'
+MIRROR_SERVICES = ('haproxy', 'nginx', 'apache', 'keepalived')
+_SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _mirror_path(service: str, server_ip: str, remote_path: str) -> Union[str, None]:
+	# Only services with a config directory have a mirror, WAF rules are always transferred
+	if service not in MIRROR_SERVICES:
+		return None
+	name = hashlib.sha256(f'{server_ip}:{remote_path}'.encode('utf-8')).hexdigest()
+	return os.path.join(config_common.get_config_dir(service), MIRROR_DIR, name)
+
+
+def _file_hash(path: str) -> Union[str, None]:
+	try:
+		with open(path, 'rb') as f:
+			return hashlib.sha256(f.read()).hexdigest()
+	except OSError:
+		return None
+
+
+def _store(mirror: str, file: str) -> None:
+	os.makedirs(os.path.dirname(mirror), exist_ok=True)
+	fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(mirror), prefix='.tmp-')
+	os.close(fd)
+	try:
+		shutil.copyfile(file, tmp_path)
+		os.replace(tmp_path, mirror)
+	except Exception:
+		try:
+			os.remove(tmp_path)
+		except OSError:
+			pass
+		raise
+
+
+def _run(ssh, command: str) -> Union[str, None]:
+	stdin, stdout, stderr = ssh.run_command(command, timeout=10)
+	stdin.close()
+	output = stdout.read().decode('utf-8', errors='replace')
+	if stdout.channel.recv_exit_status():
+		return None
+	return output
+
+
+def remote_checksum(ssh, remote_path: str) -> Union[str, None]:
+	"""
+	sha256 of the file on the server, in one round trip over the open SSH connection, or None if it cannot be read.
+	"""
+	output = _run(ssh, f'sha256sum -- {shlex.quote(remote_path)}')
+	if not output or not output.split():
+		return None
+	checksum = output.split()[0].lstrip('\\')
+	return checksum if _SHA256_RE.match(checksum) else None
+
+
+def fetch(ssh, service: str, server_ip: str, remote_path: str, cfg: str) -> None:
+	"""
+	Get the config file remote_path of the server into cfg. The last downloaded copy of every config is kept in
+	the mirror, and if the checksum of the file on the server is the same, it is copied from there instead of
+	downloaded again.
+	"""
+	mirror = _mirror_path(service, server_ip, remote_path)
+	if mirror is None:
+		ssh.get_sftp(remote_path, cfg)
+		return
+	mirror_hash = _file_hash(mirror)
+	if mirror_hash and remote_checksum(ssh, remote_path) == mirror_hash:
+		shutil.copyfile(mirror, cfg)
+		return
+	ssh.get_sftp(remote_path, cfg)
+	_store(mirror, cfg)
+
+
+def upload(ssh, service: str, server_ip: str, remote_path: str, file: str, config_path: str) -> None:
+	"""
+	Upload the new config file to remote_path, from where it replaces config_path.
+	If the config on the server is already the same, it is copied on the server instead of uploaded.
+	"""
+	mirror = _mirror_path(service, server_ip, config_path)
+	if mirror is None:
+		ssh.put_sftp(file, remote_path)
+		return
+	file_hash = _file_hash(file)
+	# Only a config that is the same as the last known one can be on the server already,
+	# so changed configs are uploaded without asking the server first
+	if file_hash and file_hash == _file_hash(mirror) and remote_checksum(ssh, config_path) == file_hash:
+		if _run(ssh, f'cp -- {shlex.quote(config_path)} {shlex.quote(remote_path)}') is not None:
+			return
+	ssh.put_sftp(file, remote_path)
+	_store(mirror, file)
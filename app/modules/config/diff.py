@@ -0,0 +1,238 @@
+import os
+import re
+import difflib
+from datetime import datetime
+from typing import Union
+
+_WHITESPACE = re.compile(r'[ \t\f\v]+')
+NO_NEWLINE = '\\ No newline at end of file'
+# Above this number of changed lines the configs are compared by difflib instead of the algorithm of Myers
+MAX_COST = 1000
+
+
+def split_lines(content: Union[bytes, str]) -> list:
+	"""
+	Lines of the config with their line ends, as diff reads them.
+	"""
+	if isinstance(content, bytes):
+		content = content.decode('utf-8', errors='replace')
+	lines = [f'{line}\n' for line in content.split('\n')]
+	lines[-1] = lines[-1][:-1]
+	if not lines[-1]:
+		lines.pop()
+	return lines
+
+
+def _key(line: str) -> str:
+	# What diff -b compares: runs of white space count as one space and white space at the line end is ignored
+	return _WHITESPACE.sub(' ', line.rstrip())
+
+
+def _range(start: int, count: int) -> str:
+	# Same numbers as diff prints them: an empty range starts at the line before it
+	if count == 1:
+		return str(start + 1)
+	if not count:
+		return f'{start},0'
+	return f'{start + 1},{count}'
+
+
+def _add_lines(lines: list, tag: str, source: list) -> None:
+	for line in source:
+		if line.endswith('\n'):
+			lines.append([tag, line[:-1]])
+		else:
+			lines.append([tag, line])
+			lines.append(['\\', NO_NEWLINE[1:]])
+
+
+def _myers(a: list, b: list, max_cost: int):
+	"""
+	Shortest edit script of a into b by the algorithm of Myers, as a list of the points (x, y) the path goes through.
+	None if it takes more than max_cost changes.
+	"""
+	n, m = len(a), len(b)
+	v = {1: 0}
+	trace = []
+	for d in range(min(n + m, max_cost) + 1):
+		trace.append(v.copy())
+		for k in range(-d, d + 1, 2):
+			if k == -d or (k != d and v[k - 1] < v[k + 1]):
+				x = v[k + 1]
+			else:
+				x = v[k - 1] + 1
+			y = x - k
+			while x < n and y < m and a[x] == b[y]:
+				x += 1
+				y += 1
+			v[k] = x
+			if x >= n and y >= m:
+				return _backtrack(trace, n, m)
+	return None
+
+
+def _backtrack(trace: list, x: int, y: int) -> list:
+	path = [(x, y)]
+	for d in range(len(trace) - 1, -1, -1):
+		v = trace[d]
+		k = x - y
+		if k == -d or (k != d and v[k - 1] < v[k + 1]):
+			prev_k = k + 1
+		else:
+			prev_k = k - 1
+		prev_x = v[prev_k]
+		prev_y = prev_x - prev_k
+		# Back along the equal lines to the line changed in this step
+		while x > prev_x and y > prev_y:
+			x -= 1
+			y -= 1
+			path.append((x, y))
+		if d:
+			x, y = prev_x, prev_y
+			path.append((x, y))
+	path.reverse()
+	return path
+
+
+def _opcodes(a: list, b: list) -> list:
+	"""
+	Changes between a and b as difflib opcodes, every run of changed lines as one replace, delete or insert.
+	"""
+	path = _myers(a, b, MAX_COST)
+	if path is None:
+		# Configs that have almost nothing in common, where Myers takes too long
+		return difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes()
+
+	codes = []
+	change = None
+	for (x, y), (next_x, next_y) in zip(path, path[1:]):
+		if next_x - x == 1 and next_y - y == 1:
+			if change:
+				codes.append(_change(*change))
+				change = None
+			if codes and codes[-1][0] == 'equal':
+				codes[-1] = ('equal', codes[-1][1], next_x, codes[-1][3], next_y)
+			else:
+				codes.append(('equal', x, next_x, y, next_y))
+		elif change:
+			change = (change[0], next_x, change[2], next_y)
+		else:
+			change = (x, next_x, y, next_y)
+	if change:
+		codes.append(_change(*change))
+	return codes
+
+
+def _change(i1: int, i2: int, j1: int, j2: int) -> tuple:
+	if i1 == i2:
+		return 'insert', i1, i2, j1, j2
+	if j1 == j2:
+		return 'delete', i1, i2, j1, j2
+	return 'replace', i1, i2, j1, j2
+
+
+def _group(codes: list, context: int):
+	"""
+	Hunks of the opcodes with context lines around the changes, as SequenceMatcher.get_grouped_opcodes makes them.
+	"""
+	if not codes:
+		return
+	codes = list(codes)
+	tag, i1, i2, j1, j2 = codes[0]
+	if tag == 'equal':
+		codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+	tag, i1, i2, j1, j2 = codes[-1]
+	if tag == 'equal':
+		codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+
+	group = []
+	for tag, i1, i2, j1, j2 in codes:
+		if tag == 'equal' and i2 - i1 > context * 2:
+			group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+			yield group
+			group = []
+			i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+		group.append((tag, i1, i2, j1, j2))
+	if group and not (len(group) == 1 and group[0][0] == 'equal'):
+		yield group
+
+
+def diff_hunks(old: Union[bytes, str, list], new: Union[bytes, str, list], ignore_whitespace: bool = False, context: int = 3) -> list:
+	"""
+	Difference between two configs as the hunks of a minimal unified diff. Where several diffs of the same size
+	are possible, the hunks may differ from those of GNU diff. Configs with more than MAX_COST changed lines are
+	compared by difflib, whose diff is not always minimal.
+
+	:param old: Old config, as bytes, text or lines
+	:param new: New config, as bytes, text or lines
+	:param ignore_whitespace: Ignore changes in the amount of white space
+	:param context: Number of unchanged lines around every change
+	:return: List of hunks: {'old_start', 'old_count', 'new_start', 'new_count', 'lines': [[tag, line], ...]},
+		where tag is ' ', '-' or '+', or '\\' for the line telling that the line before has no newline
+	"""
+	old_lines = old if isinstance(old, list) else split_lines(old)
+	new_lines = new if isinstance(new, list) else split_lines(new)
+	if ignore_whitespace:
+		old_keys = [_key(line) for line in old_lines]
+		new_keys = [_key(line) for line in new_lines]
+	else:
+		old_keys = old_lines
+		new_keys = new_lines
+
+	hunks = []
+	for group in _group(_opcodes(old_keys, new_keys), context):
+		first, last = group[0], group[-1]
+		lines = []
+		for tag, i1, i2, j1, j2 in group:
+			if tag == 'equal':
+				_add_lines(lines, ' ', old_lines[i1:i2])
+				continue
+			if tag in ('replace', 'delete'):
+				_add_lines(lines, '-', old_lines[i1:i2])
+			if tag in ('replace', 'insert'):
+				_add_lines(lines, '+', new_lines[j1:j2])
+		hunks.append({
+			'old_start': first[1],
+			'old_count': last[2] - first[1],
+			'new_start': first[3],
+			'new_count': last[4] - first[3],
+			'lines': lines,
+		})
+	return hunks
+
+
+def format_unified(hunks: list, old_label: str = '', new_label: str = '') -> str:
+	"""
+	The hunks as unified diff text, without the trailing newline. No hunks give an empty string, like diff.
+	"""
+	if not hunks:
+		return ''
+	output = [f'--- {old_label}', f'+++ {new_label}']
+	for hunk in hunks:
+		output.append(
+			f"@@ -{_range(hunk['old_start'], hunk['old_count'])} +{_range(hunk['new_start'], hunk['new_count'])} @@"
+		)
+		output.extend(f'{tag}{line}' for tag, line in hunk['lines'])
+	return '\n'.join(output)
+
+
+def stats(hunks: list) -> dict:
+	added = removed = 0
+	for hunk in hunks:
+		for tag, _line in hunk['lines']:
+			if tag == '+':
+				added += 1
+			elif tag == '-':
+				removed += 1
+	return {'added': added, 'removed': removed}
+
+
+def file_label(path: str) -> str:
+	"""
+	File name and modification time, as diff writes them in the header.
+	"""
+	try:
+		mtime = datetime.fromtimestamp(os.path.getmtime(path)).astimezone()
+	except OSError:
+		return path
+	return f"{path}\t{mtime.strftime('%Y-%m-%d %H:%M:%S.%f')}000 {mtime.strftime('%z')}"
@@ -1,12 +1,10 @@
-import json
-
 from flask import render_template, jsonify
 
-import app.modules.db.sql as sql
 import app.modules.db.server as server_sql
 import app.modules.config.config as config_mod
 import app.modules.config.common as config_common
 import app.modules.config.section as section_mod
+import app.modules.config.runtime_client as runtime_client
 import app.modules.server.server as server_mod
 import app.modules.roxywi.common as roxywi_common
 import app.modules.roxy_wi_tools as roxy_wi_tools
@@ -14,74 +12,57 @@ import app.modules.roxy_wi_tools as roxy_wi_tools
 get_config_var = roxy_wi_tools.GetConfigVar()
 
 
+def _execute_on_slave(server_ip: str, command: str) -> str:
+	"""
+	Run the command on a slave. A slave that cannot be reached is reported in the output instead of stopping the action.
+	"""
+	try:
+		return runtime_client.get_client(server_ip).execute(command)
+	except (runtime_client.RuntimeApiError, OSError) as e:
+		roxywi_common.logging(server_ip, f'error: Cannot run "{command}": {e}', keep_history=1, service='haproxy')
+		return f'error: {server_ip}: {e}<br />'
+
+
 def show_frontend_backend(serv: str, backend: str) -> str:
-	haproxy_sock_port = int(sql.get_setting('haproxy_sock_port'))
-	cmd = 'echo "show servers state"|nc %s %s |grep "%s" |awk \'{print $4}\'' % (serv, haproxy_sock_port, backend)
-	output, stderr = server_mod.subprocess_execute(cmd)
+	states = runtime_client.get_client(serv).show_servers_state()
 	lines = ''
-	for i in output:
-		if i == ' ':
-			continue
-		i = i.strip()
-		lines += i + '<br>'
+	for state in states:
+		if state.get('be_name') == backend:
+			lines += state['srv_name'] + '<br>'
 	return lines
 
 
 def show_server(serv: str, backend: str, backend_server: str) -> str:
-	haproxy_sock_port = int(sql.get_setting('haproxy_sock_port'))
-	cmd = 'echo "show servers state"|nc %s %s |grep "%s" |grep "%s" |awk \'{print $5":"$19}\' |head -1' % (
-		serv, haproxy_sock_port, backend, backend_server)
-	output, stderr = server_mod.subprocess_execute(cmd)
-	return output[0]
+	for state in runtime_client.get_client(serv).show_servers_state(backend):
+		if state.get('srv_name') == backend_server:
+			return f"{state['srv_addr']}:{state['srv_port']}"
+	return ''
 
 
 def get_all_stick_table(serv: str):
-	hap_sock_p = sql.get_setting('haproxy_sock_port')
-	cmd = 'echo "show table"|nc %s %s |awk \'{print $3}\' | tr -d \'\n\' | tr -d \'[:space:]\'' % (serv, hap_sock_p)
-	output, stderr = server_mod.subprocess_execute(cmd)
-	return output[0]
+	tables = runtime_client.get_client(serv).show_tables()
+	return ''.join(f"{table['table']}," for table in tables if table.get('table'))
 
 
 def get_stick_table(serv: str, table: str):
-	hap_sock_p = sql.get_setting('haproxy_sock_port')
-	cmd = 'echo "show table %s"|nc %s %s |awk -F"#" \'{print $2}\' |head -1 | tr -d \'\n\'' % (table, serv, hap_sock_p)
-	output, stderr = server_mod.subprocess_execute(cmd)
-	tables_head = []
-	for i in output[0].split(','):
-		i = i.split(':')[1]
-		tables_head.append(i)
+	head, entries = runtime_client.get_client(serv).show_table(table)
+	tables_head = [head.get('table', ''), head.get('type', ''), head.get('size', '0'), head.get('used', '')]
 
-	cmd = 'echo "show table %s"|nc %s %s |grep -v "#"' % (table, serv, hap_sock_p)
-	output, stderr = server_mod.subprocess_execute(cmd)
-
-	return tables_head, output
+	return tables_head, entries
 
 
 def show_backends(server_ip, **kwargs):
-	hap_sock_p = sql.get_setting('haproxy_sock_port')
-	cmd = f'echo "show backend" |nc {server_ip} {hap_sock_p}'
-	output, stderr = server_mod.subprocess_execute(cmd)
-	lines = ''
-	if stderr:
-		roxywi_common.logging('Roxy-WI server', ' ' + stderr, roxywi=1)
-	if kwargs.get('ret'):
-		ret = list()
-	else:
-		ret = ""
-	for line in output:
-		if any(s in line for s in ('#', 'stats', 'MASTER', '<')):
-			continue
-		if len(line) > 1:
-			back = json.dumps(line).split("\"")
-			if kwargs.get('ret'):
-				ret.append(back[1])
-			else:
-				lines += back[1] + "<br>"
+	try:
+		backends = runtime_client.get_client(server_ip).show_backends()
+	except Exception as e:
+		roxywi_common.logging('Roxy-WI server', f' {e}', roxywi=1)
+		backends = []
+	backends = [backend for backend in backends if not any(s in backend for s in ('stats', 'MASTER', '<'))]
 
 	if kwargs.get('ret'):
-		return ret
+		return backends
 
-	return lines
+	return ''.join(f'{backend}<br>' for backend in backends)
 
 
 def get_backends_from_config(server_ip: str, backends='') -> str:
@@ -121,33 +102,26 @@ def change_ip_and_port(serv, backend_backend, backend_server, backend_ip, backen
 		return 'error: The backend port must be integer and not 0'
 
 	lines = ''
-	sock_port = sql.get_setting('haproxy_sock_port')
 	masters = server_sql.is_master(serv)
+	command = f'set server {backend_backend}/{backend_server} addr {backend_ip} port {backend_port} check-port {backend_port}'
 
 	for master in masters:
 		if master[0] is not None:
-			cmd = (f'echo "set server {backend_backend}/{backend_server} addr {backend_ip} port {backend_port} '
-				   f'check-port {backend_port}" |nc {master[0]} {sock_port}')
-			output, stderr = server_mod.subprocess_execute(cmd)
-			lines += output[0]
+			lines += _execute_on_slave(master[0], command)
 			roxywi_common.logging(
 				master[0], f'IP address and port have been changed. On: {backend_backend}/{backend_server} to {backend_ip}:{backend_port}',
 				keep_history=1, service='haproxy'
 			)
 
-	cmd = f'echo "set server {backend_backend}/{backend_server} addr {backend_ip} port {backend_port} ' \
-		  f'check-port {backend_port}" |nc {serv} {sock_port}'
 	roxywi_common.logging(
 		serv,
 		f'IP address and port have been changed. On: {backend_backend}/{backend_server} to {backend_ip}:{backend_port}',
 		keep_history=1, service='haproxy'
 	)
-	output, stderr = server_mod.subprocess_execute(cmd)
-
-	if stderr != '':
-		return 'error: ' + stderr[0]
-
-	lines += output[0]
+	try:
+		lines += runtime_client.get_client(serv).execute(command)
+	except Exception as e:
+		return f'error: {e}'
 	cfg = config_common.generate_config_path('haproxy', serv)
 
 	config_mod.get_config(serv, cfg)
@@ -163,43 +137,37 @@ def change_ip_and_port(serv, backend_backend, backend_server, backend_ip, backen
 def add_server_via_runtime(
 		server_ip: str, backend: str, server: str, backend_ip: str, backend_port: int, check: int, port_check: int
 ) -> tuple:
-	lines = ''
 	stderr = ''
 	check_cmd = ''
-	sock_port = sql.get_setting('haproxy_sock_port')
 
 	if check:
 		check_cmd = 'check'
 
-	commands = [
-		f'echo "add server {backend}/{server} {backend_ip}:{backend_port} {check_cmd}"|nc {server_ip} {sock_port}',
-	]
+	commands = [f'add server {backend}/{server} {backend_ip}:{backend_port} {check_cmd}']
 
 	if check:
-		commands.append(f'echo "enable health {backend}/{server}"|nc {server_ip} {sock_port}')
-		commands.append(f'echo "set server {backend}/{server} check-addr {server_ip} check-port {port_check}"|nc {server_ip} {sock_port}')
+		commands.append(f'enable health {backend}/{server}')
+		commands.append(f'set server {backend}/{server} check-addr {server_ip} check-port {port_check}')
 
-	commands.append(f'echo "set server {backend}/{server} state ready"|nc {server_ip} {sock_port}')
+	commands.append(f'set server {backend}/{server} state ready')
 
-	for cmd in commands:
-		output, stderr = server_mod.subprocess_execute(cmd)
-		lines += output[0]
+	try:
+		lines = ''.join(runtime_client.get_client(server_ip).execute_many(commands))
+	except Exception as e:
+		lines = ''
+		stderr = str(e)
 	return lines, stderr
 
 
 def delete_server_via_runtime(server_ip: str, backend: str, server: str) -> tuple:
-	lines = ''
 	stderr = ''
-	sock_port = sql.get_setting('haproxy_sock_port')
+	commands = [f'set server {backend}/{server} state maint', f'del server {backend}/{server}']
 
-	commands = [
-		f'echo "set server {backend}/{server} state maint"|nc {server_ip} {sock_port}',
-		f'echo "del server {backend}/{server} "|nc {server_ip} {sock_port}',
-	]
-
-	for cmd in commands:
-		output, stderr = server_mod.subprocess_execute(cmd)
-		lines += output[0]
+	try:
+		lines = ''.join(runtime_client.get_client(server_ip).execute_many(commands))
+	except Exception as e:
+		lines = ''
+		stderr = str(e)
 	return lines, stderr
 
 
@@ -242,17 +210,17 @@ def add_server(
 		config_mod.get_config(server_ip, cfg)
 	except Exception as e:
 		raise Exception(f'error: Cannot config section: {e}')
-	section_name_cmd = f'grep {backend} {cfg}'
-	section_name = server_mod.subprocess_execute(section_name_cmd)
 
 	try:
-		start_line, end_line, return_config = section_mod.get_section_from_config(cfg, section_name[0][0])
+		parsed = section_mod.load_config(cfg)
+		section = parsed.find_proxy(backend)
+		if section is None:
+			raise Exception(f'there is no backend {backend}')
+		new_config = parsed.add_to_section(section, f'    server {backend_ip} {backend_ip}:{backend_port} {check_cfg}')
+		with open(cfg, 'w') as f:
+			f.write(new_config)
 	except Exception as e:
 		raise Exception(f'error: Cannot get config section: {e}')
-	new_end_line = int(end_line) + 1
-	new_server_cfg = f'\    \server {backend_ip} {backend_ip}:{backend_port} {check_cfg}'
-	cmd = f"sed -i '{new_end_line} i {new_server_cfg}' {cfg}"
-	server_mod.subprocess_execute(cmd)
 	try:
 		config_mod.master_slave_upload_and_restart(server_ip, cfg, 'save', 'haproxy')
 	except Exception as e:
@@ -283,7 +251,7 @@ def delete_server(server_ip: str, backend: str, server: str) -> str:
 	)
 
 	if stderr != '':
-		return 'error: ' + stderr[0]
+		return f'error: {stderr}'
 
 	if 'No such server' in lines:
 		return f'error: {lines}'
@@ -302,22 +270,22 @@ def change_maxconn_global(serv: str, maxconn: int) -> str:
 	if maxconn is None:
 		return 'error: Maxconn must be integer and not 0'
 
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
+	command = f'set maxconn global {maxconn}'
 	masters = server_sql.is_master(serv)
+	slave_output = ''
 
 	for master in masters:
 		if master[0] is not None:
-			cmd = f'echo "set maxconn global {maxconn}" |nc {master[0]} {haproxy_sock_port}'
-			server_mod.subprocess_execute(cmd)
+			slave_output += _execute_on_slave(master[0], command)
 		roxywi_common.logging(master[0], f'Maxconn has been changed. Globally to {maxconn}', keep_history=1, service='haproxy')
 
-	cmd = f'echo "set maxconn global {maxconn}" |nc {serv} {haproxy_sock_port}'
 	roxywi_common.logging(serv, f'Maxconn has been changed. Globally to {maxconn}', keep_history=1, service='haproxy')
-	output, stderr = server_mod.subprocess_execute(cmd)
+	try:
+		output = runtime_client.get_client(serv).execute(command)
+	except Exception as e:
+		return f'{slave_output}{e}'
 
-	if stderr != '':
-		return stderr[0]
-	elif output[0] == '':
+	if output == '':
 		cfg = config_common.generate_config_path('haproxy', serv)
 
 		config_mod.get_config(serv, cfg)
@@ -325,31 +293,31 @@ def change_maxconn_global(serv: str, maxconn: int) -> str:
 			  '&& sed -Ei "$( echo $string)s/[0-9]+/%s/g" %s' % (cfg, maxconn, cfg)
 		server_mod.subprocess_execute(cmd)
 		config_mod.master_slave_upload_and_restart(serv, cfg, 'save', 'haproxy')
-		return f'success: Maxconn globally has been set to {maxconn} '
+		return f'{slave_output}success: Maxconn globally has been set to {maxconn} '
 	else:
-		return f'error: {output[0]}'
+		return f'{slave_output}error: {output}'
 
 
 def change_maxconn_frontend(serv, maxconn, frontend) -> str:
 	if maxconn is None:
 		return 'error: Maxconn must be integer and not 0'
 
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
+	command = f'set maxconn frontend {frontend} {maxconn}'
 	masters = server_sql.is_master(serv)
+	slave_output = ''
 
 	for master in masters:
 		if master[0] is not None:
-			cmd = f'echo "set maxconn frontend {frontend} {maxconn}" |nc {master[0]} {haproxy_sock_port}'
-			server_mod.subprocess_execute(cmd)
+			slave_output += _execute_on_slave(master[0], command)
 		roxywi_common.logging(master[0], f'Maxconn has been changed. On: {frontend} to {maxconn}', keep_history=1, service='haproxy')
 
-	cmd = f'echo "set maxconn frontend {frontend} {maxconn}" |nc {serv} {haproxy_sock_port}'
 	roxywi_common.logging(serv, f'Maxconn has been changed. On: {frontend} to {maxconn}', keep_history=1, service='haproxy')
-	output, stderr = server_mod.subprocess_execute(cmd)
+	try:
+		output = runtime_client.get_client(serv).execute(command)
+	except Exception as e:
+		return f'{slave_output}{e}'
 
-	if stderr != '':
-		return stderr[0]
-	elif output[0] == '':
+	if output == '':
 		cfg = config_common.generate_config_path('haproxy', serv)
 
 		config_mod.get_config(serv, cfg)
@@ -357,31 +325,31 @@ def change_maxconn_frontend(serv, maxconn, frontend) -> str:
 			  '&& sed -Ei "$( echo $string)s/[0-9]+/%s/g" %s' % (frontend, cfg, maxconn, cfg)
 		server_mod.subprocess_execute(cmd)
 		config_mod.master_slave_upload_and_restart(serv, cfg, 'save', 'haproxy')
-		return f'success: Maxconn for {frontend} has been set to {maxconn} '
+		return f'{slave_output}success: Maxconn for {frontend} has been set to {maxconn} '
 	else:
-		return f'error: {output[0]}'
+		return f'{slave_output}error: {output}'
 
 
 def change_maxconn_backend(serv, backend, backend_server, maxconn) -> str:
 	if maxconn is None:
 		return 'error: Maxconn must be integer and not 0'
 
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
+	command = f'set maxconn server {backend}/{backend_server} {maxconn}'
 
 	masters = server_sql.is_master(serv)
+	slave_output = ''
 	for master in masters:
 		if master[0] is not None:
-			cmd = f'echo "set maxconn server {backend}/{backend_server} {maxconn}" |nc {master[0]} {haproxy_sock_port}'
-			server_mod.subprocess_execute(cmd)
+			slave_output += _execute_on_slave(master[0], command)
 		roxywi_common.logging(master[0], f'Maxconn has been changed. On: {backend}/{backend_server} to {maxconn}', keep_history=1, service='haproxy')
 
-	cmd = f'echo "set maxconn server {backend}/{backend_server} {maxconn}" |nc {serv} {haproxy_sock_port}'
 	roxywi_common.logging(serv, f'Maxconn has been changed. On: {backend} to {maxconn}', keep_history=1, service='haproxy')
-	output, stderr = server_mod.subprocess_execute(cmd)
+	try:
+		output = runtime_client.get_client(serv).execute(command)
+	except Exception as e:
+		return f'{slave_output}{e}'
 
-	if stderr != '':
-		return stderr[0]
-	elif output[0] == '':
+	if output == '':
 		cfg = config_common.generate_config_path('haproxy', serv)
 
 		config_mod.get_config(serv, cfg)
@@ -389,9 +357,9 @@ def change_maxconn_backend(serv, backend, backend_server, maxconn) -> str:
 			  '&& sed -Ei "$( echo $string)s/maxconn [0-9]+/maxconn %s/g" %s' % (backend, cfg, backend_server, maxconn, cfg)
 		server_mod.subprocess_execute(cmd)
 		config_mod.master_slave_upload_and_restart(serv, cfg, 'save', 'haproxy')
-		return f'success: Maxconn for {backend}/{backend_server} has been set to {maxconn} '
+		return f'{slave_output}success: Maxconn for {backend}/{backend_server} has been set to {maxconn} '
 	else:
-		return f'error: {output[0]}'
+		return f'{slave_output}error: {output}'
 
 
 def table_select(serv: str, table: str):
@@ -415,45 +383,36 @@ def table_select(serv: str, table: str):
 
 
 def delete_ip_from_stick_table(serv, ip, table) -> str:
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
-
-	cmd = f'echo "clear table {table} key {ip}" |nc {serv} {haproxy_sock_port}'
-	output, stderr = server_mod.subprocess_execute(cmd)
-	if stderr != '':
-		return f'error: {stderr[0]}'
+	try:
+		runtime_client.get_client(serv).execute(f'clear table {table} key {ip}')
+	except Exception as e:
+		return f'error: {e}'
 	return 'ok'
 
 
 def clear_stick_table(serv, table) -> str:
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
-
-	cmd = f'echo "clear table {table} " |nc {serv} {haproxy_sock_port}'
-	output, stderr = server_mod.subprocess_execute(cmd)
-	if stderr != '':
-		return f'error: {stderr[0]}'
+	try:
+		runtime_client.get_client(serv).execute(f'clear table {table}')
+	except Exception as e:
+		return f'error: {e}'
 	return 'ok'
 
 
 def list_of_lists(serv) -> dict:
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
-	cmd = f'echo "show acl"|nc {serv} {haproxy_sock_port} |grep "loaded from" |awk \'{{print $1,$2}}\''
-	output, stderr = server_mod.subprocess_execute(cmd)
 	acl_lists = []
-	for i in output:
-		acl_lists.append(i)
+	for acl in runtime_client.get_client(serv).show_acl():
+		if 'loaded from' in acl['description']:
+			acl_lists.append(f"{acl['id']} {acl['description'].split(' ')[0]}")
 	return jsonify(acl_lists)
 
 
 def show_lists(serv, list_id, color, list_name) -> str:
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
-	cmd = f'echo "show acl #{list_id}"|nc {serv} {haproxy_sock_port}'
-	output, stderr = server_mod.subprocess_execute(cmd)
+	output = runtime_client.get_client(serv).execute_lines(f'show acl #{list_id}')
 
 	return render_template('ajax/list.html', list=output, list_id=list_id, color=color, list_name=list_name)
 
 
 def delete_ip_from_list(serv, ip_id, ip, list_id, list_name) -> str:
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
 	lib_path = get_config_var.get_config_var('main', 'lib_path')
 	user_group = roxywi_common.get_user_group(id=1)
 	cmd = f"sed -i 's!{ip}$!!' {lib_path}/lists/{user_group}/{list_name}"
@@ -469,30 +428,29 @@ def delete_ip_from_list(serv, ip_id, ip, list_id, list_name) -> str:
 	if stderr1:
 		return f'error: {stderr}'
 
-	cmd = f'echo "del acl #{list_id} #{ip_id}" |nc {serv} {haproxy_sock_port}'
-	output, stderr = server_mod.subprocess_execute(cmd)
+	try:
+		output = runtime_client.get_client(serv).execute(f'del acl #{list_id} #{ip_id}')
+	except Exception as e:
+		return f'error: {e}'
 
 	roxywi_common.logging(serv, f'{ip_id} has been delete from list {list_id}', keep_history=1, service='haproxy')
-	if output[0] != '':
-		return f'error: {output[0]}'
-	if stderr != '':
-		return f'error: {stderr[0]}'
+	if output != '':
+		return f'error: {output}'
 
 	return 'ok'
 
 
 def add_ip_to_list(serv, ip, list_id, list_name) -> str:
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
 	lib_path = get_config_var.get_config_var('main', 'lib_path')
 	user_group = roxywi_common.get_user_group(id=1)
-	cmd = f'echo "add acl #{list_id} {ip}" |nc {serv} {haproxy_sock_port}'
-	output, stderr = server_mod.subprocess_execute(cmd)
-	if output[0]:
-		return f'error: {output[0]}'
-	if stderr:
-		return f'error: {stderr[0]}'
+	try:
+		output = runtime_client.get_client(serv).execute(f'add acl #{list_id} {ip}')
+	except Exception as e:
+		return f'error: {e}'
+	if output:
+		return f'error: {output}'
 
-	if 'is not a valid IPv4 or IPv6 address' not in output[0]:
+	if 'is not a valid IPv4 or IPv6 address' not in output:
 		cmd = f'echo "{ip}" >> {lib_path}/lists/{user_group}/{list_name}'
 		output, stderr = server_mod.subprocess_execute(cmd)
 		roxywi_common.logging(serv, f'{ip} has been added to list {list_id}', keep_history=1, service='haproxy')
@@ -505,40 +463,26 @@ def add_ip_to_list(serv, ip, list_id, list_name) -> str:
 
 def select_session(server_ip: str) -> str:
 	lang = roxywi_common.get_user_lang_for_flask()
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
-	cmd = f'echo "show sess" |nc {server_ip} {haproxy_sock_port}'
-	output, stderr = server_mod.subprocess_execute(cmd)
+	output = runtime_client.get_client(server_ip).execute_lines('show sess')
 
 	return render_template('ajax/sessions_table.html', sessions=output, lang=lang)
 
 
 def show_session(server_ip, sess_id) -> str:
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
-	cmd = f'echo "show sess {sess_id}" |nc {server_ip} {haproxy_sock_port}'
-	output, stderr = server_mod.subprocess_execute(cmd)
-	lines = ''
+	try:
+		output = runtime_client.get_client(server_ip).execute(f'show sess {sess_id}')
+	except Exception as e:
+		return f'error: {e}'
 
-	if stderr:
-		return 'error: ' + stderr[0]
-	else:
-		for o in output:
-			lines += f'{o}<br />'
-		return lines
+	return ''.join(f'{o}<br />' for o in output.splitlines())
 
 
 def delete_session(server_ip, sess_id) -> str:
-	haproxy_sock_port = sql.get_setting('haproxy_sock_port')
-	cmd = f'echo "shutdown session {sess_id}" |nc {server_ip} {haproxy_sock_port}'
-	output, stderr = server_mod.subprocess_execute(cmd)
-	try:
-		if output[0] != '':
-			return 'error: ' + output[0]
-	except Exception:
-		pass
 	try:
-		if stderr[0] != '':
-			return 'error: ' + stderr[0]
-	except Exception:
-		pass
+		output = runtime_client.get_client(server_ip).execute(f'shutdown session {sess_id}')
+	except Exception as e:
+		return f'error: {e}'
+	if output != '':
+		return f'error: {output}'
 
 	return 'ok'
@@ -0,0 +1,220 @@
+import csv
+import select
+import socket
+import threading
+
+import app.modules.db.sql as sql
+
+PROMPT = b'\n> '
+
+
+class RuntimeApiError(Exception):
+	pass
+
+
+class RuntimeClient:
+	"""
+	Client for the HAProxy stats socket exposed over TCP (stats socket ipv4@*:<haproxy_sock_port>).
+
+	The connection is switched to interactive ("prompt") mode, so it stays open between commands and several
+	commands can be written at once and their answers read back in order.
+	"""
+
+	def __init__(self, host: str, port: int, timeout: float = 5):
+		self.host = host
+		self.port = int(port)
+		self.timeout = timeout
+		self._sock = None
+		self._buffer = b''
+		self._lock = threading.Lock()
+
+	def _connect(self) -> None:
+		try:
+			self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+		except OSError as e:
+			self._sock = None
+			raise RuntimeApiError(f'Cannot connect to HAProxy runtime API on {self.host}:{self.port}: {e}')
+		self._buffer = b''
+		self._sock.sendall(b'prompt\n')
+		self._read_response()
+
+	def close(self) -> None:
+		if self._sock is not None:
+			try:
+				self._sock.close()
+			except OSError:
+				pass
+		self._sock = None
+		self._buffer = b''
+
+	def _read_response(self) -> str:
+		while True:
+			if self._buffer.startswith(b'> '):
+				self._buffer = self._buffer[2:]
+				return ''
+			end = self._buffer.find(PROMPT)
+			if end != -1:
+				response = self._buffer[:end]
+				self._buffer = self._buffer[end + len(PROMPT):]
+				response = response.decode('utf-8', errors='backslashreplace')
+				return response[:-1] if response.endswith('\n') else response
+			chunk = self._sock.recv(65536)
+			if not chunk:
+				raise ConnectionResetError('connection closed by HAProxy')
+			self._buffer += chunk
+
+	def execute_many(self, commands: list) -> list:
+		"""
+		Send all commands in one write and return their outputs in the same order.
+		"""
+		for command in commands:
+			if '\n' in command or ';' in command:
+				raise RuntimeApiError(f'Wrong runtime API command: {command}')
+		payload = ''.join(f'{command}\n' for command in commands).encode()
+
+		with self._lock:
+			# HAProxy closes idle CLI connections after "stats timeout", such a connection is opened again
+			if self._sock is not None and not self._is_open():
+				self.close()
+			reused = self._sock is not None
+			sent = False
+			try:
+				if self._sock is None:
+					self._connect()
+				try:
+					self._sock.sendall(payload)
+				except OSError:
+					if not reused:
+						raise
+					# The connection was closed before the commands got to HAProxy, send them once more on a new one
+					self.close()
+					self._connect()
+					self._sock.sendall(payload)
+				sent = True
+				return [self._read_response() for _ in commands]
+			except RuntimeApiError:
+				self.close()
+				raise
+			except OSError as e:
+				# Once the commands are sent they may have run, so they are not sent again
+				self.close()
+				if sent:
+					raise RuntimeApiError(f'HAProxy runtime API on {self.host}:{self.port} failed after the commands were sent: {e}')
+				raise RuntimeApiError(f'HAProxy runtime API on {self.host}:{self.port} failed: {e}')
+
+	def _is_open(self) -> bool:
+		"""
+		Whether the open connection is still usable: HAProxy has not closed it and there is no unread data on it.
+		"""
+		# select does not wait for the timeout of the socket, a recv on it would
+		try:
+			readable, _, _ = select.select([self._sock], [], [], 0)
+		except (OSError, ValueError):
+			return False
+		# Nothing to read means HAProxy has not closed it. Otherwise either the connection is closed
+		# or there is a late answer that would be read as the next one
+		return not readable
+
+	def execute(self, command: str) -> str:
+		return self.execute_many([command])[0]
+
+	def execute_lines(self, command: str) -> list:
+		return [line for line in self.execute(command).splitlines() if line.strip()]
+
+	def show_info(self) -> dict:
+		info = {}
+		for line in self.execute_lines('show info'):
+			key, _, value = line.partition(':')
+			info[key.strip()] = value.strip()
+		return info
+
+	def show_stat(self) -> list:
+		"""
+		Parsed "show stat" CSV, one dict per proxy/server.
+		"""
+		lines = self.execute_lines('show stat')
+		if not lines or not lines[0].startswith('#'):
+			return []
+		lines[0] = lines[0].lstrip('# ')
+		return [{k: v for k, v in row.items() if k} for row in csv.DictReader(lines)]
+
+	def show_servers_state(self, backend: str = None) -> list:
+		command = 'show servers state'
+		if backend:
+			command += f' {backend}'
+		lines = self.execute_lines(command)
+		header = []
+		states = []
+		for line in lines:
+			if line.startswith('#'):
+				header = line.lstrip('# ').split()
+			elif header:
+				states.append(dict(zip(header, line.split())))
+		return states
+
+	def show_backends(self) -> list:
+		return [line for line in self.execute_lines('show backend') if not line.startswith('#')]
+
+	def show_tables(self) -> list:
+		"""
+		List of stick tables as dicts with table, type, size and used keys.
+		"""
+		tables = []
+		for line in self.execute_lines('show table'):
+			tables.append(_parse_table_head(line))
+		return tables
+
+	def show_table(self, table: str) -> tuple:
+		"""
+		Return the head of the stick table and its entries as raw lines.
+		"""
+		lines = self.execute_lines(f'show table {table}')
+		head = {}
+		entries = []
+		for line in lines:
+			if line.startswith('#'):
+				head = _parse_table_head(line)
+			else:
+				entries.append(line)
+		return head, entries
+
+	def show_acl(self) -> list:
+		"""
+		List of ACLs as dicts with id and description keys.
+		"""
+		acls = []
+		for line in self.execute_lines('show acl'):
+			if line.startswith('#'):
+				continue
+			acl_id, _, description = line.partition(' ')
+			acls.append({'id': acl_id, 'description': description})
+		return acls
+
+
+def _parse_table_head(line: str) -> dict:
+	head = {}
+	for part in line.lstrip('# ').split(','):
+		key, _, value = part.partition(':')
+		head[key.strip()] = value.strip()
+	return head
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(host: str, port: int = None) -> RuntimeClient:
+	"""
+	Return a shared client for the HAProxy runtime API on host:port. The connection is reused between calls.
+	:param host: IP of the HAProxy server
+	:param port: Port of the stats socket, haproxy_sock_port setting by default
+	"""
+	if port is None:
+		port = sql.get_setting('haproxy_sock_port')
+	key = (host, int(port))
+	with _clients_lock:
+		client = _clients.get(key)
+		if client is None:
+			client = RuntimeClient(host, port)
+			_clients[key] = client
+		return client
@@ -1,14 +1,18 @@
 import re
+import hashlib
 
 import app.modules.db.sql as sql
 import app.modules.server.server as server_mod
 from app.modules.common.common import return_nice_path
+from app.modules.common.cache_utils import TTLCache
 
 
 SECTION_NAMES = (
 	'global', 'listen', 'frontend', 'backend', 'cache', 'defaults', '#HideBlockStart',
 	'#HideBlockEnd', 'peers', 'resolvers', 'userlist', 'http-errors', 'log-forward'
 )
+_IP_RE = re.compile(r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
+_parsed_configs = TTLCache(ttl=600, maxsize=64)
 
 
 def _extract_section_name(line: str):
@@ -25,6 +29,160 @@ def _extract_section_name(line: str):
 	return None
 
 
+class Section:
+	"""
+	A section of the config: its header line and all lines up to the next header.
+	start and end are the indexes of its first and last line in the config.
+	"""
+
+	def __init__(self, name: str, start: int, lines: list):
+		self.name = name
+		self.type = name.split()[0]
+		self.start = start
+		self.lines = lines
+
+	@property
+	def end(self) -> int:
+		return self.start + len(self.lines) - 1
+
+	@property
+	def header(self) -> str:
+		return self.lines[0]
+
+	@property
+	def text(self) -> str:
+		return ''.join(self.lines)
+
+	def directives(self) -> list:
+		"""
+		Directives of the section as (line index, keyword, arguments), without comments and empty lines.
+		"""
+		directives = []
+		for index, line in enumerate(self.lines[1:], self.start + 1):
+			words = line.split()
+			if words and not words[0].startswith('#'):
+				directives.append((index, words[0], words[1:]))
+		return directives
+
+	def comments(self) -> list:
+		return [(index, line.strip()) for index, line in enumerate(self.lines[1:], self.start + 1) if line.strip().startswith('#')]
+
+
+class ParsedConfig:
+	"""
+	HAProxy config split into the lines before the first section and the sections with their line spans.
+	Joining the lines gives back the same text.
+	"""
+
+	def __init__(self, text: str):
+		# Split on \n only, like reading the file line by line does
+		self.lines = [line + '\n' for line in text.split('\n')]
+		self.lines[-1] = self.lines[-1][:-1]
+		if not self.lines[-1]:
+			self.lines.pop()
+		self.sections = []
+		self.preamble = []
+		for index, line in enumerate(self.lines):
+			name = _extract_section_name(line)
+			if name:
+				self.sections.append(Section(name, index, [line]))
+			elif self.sections:
+				self.sections[-1].lines.append(line)
+			else:
+				self.preamble.append(line)
+
+	@property
+	def text(self) -> str:
+		return ''.join(self.lines)
+
+	def get_section(self, name: str):
+		"""
+		Return the section whose header line is exactly name, or None.
+		"""
+		for section in self.sections:
+			if section.header == name + '\n':
+				return section
+		return None
+
+	def find_proxy(self, proxy: str):
+		"""
+		Return the backend or listen section of the proxy, or None.
+		"""
+		for section in self.sections:
+			words = section.name.split()
+			if words[0] in ('backend', 'listen') and len(words) > 1 and words[1] == proxy:
+				return section
+		return None
+
+	def section_span(self, section: Section) -> tuple:
+		"""
+		Start and end line of the section as the section editor uses them: the end line of the last section is
+		the number of lines in the config.
+		"""
+		if section is self.sections[-1]:
+			return section.start, len(self.lines)
+		return section.start, section.end
+
+	def replace_lines(self, start_line: int, end_line: int, new_text: str) -> str:
+		"""
+		Return the config with the lines from start_line to end_line replaced with new_text.
+		"""
+		return ''.join(self.lines[:start_line]) + new_text + '\n' + ''.join(self.lines[end_line + 1:])
+
+	def add_to_section(self, section: Section, line: str) -> str:
+		"""
+		Return the config with the line added after the last not empty line of the section.
+		"""
+		index = section.start
+		for i, section_line in enumerate(section.lines):
+			if section_line.strip():
+				index = section.start + i
+		before = ''.join(self.lines[:index + 1])
+		if not before.endswith('\n'):
+			before += '\n'
+		return before + line + '\n' + ''.join(self.lines[index + 1:])
+
+	def find(self, words: str, context: int = 2) -> list:
+		"""
+		Lines containing words with context lines around them, formatted like "grep -n -C".
+		"""
+		matches = [i for i, line in enumerate(self.lines) if words in line]
+		output = []
+		last = -1
+		for match in matches:
+			first = max(match - context, last + 1)
+			if output and first > last + 1:
+				output.append('--')
+			for i in range(first, min(match + context, len(self.lines) - 1) + 1):
+				if i <= last:
+					continue
+				separator = ':' if words in self.lines[i] else '-'
+				output.append(f'{i + 1}{separator}{self.lines[i].rstrip()}')
+				last = i
+		return output
+
+
+def parse_config(text: str) -> ParsedConfig:
+	"""
+	Parse the config, parsed configs are cached by the hash of their text.
+	"""
+	key = hashlib.sha256(text.encode('utf-8', errors='surrogateescape')).hexdigest()
+	parsed = _parsed_configs.get(key)
+	if parsed is None:
+		parsed = ParsedConfig(text)
+		_parsed_configs.set(key, parsed)
+	return parsed
+
+
+def load_config(config: str) -> ParsedConfig:
+	"""
+	:param config: The path to the configuration file.
+	:return: The parsed configuration.
+	"""
+	with open(config, 'r') as f:
+		return parse_config(f.read())
+
+
 def get_sections(config: str, **kwargs) -> list:
 	"""
 	This method, `get_sections`, is used to extract sections from a configuration file. It takes two parameters: `config`, which is the path to the configuration file, and `kwargs`, which
@@ -38,20 +196,16 @@ def get_sections(config: str, **kwargs) -> list:
 	.. note:: The `service` option in `kwargs` can be used to specify a particular service to extract sections for. If the `service` option is not provided or is not equal to `'keepalived
 	*'`, this method will extract all sections. Otherwise, it will only extract sections that contain an IP address.
 	"""
-	return_config = list()
-	with open(config, 'r') as f:
-		for line in f:
-			if kwargs.get('service') == 'keepalived':
-				ip_pattern = re.compile('\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}')
-				find_ip = re.findall(ip_pattern, line)
+	if kwargs.get('service') == 'keepalived':
+		return_config = list()
+		with open(config, 'r') as f:
+			for line in f:
+				find_ip = _IP_RE.search(line)
 				if find_ip:
-					return_config.append(find_ip[0])
-			else:
-				if _extract_section_name(line):
-					line = line.strip()
-					return_config.append(line)
+					return_config.append(find_ip.group(0))
+		return return_config
 
-	return return_config
+	return [section.name for section in load_config(config).sections]
 
 
 def get_section_from_config(config: str, section) -> tuple:
@@ -60,31 +214,12 @@ def get_section_from_config(config: str, section) -> tuple:
 	:param section: The section name to retrieve from the configuration file.
 	:return: A tuple containing the starting line number, ending line number, and the content of the specified section.
 	"""
-	record = False
-	start_line = ""
-	end_line = ""
-	return_config = ""
-	with open(config, 'r') as f:
-		for index, line in enumerate(f):
-			if line.startswith(section + '\n'):
-				start_line = index
-				return_config += line
-				record = True
-				continue
-			if record:
-				if _extract_section_name(line):
-					record = False
-					end_line = index
-					end_line = end_line - 1
-				else:
-					return_config += line
-
-	if end_line == "":
-		f = open(config, "r")
-		line_list = f.readlines()
-		end_line = len(line_list)
-
-	return start_line, end_line, return_config
+	parsed = load_config(config)
+	found = parsed.get_section(section)
+	if found is None:
+		return "", len(parsed.lines), ""
+	start_line, end_line = parsed.section_span(found)
+	return start_line, end_line, found.text
 
 
 def rewrite_section(start_line: str, end_line: str, config: str, section: str) -> str:
@@ -95,27 +230,7 @@ def rewrite_section(start_line: str, end_line: str, config: str, section: str) -
 	:param section: The new section to be inserted in place of the existing section.
 	:return: The modified configuration with the section rewritten.
 	"""
-	record = False
-	start_line = int(start_line)
-	end_line = int(end_line)
-	return_config = ""
-	with open(config, 'r') as f:
-		for index, line in enumerate(f):
-			index = int(index)
-			if index == start_line:
-				record = True
-				return_config += section
-				return_config += "\n"
-				continue
-			if index == end_line:
-				record = False
-				continue
-			if record:
-				continue
-
-			return_config += line
-
-	return return_config
+	return load_config(config).replace_lines(int(start_line), int(end_line), section)
 
 
 def get_remote_sections(server_ip: str, service: str) -> str:
@@ -0,0 +1,213 @@
+import os
+import re
+import threading
+
+import yaml
+import jinja2
+
+import app.modules.db.sql as sql
+
+ROLES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'scripts', 'ansible', 'roles')
+HAPROXY_TEMPLATES = {
+	'listen': 'section.j2',
+	'frontend': 'section.j2',
+	'backend': 'section.j2',
+	'userlist': 'userlist.j2',
+	'peers': 'peers.j2',
+	'global': 'global.j2',
+	'defaults': 'defaults.j2',
+}
+NGINX_TEMPLATES = {
+	'proxy_pass': 'proxy_pass.j2',
+	'upstream': 'upstream.j2',
+}
+# Floats as the YAML loader of Ansible resolves them, everything else it reads as a string
+_YAML_FLOAT = re.compile(r'^[-+]?(?:[0-9][0-9_]*)\.[0-9_]*(?:[eE][-+][0-9]+)?$')
+
+
+class SectionRenderer:
+	"""
+	Renders the templates of the haproxy_section and nginx_section Ansible roles in-process, with the same Jinja
+	settings, role variables and trailing newlines as the template lookup of Ansible, so the output is the same as
+	the one of the role. Templates and role variables are loaded once.
+	"""
+
+	def __init__(self, role: str):
+		role_path = os.path.join(ROLES_PATH, role)
+		self.env = jinja2.Environment(
+			loader=jinja2.FileSystemLoader(os.path.join(role_path, 'templates')),
+			trim_blocks=True,
+			undefined=jinja2.StrictUndefined,
+			finalize=_finalize,
+			auto_reload=False,
+		)
+		try:
+			with open(os.path.join(role_path, 'vars', 'main.yml'), 'r') as f:
+				self.role_vars = yaml.safe_load(f) or {}
+		except FileNotFoundError:
+			self.role_vars = {}
+		self._newlines = {}
+		self._lock = threading.Lock()
+
+	def _template(self, name: str) -> tuple:
+		with self._lock:
+			if name not in self._newlines:
+				source = self.env.loader.get_source(self.env, name)[0]
+				self._newlines[name] = len(source) - len(source.rstrip('\n'))
+			return self.env.get_template(name), self._newlines[name]
+
+	def render(self, name: str, variables: dict) -> str:
+		template, newlines = self._template(name)
+		# Role variables take precedence over host variables in Ansible
+		output = template.render({**variables, **self.role_vars})
+		# Jinja drops the last newline of the template, Ansible puts the newlines of the template end back
+		out_newlines = len(output) - len(output.rstrip('\n'))
+		if newlines > out_newlines:
+			output += '\n' * (newlines - out_newlines)
+		return output
+
+
+_renderers = {}
+_renderers_lock = threading.Lock()
+
+
+def get_renderer(role: str) -> SectionRenderer:
+	with _renderers_lock:
+		if role not in _renderers:
+			_renderers[role] = SectionRenderer(role)
+		return _renderers[role]
+
+
+def _finalize(value):
+	return '' if value is None else value
+
+
+def inventory_value(value):
+	"""
+	Return the value as the role got it from the inventory file, which was written with str() and read as YAML:
+	None becomes the string 'None' and strings keep the escape sequences of their repr().
+	"""
+	if isinstance(value, dict):
+		return {inventory_value(k): inventory_value(v) for k, v in value.items()}
+	if isinstance(value, (list, tuple)):
+		return [inventory_value(v) for v in value]
+	if value is None:
+		return 'None'
+	if isinstance(value, bool) or isinstance(value, int):
+		return value
+	if isinstance(value, float):
+		return value if _YAML_FLOAT.match(repr(value)) else repr(value)
+	if isinstance(value, str):
+		quoted = repr(value)
+		return quoted[1:-1] if quoted.startswith("'") else value
+	return value
+
+
+def _section_vars(config: dict, service: str) -> dict:
+	return {
+		'config': inventory_value(config),
+		'cert_path': inventory_value(sql.get_setting('cert_path')),
+		'service_dir': inventory_value(sql.get_setting(f'{service}_dir')),
+	}
+
+
+def _marker(config: dict) -> str:
+	if config['type'] in ('global', 'defaults'):
+		return f"# {{mark}} Roxy-WI MANAGED {config['type']} do not edit it directly"
+	return f"# {{mark}} Roxy-WI MANAGED {config['type']} {config['name']} do not edit it directly"
+
+
+def replace_block(content: bytes, marker: str, block: str) -> bytes:
+	"""
+	Insert, replace or (with an empty block) delete the block between the BEGIN and END markers,
+	the way the blockinfile module of Ansible does it. A new block goes to the end of the file.
+	"""
+	lines = content.splitlines(True)
+	marker_begin = marker.replace('{mark}', 'BEGIN').encode('utf-8') + b'\n'
+	marker_end = marker.replace('{mark}', 'END').encode('utf-8') + b'\n'
+	if block:
+		block = block.encode('utf-8')
+		if not block.endswith(b'\n'):
+			block += b'\n'
+		block_lines = [marker_begin] + block.splitlines(True) + [marker_end]
+	else:
+		block_lines = []
+
+	start = end = None
+	for i, line in enumerate(lines):
+		if line == marker_begin:
+			start = i
+		if line == marker_end:
+			end = i
+
+	if start is None or end is None:
+		start = len(lines)
+	elif start < end:
+		del lines[start:end + 1]
+	else:
+		del lines[end:start + 1]
+		start = end
+
+	if start > 0 and not lines[start - 1].endswith(b'\n'):
+		lines[start - 1] += b'\n'
+	lines[start:start] = block_lines
+	return b''.join(lines)
+
+
+def render_haproxy_section(config: dict, content: bytes = b'', action: str = 'create') -> bytes:
+	"""
+	Return the HAProxy config with the section of the config dict created, replaced or deleted.
+
+	:param config: Section as dumped from the request model, only type and name are needed for delete
+	:param content: Current config
+	:param action: create or delete
+	"""
+	values = inventory_value(config)
+	if action == 'delete':
+		if not values.get('name'):
+			return content
+		return replace_block(content, _marker(values), '')
+
+	template = HAPROXY_TEMPLATES.get(values['type'])
+	if template is None:
+		return content
+	try:
+		block = get_renderer('haproxy_section').render(template, _section_vars(config, 'haproxy'))
+	except jinja2.TemplateError as e:
+		raise Exception(f"error: Cannot render HAProxy {values['type']} section: {e}")
+	return replace_block(content, _marker(values), block)
+
+
+def edit_haproxy_config(cfg: str, config: dict, action: str = 'create') -> None:
+	"""
+	Create, replace or delete the section in the HAProxy config file cfg.
+	"""
+	try:
+		with open(cfg, 'rb') as f:
+			content = f.read()
+	except FileNotFoundError:
+		if action == 'delete':
+			return
+		content = b''
+	new_content = render_haproxy_section(config, content, action)
+	if new_content != content:
+		with open(cfg, 'wb') as f:
+			f.write(new_content)
+
+
+def render_nginx_section(config: dict) -> str:
+	"""
+	Return the NGINX config file of the upstream or proxy_pass section.
+	"""
+	template = NGINX_TEMPLATES.get(config['type'])
+	if template is None:
+		raise Exception(f"error: Unknown NGINX section type: {config['type']}")
+	try:
+		return get_renderer('nginx_section').render(template, _section_vars(config, 'nginx'))
+	except jinja2.TemplateError as e:
+		raise Exception(f"error: Cannot render NGINX {config['type']} section: {e}")
+
+
+def write_nginx_section(cfg: str, config: dict) -> None:
+	with open(cfg, 'w', encoding='utf-8', newline='') as f:
+		f.write(render_nginx_section(config))
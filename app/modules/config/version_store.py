@@ -0,0 +1,172 @@
+import os
+import gzip
+import time
+import hashlib
+import tempfile
+from typing import Union
+
+import app.modules.db.config as config_sql
+import app.modules.config.common as config_common
+import app.modules.roxywi.common as roxywi_common
+
+STORE_DIR = '.store'
+# Loose version files and unreferenced blobs are kept for this many seconds before pack_versions removes them
+KEEP_LOOSE = 3600
+SERVICES = ('haproxy', 'nginx', 'apache', 'keepalived')
+
+
+def _store_dir(service: str) -> str:
+	return os.path.join(config_common.get_config_dir(service), STORE_DIR)
+
+
+def _blob_path(service: str, content_hash: str) -> str:
+	return os.path.join(_store_dir(service), content_hash[:2], f'{content_hash}.gz')
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+	fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+	try:
+		with os.fdopen(fd, 'wb') as f:
+			f.write(content)
+		os.replace(tmp_path, path)
+	except Exception:
+		try:
+			os.remove(tmp_path)
+		except OSError:
+			pass
+		raise
+
+
+def put(service: str, content: bytes) -> str:
+	"""
+	Store the config in the version store of the service and return its hash.
+	Identical configs are stored once, as one gzip blob named by the sha256 of the config.
+	"""
+	content_hash = hashlib.sha256(content).hexdigest()
+	path = _blob_path(service, content_hash)
+	if os.path.isfile(path):
+		# Touch it, so the garbage collection does not take a blob a new version is about to point to
+		os.utime(path)
+		return content_hash
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+	_write_atomic(path, gzip.compress(content, compresslevel=6, mtime=0))
+	return content_hash
+
+
+def put_file(service: str, path: str) -> str:
+	with open(path, 'rb') as f:
+		return put(service, f.read())
+
+
+def get(service: str, content_hash: str) -> bytes:
+	try:
+		with open(_blob_path(service, content_hash), 'rb') as f:
+			return gzip.decompress(f.read())
+	except OSError as e:
+		raise Exception(f'error: Cannot read config version {content_hash}: {e}')
+
+
+def materialize(service: str, file_name: str) -> str:
+	"""
+	Return the path of the version file file_name in the config directory of the service.
+	A version file that has been packed is restored from its blob first.
+	"""
+	if '..' in file_name or '/' in file_name:
+		raise Exception('error: nice try')
+	path = config_common.get_config_dir(service) + file_name
+	if os.path.isfile(path):
+		return path
+	version = config_sql.select_config_version_by_file(service, file_name)
+	if version is None or not version.content_hash:
+		raise Exception(f'error: There is no config version {file_name}')
+	_write_atomic(path, get(service, version.content_hash))
+	return path
+
+
+def last_config(server_id: int, service: str, remote_path: str) -> Union[bytes, None]:
+	"""
+	The config file remote_path of the server as Roxy-WI uploaded it last, or None if there is no version of it.
+	"""
+	version = config_sql.select_last_config_version(server_id, service, remote_path)
+	if version is None:
+		return None
+	if version.content_hash:
+		try:
+			return get(service, version.content_hash)
+		except Exception:
+			pass
+	try:
+		with open(version.local_path, 'rb') as f:
+			return f.read()
+	except OSError:
+		return None
+
+
+def list_versions(server_ip: str, service: str) -> list:
+	"""
+	File names of the versions of the server config, newest first.
+	"""
+	return version_files(config_sql.select_config_version(server_ip, service))
+
+
+def version_files(versions) -> list:
+	files = []
+	for version in versions:
+		file_name = os.path.basename(version.local_path)
+		if file_name not in files:
+			files.append(file_name)
+	return files
+
+
+def _is_old(path: str, now: float) -> bool:
+	try:
+		return now - os.path.getmtime(path) > KEEP_LOOSE
+	except OSError:
+		return False
+
+
+def pack_versions() -> None:
+	"""
+	Move the version files into the version store: versions without a hash get their file stored,
+	and files older than KEEP_LOOSE whose blob is stored are removed. The newest version of every server config
+	stays as a file, as the overview and runtime API read it. Blobs no version points to any more are removed.
+	"""
+	now = time.time()
+	newest = set()
+	for version in config_sql.select_config_versions_for_pack():
+		if version.service not in SERVICES:
+			continue
+		path = version.local_path
+		is_newest = (version.server_id, version.service) not in newest
+		newest.add((version.server_id, version.service))
+		try:
+			if not version.content_hash:
+				if not os.path.isfile(path):
+					continue
+				version.content_hash = put_file(version.service, path)
+				config_sql.update_config_version_hash(version.id, version.content_hash)
+			if not is_newest and _is_old(path, now) and os.path.isfile(_blob_path(version.service, version.content_hash)):
+				os.remove(path)
+		except Exception as e:
+			roxywi_common.logging('Roxy-WI server', f'error: Cannot pack config version {path}: {e}', roxywi=1)
+
+	referenced = config_sql.select_config_version_hashes()
+	store_dirs = set()
+	for service in SERVICES:
+		try:
+			store_dirs.add(_store_dir(service))
+		except Exception:
+			continue
+	for store_dir in store_dirs:
+		if not os.path.isdir(store_dir):
+			continue
+		for root, _dirs, files in os.walk(store_dir):
+			for file in files:
+				path = os.path.join(root, file)
+				if file.endswith('.gz') and file[:-3] in referenced:
+					continue
+				if _is_old(path, now):
+					try:
+						os.remove(path)
+					except OSError as e:
+						roxywi_common.logging('Roxy-WI server', f'error: Cannot remove config blob {path}: {e}', roxywi=1)
@@ -4,7 +4,10 @@ from app.modules.db.common import out_error
 import app.modules.roxy_wi_tools as roxy_wi_tools
 
 
-def insert_config_version(server_id: int, user_id: int, service: str, local_path: str, remote_path: str, diff: str):
+def insert_config_version(
+		server_id: int, user_id: int, service: str, local_path: str, remote_path: str, diff: str, content_hash: str = None,
+		diff_hunks: str = None
+):
 	get_date = roxy_wi_tools.GetDate()
 	cur_date = get_date.return_date('regular')
 	try:
@@ -15,6 +18,8 @@ def insert_config_version(server_id: int, user_id: int, service: str, local_path
 			local_path=local_path,
 			remote_path=remote_path,
 			diff=diff,
+			diff_hunks=diff_hunks,
+			content_hash=content_hash,
 			date=cur_date
 		).execute()
 	except Exception as e:
@@ -26,7 +31,7 @@ def select_config_version(server_ip: str, service: str) -> str:
 	query = ConfigVersion.select().where(
 		(ConfigVersion.server_id == server_id)
 		& (ConfigVersion.service == service)
-	)
+	).order_by(ConfigVersion.date.desc())
 	try:
 		query_res = query.execute()
 	except Exception as e:
@@ -61,3 +66,52 @@ def select_remote_path_from_version(server_ip: str, service: str, local_path: st
 		out_error(e)
 	else:
 		return query_res
+
+
+def select_last_config_version(server_id: int, service: str, remote_path: str) -> ConfigVersion:
+	"""
+	Return the newest version of the config file remote_path of the server, or None.
+	"""
+	try:
+		return ConfigVersion.select().where(
+			(ConfigVersion.server_id == server_id)
+			& (ConfigVersion.service == service)
+			& (ConfigVersion.remote_path == remote_path)
+		).order_by(ConfigVersion.date.desc()).first()
+	except Exception as e:
+		out_error(e)
+
+
+def select_config_version_by_file(service: str, file_name: str) -> ConfigVersion:
+	"""
+	Return the version of the service whose local file is file_name, or None.
+	"""
+	try:
+		return ConfigVersion.select().where(
+			(ConfigVersion.service == service)
+			& (ConfigVersion.local_path.endswith(f'/{file_name}'))
+		).order_by(ConfigVersion.date.desc()).first()
+	except Exception as e:
+		out_error(e)
+
+
+def select_config_versions_for_pack() -> ConfigVersion:
+	try:
+		return ConfigVersion.select().order_by(ConfigVersion.server_id, ConfigVersion.service, ConfigVersion.date.desc()).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def select_config_version_hashes() -> set:
+	try:
+		query = ConfigVersion.select(ConfigVersion.content_hash).where(ConfigVersion.content_hash.is_null(False)).distinct()
+		return {version.content_hash for version in query}
+	except Exception as e:
+		out_error(e)
+
+
+def update_config_version_hash(version_id: int, content_hash: str) -> None:
+	try:
+		ConfigVersion.update(content_hash=content_hash).where(ConfigVersion.id == version_id).execute()
+	except Exception as e:
+		out_error(e)
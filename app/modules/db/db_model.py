@@ -240,8 +240,8 @@ class Metrics(BaseModel):
         table_name = 'metrics'
         primary_key = False
         indexes = (
-            # Composite index for queries that filter by both server and date
-            (('serv', 'date'), False),
+            # Covering index for chart and table queries that filter by server and date
+            (('serv', 'date', 'curr_con', 'cur_ssl_con', 'sess_rate'), False),
         )
 
 
@@ -254,8 +254,8 @@ class WafMetrics(BaseModel):
         table_name = 'waf_metrics'
         primary_key = False
         indexes = (
-            # Composite index for queries that filter by both server and date
-            (('serv', 'date'), False),
+            # Covering index for chart and table queries that filter by server and date
+            (('serv', 'date', 'conn'), False),
         )
 
 
@@ -268,8 +268,8 @@ class NginxMetrics(BaseModel):
         table_name = 'nginx_metrics'
         primary_key = False
         indexes = (
-            # Composite index for queries that filter by both server and date
-            (('serv', 'date'), False),
+            # Covering index for chart and table queries that filter by server and date
+            (('serv', 'date', 'conn'), False),
         )
 
 
@@ -282,8 +282,8 @@ class ApacheMetrics(BaseModel):
         table_name = 'apache_metrics'
         primary_key = False
         indexes = (
-            # Composite index for queries that filter by both server and date
-            (('serv', 'date'), False),
+            # Covering index for chart and table queries that filter by server and date
+            (('serv', 'date', 'conn'), False),
         )
 
 
@@ -386,6 +386,33 @@ class MetricsHttpStatus(BaseModel):
     class Meta:
         table_name = 'metrics_http_status'
         primary_key = False
+        indexes = (
+            # Covering index for chart queries that filter by server and date
+            (('serv', 'date', 'ok_ans', 'redir_ans', 'not_found_ans', 'err_ans'), False),
+            (('date',), False),
+        )
+
+
+class MetricsRollup(BaseModel):
+    service = CharField()
+    serv = CharField()
+    resolution = IntegerField()  # Bucket width in seconds
+    metric = CharField()
+    date = DateTimeField()  # Bucket start, UTC
+    value_avg = FloatField()
+    value_min = IntegerField()
+    value_max = IntegerField()
+    value_last = IntegerField()
+    samples = IntegerField()
+
+    class Meta:
+        table_name = 'metrics_rollup'
+        primary_key = False
+        indexes = (
+            (('service', 'serv', 'resolution', 'date'), False),
+            (('resolution', 'date'), False),
+            (('service', 'serv', 'resolution', 'metric', 'date'), True),
+        )
 
 
 class SMON(BaseModel):
@@ -488,11 +515,16 @@ class ConfigVersion(BaseModel):
     local_path = CharField()
     remote_path = CharField()
     diff = TextField()
+    diff_hunks = TextField(null=True)
     message = CharField(null=True)
+    content_hash = CharField(null=True)
     date = DateTimeField(default=datetime.now)
 
     class Meta:
         table_name = 'config_versions'
+        indexes = (
+            (('server_id', 'service', 'date'), False),
+        )
 
 
 class SystemInfo(BaseModel):
@@ -605,6 +637,46 @@ class SmonHistory(BaseModel):
     class Meta:
         table_name = 'smon_history'
         primary_key = False
+        indexes = (
+            (('smon_id', 'date'), False),
+            (('smon_id', 'check_id', 'date'), False),
+            (('date',), False),
+        )
+
+
+class SmonUptime(BaseModel):
+    smon_id = ForeignKeyField(SMON, on_delete='Cascade')
+    date = DateTimeField()  # Start of the hour, UTC
+    total = IntegerField(default=0)
+    up = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'smon_uptime'
+        primary_key = False
+        indexes = (
+            (('smon_id', 'date'), True),
+            (('date',), False),
+        )
+
+
+class SmonHistoryRollup(BaseModel):
+    smon_id = ForeignKeyField(SMON, on_delete='Cascade')
+    resolution = IntegerField()  # Bucket width in seconds
+    date = DateTimeField()  # Bucket start, UTC
+    checks = IntegerField()
+    up = IntegerField()
+    resp_avg = FloatField()
+    resp_p50 = FloatField()
+    resp_p95 = FloatField()
+    resp_max = FloatField()
+
+    class Meta:
+        table_name = 'smon_history_rollup'
+        primary_key = False
+        indexes = (
+            (('smon_id', 'resolution', 'date'), True),
+            (('resolution', 'date'), False),
+        )
 
 
 class SmonAgent(BaseModel):
@@ -704,6 +776,23 @@ class RoxyTool(BaseModel):
         constraints = [SQL('UNIQUE (name)')]
 
 
+class WorkerHeartbeat(BaseModel):
+    worker = CharField()  # Script of the worker, e.g. checker_haproxy
+    kind = CharField()  # checker or metrics
+    server_ip = CharField()
+    pid = IntegerField()
+    started = DateTimeField()
+    last_heartbeat = DateTimeField()
+
+    class Meta:
+        table_name = 'worker_heartbeat'
+        primary_key = False
+        indexes = (
+            (('worker', 'server_ip'), True),
+            (('kind', 'last_heartbeat'), False),
+        )
+
+
 class HaCluster(BaseModel):
     id = AutoField()
     name = CharField()
@@ -853,9 +942,9 @@ def create_tables():
         conn.create_tables(
             [User, Server, Role, Telegram, Slack, Groups, UserGroups, ConfigVersion, Setting, RoxyTool, Alerts,
              Cred, Backup, Metrics, WafMetrics, Version, Option, SavedServer, Waf, ActionHistory, PortScannerSettings,
-             PortScannerPorts, PortScannerHistory, ServiceSetting, MetricsHttpStatus, SMON, WafRules, GeoipCodes,
+             PortScannerPorts, PortScannerHistory, ServiceSetting, MetricsHttpStatus, MetricsRollup, SMON, WafRules, GeoipCodes,
              NginxMetrics, SystemInfo, Services, UserName, GitSetting, CheckerSetting, ApacheMetrics, WafNginx, ServiceStatus,
-             KeepaliveRestart, PD, SmonHistory, SmonAgent, SmonTcpCheck, SmonHttpCheck, SmonPingCheck, SmonDnsCheck, S3Backup,
+             KeepaliveRestart, PD, SmonHistory, SmonUptime, SmonHistoryRollup, SmonAgent, SmonTcpCheck, SmonHttpCheck, SmonPingCheck, SmonDnsCheck, S3Backup,
              SmonStatusPage, SmonStatusPageCheck, HaCluster, HaClusterSlave, HaClusterVip, HaClusterVirt, HaClusterService,
-             HaClusterRouter, MM, UDPBalancer, HaproxySection, LetsEncrypt, NginxSection, InstallationTasks]
+             HaClusterRouter, MM, UDPBalancer, HaproxySection, LetsEncrypt, NginxSection, InstallationTasks, WorkerHeartbeat]
         )
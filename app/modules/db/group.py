@@ -1,5 +1,7 @@
 from app.modules.db.db_model import Groups, Setting, UserGroups
 from app.modules.db.common import out_error
+from app.modules.db.sql import invalidate_settings_cache
+from app.modules.db.user import invalidate_user_cache
 from app.modules.roxywi.exception import RoxywiResourceNotFound
 
 
@@ -78,6 +80,7 @@ def add_setting_for_new_group(group_id):
 		Setting.insert_many(data_source).execute()
 	except Exception as e:
 		out_error(e)
+	invalidate_settings_cache(group_id)
 
 
 def delete_group(group_id):
@@ -88,6 +91,7 @@ def delete_group(group_id):
 		out_error(e)
 		return False
 	else:
+		invalidate_user_cache()
 		delete_group_settings(group_id)
 		return True
 
@@ -97,6 +101,7 @@ def delete_group_settings(group_id):
 		Setting.delete().where(Setting.group_id == group_id).execute()
 	except Exception as e:
 		out_error(e)
+	invalidate_settings_cache(group_id)
 
 
 def update_group(name, descript, group_id):
@@ -104,6 +109,7 @@ def update_group(name, descript, group_id):
 		Groups.update(name=name, description=descript).where(Groups.group_id == group_id).execute()
 	except Exception as e:
 		out_error(e)
+	invalidate_user_cache()
 
 
 def get_group(group_id: int) -> Groups:
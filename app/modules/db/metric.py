@@ -1,10 +1,15 @@
+import time
+import atexit
+import threading
 from typing import Literal
 from datetime import datetime, timedelta
 
-from peewee import fn
+from peewee import fn, SQL, OperationalError, InterfaceError
 
-from app.modules.db.db_model import mysql_enable, Metrics, MetricsHttpStatus, Server, NginxMetrics, ApacheMetrics, WafMetrics
+from app.modules.db.db_model import mysql_enable, Metrics, MetricsHttpStatus, MetricsRollup, Server, NginxMetrics, ApacheMetrics, WafMetrics
 from app.modules.db.common import out_error
+from app.modules.db.sql import get_setting
+from app.modules.roxywi import logger
 import app.modules.roxy_wi_tools as roxy_wi_tools
 
 MODELS = {
@@ -16,108 +21,537 @@ MODELS = {
 }
 
 
+class MetricsWriter:
+	"""
+	Buffers metric samples in memory and writes them with insert_many, one transaction per flush.
+
+	A flush happens when batch_size samples are pending, or every flush_interval seconds from a background thread
+	and from the flush_service_metrics scheduler job. When max_pending samples are waiting, because the database is
+	slow or locked, add() blocks the caller until a flush frees room, for flush_interval seconds at most. If there is
+	still no room, the sample is dropped. Failed writes and dropped samples are reported to the Roxy-WI log.
+	"""
+
+	def __init__(self, batch_size: int = 200, flush_interval: float = 5, max_pending: int = 10000):
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.max_pending = max_pending
+		self._buffers = {}
+		self._pending = 0
+		self._lock = threading.Lock()
+		self._not_full = threading.Condition(self._lock)
+		self._flush_lock = threading.Lock()
+		self._thread = None
+		self.dropped = 0
+		self._reported_dropped = 0
+		self._retry_at = 0
+		atexit.register(self.flush)
+
+	def add(self, service: str, row: dict) -> None:
+		with self._not_full:
+			if self._pending >= self.max_pending:
+				self._not_full.wait_for(lambda: self._pending < self.max_pending, timeout=self.flush_interval)
+			if self._pending >= self.max_pending:
+				self.dropped += 1
+				return
+			self._buffers.setdefault(service, []).append(row)
+			self._pending += 1
+			need_flush = self._pending >= self.batch_size and time.monotonic() >= self._retry_at
+			self._start_thread()
+		if need_flush:
+			self.flush()
+
+	def flush(self) -> None:
+		with self._flush_lock:
+			with self._lock:
+				buffers, self._buffers = self._buffers, {}
+				self._pending = 0
+			failed = {}
+			for service, rows in buffers.items():
+				model = MODELS[service]
+				try:
+					with model._meta.database.atomic():
+						for i in range(0, len(rows), INSERT_BATCH):
+							model.insert_many(rows[i:i + INSERT_BATCH]).execute()
+				except (OperationalError, InterfaceError) as e:
+					logger.error(f'cannot save {len(rows)} {service} metrics, will try again: {e}', service=service)
+					failed[service] = rows
+				except Exception as e:
+					logger.error(f'cannot save {len(rows)} {service} metrics at once, saving them one by one: {e}', service=service)
+					rows = self._insert_each(service, model, rows)
+					if rows:
+						failed[service] = rows
+			with self._not_full:
+				if failed:
+					# Leave the retries to the background thread instead of every add()
+					self._retry_at = time.monotonic() + self.flush_interval
+				for service, rows in failed.items():
+					# Keep the failed samples for the next flush, but never more than max_pending in total
+					room = max(self.max_pending - self._pending, 0)
+					if room:
+						self._buffers[service] = rows[-room:] + self._buffers.get(service, [])
+						self._pending += min(room, len(rows))
+					self.dropped += max(len(rows) - room, 0)
+				self._not_full.notify_all()
+				dropped, self._reported_dropped = self.dropped - self._reported_dropped, self.dropped
+			if dropped:
+				logger.error(f'{dropped} metric samples were dropped, the buffer was full')
+
+	def _insert_each(self, service: str, model, rows: list) -> list:
+		"""
+		Insert the rows batch by batch, and the rows of a failed batch one by one, so one bad row does not keep
+		the others from being saved. Rows the database rejects are dropped. Returns the rows to try again later,
+		when the database itself is not available.
+		"""
+		for i in range(0, len(rows), INSERT_BATCH):
+			batch = rows[i:i + INSERT_BATCH]
+			try:
+				model.insert_many(batch).execute()
+				continue
+			except (OperationalError, InterfaceError):
+				return rows[i:]
+			except Exception:
+				pass
+			for j, row in enumerate(batch):
+				try:
+					model.insert(row).execute()
+				except (OperationalError, InterfaceError):
+					return rows[i + j:]
+				except Exception as e:
+					logger.error(f'dropped {service} metric {row}: {e}', service=service)
+		return []
+
+	def _start_thread(self) -> None:
+		if self._thread is None or not self._thread.is_alive():
+			self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+			self._thread.start()
+
+	def _run(self) -> None:
+		while True:
+			time.sleep(self.flush_interval)
+			if self._pending or self.dropped != self._reported_dropped:
+				try:
+					self.flush()
+				except Exception as e:
+					# The thread must outlive a failed flush, or the samples would wait for the next add()
+					logger.error(f'cannot flush metrics: {e}')
+
+
+_writer = MetricsWriter()
+
+
 def insert_service_metrics(service: Literal['haproxy', 'nginx', 'apache', 'waf', 'http'], **kwargs):
-	get_date = roxy_wi_tools.GetDate()
-	cur_date = get_date.return_date('regular')
-	kwargs['date'] = cur_date
-	model = MODELS[service]
-	try:
-		model.insert(**kwargs).execute()
-	except Exception as e:
-		out_error(e)
+	kwargs['date'] = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+	_writer.add(service, kwargs)
+
+
+def flush_service_metrics() -> None:
+	"""
+	Write the buffered metric samples now.
+	"""
+	_writer.flush()
+
+
+def service_metrics_retention_query(model, cur_date: str):
+	return model.delete().where(model.date < cur_date)
 
 
 def delete_service_metrics(service: Literal['haproxy', 'http', 'waf', 'nginx', 'apache']) -> None:
 	get_date = roxy_wi_tools.GetDate()
 	cur_date = get_date.return_date('regular', timedelta_minus=3)
-	model = MODELS[service]
 	try:
-		model.delete().where(model.date < cur_date).execute()
+		service_metrics_retention_query(MODELS[service], cur_date).execute()
 	except Exception as e:
 		out_error(e)
 
 
+METRIC_COLUMNS = {
+	'haproxy': ('curr_con', 'cur_ssl_con', 'sess_rate'),
+	'http_metrics': ('ok_ans', 'redir_ans', 'not_found_ans', 'err_ans'),
+	'nginx': ('conn',),
+	'apache': ('conn',),
+	'waf': ('conn',),
+}
+CHART_POINTS = 360
+EPOCH = datetime(1970, 1, 1)
+# Bucket width in seconds and the setting with the retention period of the tier in days
+ROLLUP_TIERS = (
+	(60, 'metrics_1m_keep_history_range'),
+	(600, 'metrics_10m_keep_history_range'),
+	(3600, 'metrics_1h_keep_history_range'),
+)
+ROLLUP_DELAY = 60
+# Rows per insert_many: 10 columns each stay below the 999 bound variables of SQLite before 3.32
+INSERT_BATCH = 90
+# Values per IN (...) list, for the same limit
+IN_BATCH = 500
+# One pass rolls up at most this many buckets of a tier, so a long backlog is worked off over several runs
+ROLLUP_WINDOW = 1440
+
+
+def _metrics_model(service: str):
+	if service == 'http_metrics':
+		return MetricsHttpStatus
+	return MODELS.get(service, Metrics)
+
+
+def metrics_query(serv: str, service: str, since: datetime):
+	model = _metrics_model(service)
+	return model.select().where((model.serv == serv) & (model.date >= since)).order_by(model.date.asc())
+
+
 def select_metrics(serv, service, **kwargs):
+	"""
+	Raw metric rows of the server for the last time_range minutes. Use select_metrics_buckets() for charts.
+	"""
+	time_range = int(kwargs.get('time_range', 30))
+	since = datetime.utcnow() - timedelta(minutes=time_range)
 	try:
-		# Map service to the appropriate model
-		if service in ('nginx', 'apache', 'waf'):
-			if service == 'nginx':
-				model = NginxMetrics
-			elif service == 'apache':
-				model = ApacheMetrics
-			else:  # waf
-				model = WafMetrics
-		elif service == 'http_metrics':
-			model = MetricsHttpStatus
-		else:
-			model = Metrics
-
-		time_range = kwargs.get('time_range', '30')
-		# Create a base query
-		query = model.select().where(model.serv == serv)
-
-		# Add time-based filtering
-		now = datetime.utcnow()
-
-		if time_range == 1:
-			# Last 1 minute
-			query = query.where(model.date >= now - timedelta(minutes=1))
-		elif time_range == 60:
-			# Last 60 minutes
-			query = query.where(model.date >= now - timedelta(minutes=60))
-		elif time_range == 180:
-			# Last 180 minutes
-			query = query.where(model.date >= now - timedelta(minutes=180))
-		elif time_range == 360:
-			# Last 360 minutes
-			query = query.where(model.date >= now - timedelta(minutes=360))
-		elif time_range == 720:
-			# Last 720 minutes
-			query = query.where(model.date >= now - timedelta(minutes=720))
-		else:
-			# Default: last 30 minutes
-			query = query.where(model.date >= now - timedelta(minutes=30))
-
-		# Order by date
-		query = query.order_by(model.date.asc())
-		# For longer time ranges, we can sample the data to reduce the number of points
-		# This is similar to the original SQL's "group by `date` div X" or "rowid % X = 0"
-		if mysql_enable == '1' and time_range not in (1, 30):
-			# For MySQL, we can use the SQL function to sample data
-			from peewee import fn
-			sampling_rates = {
-				60: 100,
-				180: 200,
-				360: 300,
-				720: 500
-			}
-			if time_range in sampling_rates:
-				# Group by date div X to reduce data points
-				query = model.select().where(
-					(model.serv == serv) & 
-					(model.date >= now - timedelta(minutes=int(time_range)))
-				).group_by(fn.DIV(model.date, sampling_rates[time_range])).order_by(model.date.asc())
-		elif not mysql_enable == '1' and time_range not in (1, 30):
-			# For SQLite, we need to fetch all data and then sample it in Python
-			# This is less efficient but maintains compatibility
-			results = list(query.dicts())
-			sampling_rates = {
-				60: 2,
-				180: 5,
-				360: 7,
-				720: 9
-			}
-			if time_range in sampling_rates:
-				# Sample data by taking every Nth row
-				return [results[i] for i in range(len(results)) if i % sampling_rates[time_range] == 0]
+		return list(metrics_query(serv, service, since).dicts())
+	except Exception as e:
+		out_error(e)
+		return []
+
+
+def _bucket_expression(field, step: int):
+	"""
+	Number of the step-seconds wide bucket the date belongs to, counted from the epoch. Dates are stored in UTC.
+	"""
+	if mysql_enable == '1':
+		seconds = fn.TIMESTAMPDIFF(SQL('SECOND'), '1970-01-01 00:00:00', field)
+		return fn.FLOOR(seconds / step)
+	return fn.strftime('%s', field).cast('INTEGER') / step
+
+
+def _epoch_seconds(date: datetime) -> int:
+	return int((date - EPOCH).total_seconds())
+
+
+def _bucket_start(bucket, step: int) -> datetime:
+	return EPOCH + timedelta(seconds=int(bucket) * step)
+
+
+def raw_buckets_query(service: str, serv: str, since: datetime, step: int):
+	"""
+	Average, min and max of every metric column of the server per step-seconds wide bucket, with the date of the
+	last sample of the bucket.
+	"""
+	model = _metrics_model(service)
+	bucket = _bucket_expression(model.date, step)
+	fields = [bucket.alias('bucket'), fn.MAX(model.date).alias('last_date')]
+	for column in METRIC_COLUMNS.get(service, METRIC_COLUMNS['haproxy']):
+		field = getattr(model, column)
+		fields += [
+			fn.AVG(field).alias(column),
+			fn.MIN(field).alias(f'{column}_min'),
+			fn.MAX(field).alias(f'{column}_max'),
+		]
+	return model.select(*fields).where((model.serv == serv) & (model.date >= since)).group_by(bucket)
+
+
+def raw_last_values_query(service: str, serv: str, last_dates: list):
+	model = _metrics_model(service)
+	columns = METRIC_COLUMNS.get(service, METRIC_COLUMNS['haproxy'])
+	return (
+		model.select(model.date, *[getattr(model, column) for column in columns])
+		.where((model.serv == serv) & (model.date.in_(last_dates)))
+	)
+
+
+def _raw_buckets(service: str, serv: str, since: datetime, step: int) -> dict:
+	columns = METRIC_COLUMNS.get(service, METRIC_COLUMNS['haproxy'])
+	buckets = list(raw_buckets_query(service, serv, since, step).dicts())
+	last_rows = {}
+	last_dates = [i['last_date'] for i in buckets]
+	if last_dates:
+		last_rows = {str(i['date']): i for i in raw_last_values_query(service, serv, last_dates).dicts()}
+
+	result = {}
+	for i in buckets:
+		last = last_rows.get(str(i.pop('last_date')), {})
+		for column in columns:
+			i[f'{column}_last'] = last.get(column, i[f'{column}_max'])
+		result[int(i.pop('bucket'))] = i
+	return result
+
+
+def rollup_buckets_query(service: str, serv: str, resolution: int, since: datetime, until: datetime, step: int):
+	"""
+	Rows of the rollup tier of the server merged into step-seconds wide buckets, one row per bucket and metric.
+	"""
+	bucket = _bucket_expression(MetricsRollup.date, step)
+	return (
+		MetricsRollup.select(
+			bucket.alias('bucket'),
+			MetricsRollup.metric,
+			(fn.SUM(MetricsRollup.value_avg * MetricsRollup.samples) / fn.SUM(MetricsRollup.samples)).alias('value_avg'),
+			fn.MIN(MetricsRollup.value_min).alias('value_min'),
+			fn.MAX(MetricsRollup.value_max).alias('value_max'),
+			fn.MAX(MetricsRollup.date).alias('last_date'),
+		)
+		.where(
+			(MetricsRollup.service == service) & (MetricsRollup.serv == serv) & (MetricsRollup.resolution == resolution)
+			& (MetricsRollup.date >= since) & (MetricsRollup.date < until)
+		)
+		.group_by(bucket, MetricsRollup.metric)
+	)
+
+
+def rollup_last_values_query(service: str, serv: str, resolution: int, last_dates: list):
+	return (
+		MetricsRollup.select(MetricsRollup.metric, MetricsRollup.date, MetricsRollup.value_last)
+		.where(
+			(MetricsRollup.service == service) & (MetricsRollup.serv == serv)
+			& (MetricsRollup.resolution == resolution) & (MetricsRollup.date.in_(last_dates))
+		)
+	)
+
 
-		# Execute query and return results as dictionaries
-		return list(query.dicts())
+def _rollup_buckets(service: str, serv: str, resolution: int, since: datetime, until: datetime, step: int) -> dict:
+	rows = list(rollup_buckets_query(service, serv, resolution, since, until, step).dicts())
+	last_rows = {}
+	last_dates = list({i['last_date'] for i in rows})
+	if last_dates:
+		last_query = rollup_last_values_query(service, serv, resolution, last_dates)
+		last_rows = {(i['metric'], str(i['date'])): i['value_last'] for i in last_query.dicts()}
+
+	result = {}
+	for i in rows:
+		column = i['metric']
+		point = result.setdefault(int(i['bucket']), {})
+		point[column] = i['value_avg']
+		point[f'{column}_min'] = i['value_min']
+		point[f'{column}_max'] = i['value_max']
+		point[f'{column}_last'] = last_rows.get((column, str(i['last_date'])), i['value_max'])
+	return result
+
+
+def rollup_watermark_query(service: str, serv: str, resolution: int):
+	return (
+		MetricsRollup.select(fn.MAX(MetricsRollup.date))
+		.where((MetricsRollup.service == service) & (MetricsRollup.serv == serv) & (MetricsRollup.resolution == resolution))
+	)
 
+
+def _rollup_watermark(service: str, serv: str, resolution: int):
+	"""
+	End of the last bucket of the tier that has been rolled up for the server, or None.
+	"""
+	last_date = rollup_watermark_query(service, serv, resolution).scalar()
+	if not last_date:
+		return None
+	if not isinstance(last_date, datetime):
+		last_date = datetime.strptime(str(last_date), '%Y-%m-%d %H:%M:%S')
+	return last_date + timedelta(seconds=resolution)
+
+
+def _pick_rollup_tier(time_range: int, step: int):
+	"""
+	The coarsest rollup tier that is not coarser than the chart step and still keeps the whole time range.
+	"""
+	for resolution, retention_setting in reversed(ROLLUP_TIERS):
+		if resolution > step:
+			continue
+		if int(time_range) <= get_setting(retention_setting, group_id=1) * 1440:
+			return resolution
+	return None
+
+
+def bucket_window(time_range: int, points: int = CHART_POINTS) -> tuple:
+	"""
+	Start of the first bucket (UTC) and the bucket width in seconds for a chart of the last time_range minutes.
+	"""
+	step = max(1, -(-int(time_range) * 60 // max(1, int(points))))
+	# Start at a bucket boundary, so a partial bucket does not become the points + 1 point
+	since = _epoch_seconds(datetime.utcnow()) - int(time_range) * 60
+	since = EPOCH + timedelta(seconds=-(-since // step) * step)
+	return since, step
+
+
+def select_metrics_buckets(serv: str, service: str, time_range: int, points: int = CHART_POINTS) -> list:
+	"""
+	Downsample metrics of the server for the last time_range minutes to at most points fixed-width time buckets.
+
+	Aggregation is done by the database. The cheapest rollup tier that covers the range is read, and only the part
+	that has not been rolled up yet is taken from the raw table. Every bucket is a dict with the bucket start in "date"
+	and, for every metric column, its average under the column name and the "<column>_min", "<column>_max" and
+	"<column>_last" values.
+	:param serv: IP of the server
+	:param service: haproxy, http_metrics, nginx, apache or waf
+	:param time_range: Window in minutes
+	:param points: Maximum number of buckets to return
+	"""
+	columns = METRIC_COLUMNS.get(service, METRIC_COLUMNS['haproxy'])
+	since, step = bucket_window(time_range, points)
+	try:
+		buckets = {}
+		raw_since = since
+		resolution = _pick_rollup_tier(time_range, step)
+		if resolution:
+			watermark = _rollup_watermark(service, serv, resolution)
+			if watermark and watermark > since:
+				# The chart bucket the watermark falls into is taken from the raw table, which still keeps it
+				raw_since = max(since, EPOCH + timedelta(seconds=_epoch_seconds(watermark) // step * step))
+				buckets.update(_rollup_buckets(service, serv, resolution, since, raw_since, step))
+		buckets.update(_raw_buckets(service, serv, raw_since, step))
 	except Exception as e:
 		out_error(e)
 		return []
 
+	result = []
+	for bucket in sorted(buckets):
+		point = buckets[bucket]
+		point['date'] = _bucket_start(bucket, step)
+		point['serv'] = serv
+		for column in columns:
+			point[column] = round(float(point.get(column) or 0), 1)
+		result.append(point)
+	return result
+
+
+def _rollup_rows(service: str, source_resolution: int, resolution: int, since: datetime, until: datetime) -> list:
+	"""
+	Aggregate the source (raw table, or the previous rollup tier) into rows of the tier for [since, until).
+	"""
+	bucket = _bucket_expression(MetricsRollup.date if source_resolution else _metrics_model(service).date, resolution)
+	rows = []
+	if not source_resolution:
+		model = _metrics_model(service)
+		columns = METRIC_COLUMNS[service]
+		fields = [model.serv, bucket.alias('bucket'), fn.COUNT(SQL('*')).alias('samples'), fn.MAX(model.date).alias('last_date')]
+		for column in columns:
+			field = getattr(model, column)
+			fields += [fn.AVG(field).alias(column), fn.MIN(field).alias(f'{column}_min'), fn.MAX(field).alias(f'{column}_max')]
+		query = model.select(*fields).where((model.date >= since) & (model.date < until)).group_by(model.serv, bucket)
+		buckets = list(query.dicts())
+		last_rows = {}
+		last_dates = list({i['last_date'] for i in buckets})
+		for n in range(0, len(last_dates), IN_BATCH):
+			last_query = (
+				model.select(model.serv, model.date, *[getattr(model, column) for column in columns])
+				.where(model.date.in_(last_dates[n:n + IN_BATCH]))
+			)
+			last_rows.update({(i['serv'], str(i['date'])): i for i in last_query.dicts()})
+		for i in buckets:
+			last = last_rows.get((i['serv'], str(i['last_date'])), {})
+			for column in columns:
+				rows.append({
+					'service': service, 'serv': i['serv'], 'resolution': resolution, 'metric': column,
+					'date': _bucket_start(i['bucket'], resolution), 'value_avg': float(i[column] or 0),
+					'value_min': i[f'{column}_min'], 'value_max': i[f'{column}_max'],
+					'value_last': last.get(column, i[f'{column}_max']), 'samples': i['samples'],
+				})
+		return rows
+
+	source = (MetricsRollup.service == service) & (MetricsRollup.resolution == source_resolution)
+	query = (
+		MetricsRollup.select(
+			MetricsRollup.serv,
+			MetricsRollup.metric,
+			bucket.alias('bucket'),
+			(fn.SUM(MetricsRollup.value_avg * MetricsRollup.samples) / fn.SUM(MetricsRollup.samples)).alias('value_avg'),
+			fn.MIN(MetricsRollup.value_min).alias('value_min'),
+			fn.MAX(MetricsRollup.value_max).alias('value_max'),
+			fn.SUM(MetricsRollup.samples).alias('samples'),
+			fn.MAX(MetricsRollup.date).alias('last_date'),
+		)
+		.where(source & (MetricsRollup.date >= since) & (MetricsRollup.date < until))
+		.group_by(MetricsRollup.serv, MetricsRollup.metric, bucket)
+	)
+	buckets = list(query.dicts())
+	last_rows = {}
+	last_dates = list({i['last_date'] for i in buckets})
+	for n in range(0, len(last_dates), IN_BATCH):
+		last_query = (
+			MetricsRollup.select(MetricsRollup.serv, MetricsRollup.metric, MetricsRollup.date, MetricsRollup.value_last)
+			.where(source & MetricsRollup.date.in_(last_dates[n:n + IN_BATCH]))
+		)
+		last_rows.update({(i['serv'], i['metric'], str(i['date'])): i['value_last'] for i in last_query.dicts()})
+	for i in buckets:
+		rows.append({
+			'service': service, 'serv': i['serv'], 'resolution': resolution, 'metric': i['metric'],
+			'date': _bucket_start(i['bucket'], resolution), 'value_avg': float(i['value_avg'] or 0),
+			'value_min': i['value_min'], 'value_max': i['value_max'],
+			'value_last': last_rows.get((i['serv'], i['metric'], str(i['last_date'])), i['value_max']),
+			'samples': int(i['samples']),
+		})
+	return rows
+
+
+def _to_datetime(value) -> datetime:
+	if value is None or isinstance(value, datetime):
+		return value
+	return datetime.strptime(str(value)[:19], '%Y-%m-%d %H:%M:%S')
+
+
+def _first_source_date(service: str, source_resolution: int, since: datetime):
+	"""
+	Date of the first row of the source at or after since, or None when the source has nothing new.
+	"""
+	if source_resolution:
+		query = MetricsRollup.select(fn.MIN(MetricsRollup.date)).where(
+			(MetricsRollup.resolution == source_resolution) & (MetricsRollup.service == service) & (MetricsRollup.date >= since)
+		)
+	else:
+		model = _metrics_model(service)
+		query = model.select(fn.MIN(model.date)).where(model.date >= since)
+	return _to_datetime(query.scalar())
+
+
+def rollup_metrics() -> None:
+	"""
+	Compact finished buckets of raw metrics into the 1-minute tier, and every tier into the next coarser one.
+	Buckets are rolled up once the source had ROLLUP_DELAY seconds to receive late samples.
+	A pass starts at the first source row after the tier and covers ROLLUP_WINDOW buckets at most.
+	Rows that another process has written already are skipped by the unique index of the table.
+	"""
+	now = _epoch_seconds(datetime.utcnow()) - ROLLUP_DELAY
+	for service in METRIC_COLUMNS:
+		source_resolution = 0
+		for resolution, _ in ROLLUP_TIERS:
+			until = EPOCH + timedelta(seconds=now // resolution * resolution)
+			try:
+				last_date = _to_datetime(
+					MetricsRollup.select(fn.MAX(MetricsRollup.date))
+					.where((MetricsRollup.service == service) & (MetricsRollup.resolution == resolution))
+					.scalar()
+				)
+				since = last_date + timedelta(seconds=resolution) if last_date else EPOCH
+				if source_resolution:
+					# Only buckets the finer tier has fully rolled up already
+					source_last = _to_datetime(
+						MetricsRollup.select(fn.MAX(MetricsRollup.date))
+						.where((MetricsRollup.service == service) & (MetricsRollup.resolution == source_resolution))
+						.scalar()
+					)
+					source_end = _epoch_seconds(source_last) + source_resolution if source_last else 0
+					until = min(until, EPOCH + timedelta(seconds=source_end // resolution * resolution))
+				first_date = _first_source_date(service, source_resolution, since) if since < until else None
+				if first_date is not None:
+					since = max(since, EPOCH + timedelta(seconds=_epoch_seconds(first_date) // resolution * resolution))
+					until = min(until, since + timedelta(seconds=resolution * ROLLUP_WINDOW))
+				if first_date is not None and since < until:
+					rows = _rollup_rows(service, source_resolution, resolution, since, until)
+					with MetricsRollup._meta.database.atomic():
+						for i in range(0, len(rows), INSERT_BATCH):
+							MetricsRollup.insert_many(rows[i:i + INSERT_BATCH]).on_conflict_ignore().execute()
+			except Exception as e:
+				# One failing service or tier must not stop the others
+				logger.error(f'cannot roll up {service} metrics into {resolution}s buckets: {e}', service=service)
+			source_resolution = resolution
+
+
+def rollup_retention_query(resolution: int, cur_date: datetime):
+	return MetricsRollup.delete().where((MetricsRollup.resolution == resolution) & (MetricsRollup.date < cur_date))
+
+
+def delete_metrics_rollups() -> None:
+	for resolution, retention_setting in ROLLUP_TIERS:
+		cur_date = datetime.utcnow() - timedelta(days=get_setting(retention_setting, group_id=1))
+		try:
+			rollup_retention_query(resolution, cur_date).execute()
+		except Exception as e:
+			out_error(e)
+
 
 def select_servers_metrics_for_master(group_id: int):
 	query = Server.select(Server.ip).where(
@@ -156,6 +590,38 @@ def select_metrics_enabled_with_group(service: Literal['haproxy', 'nginx', 'apac
 		out_error(e)
 
 
+def table_metrics_query(server_ips: list, since: datetime, now: datetime):
+	"""
+	Session rate and connection aggregates of the HAProxy servers for the tables of the metrics page.
+	"""
+	return (
+		Metrics.select(
+			Metrics.serv,
+			fn.ROUND(fn.AVG(Metrics.sess_rate), 1).alias('avg_sess'),
+			fn.MAX(Metrics.sess_rate).alias('max_sess'),
+			fn.ROUND(fn.AVG(Metrics.curr_con + Metrics.cur_ssl_con), 1).alias('avg_cur'),
+			fn.MAX(Metrics.curr_con).alias('max_con')
+		)
+		.where((Metrics.serv.in_(server_ips)) & (Metrics.date >= since) & (Metrics.date <= now))
+		.group_by(Metrics.serv)
+	)
+
+
+def service_table_metrics_query(model, server_ips: list, since: datetime, now: datetime):
+	"""
+	Connection aggregates of the NGINX or Apache servers for the tables of the metrics page.
+	"""
+	return (
+		model.select(
+			model.serv,
+			fn.ROUND(fn.AVG(model.conn), 1).alias('avg_cur'),
+			fn.MAX(model.conn).alias('max_con')
+		)
+		.where((model.serv.in_(server_ips)) & (model.date >= since) & (model.date <= now))
+		.group_by(model.serv)
+	)
+
+
 def select_table_metrics(group_id):
 	try:
 		# Get current time
@@ -202,21 +668,7 @@ def select_table_metrics(group_id):
 
 		# Calculate metrics for each time range
 		# 1 hour metrics
-		one_hour_metrics = (Metrics
-			.select(
-				Metrics.serv,
-				fn.ROUND(fn.AVG(Metrics.sess_rate), 1).alias('avg_sess'),
-				fn.MAX(Metrics.sess_rate).alias('max_sess'),
-				fn.ROUND(fn.AVG(Metrics.curr_con + Metrics.cur_ssl_con), 1).alias('avg_cur'),
-				fn.MAX(Metrics.curr_con).alias('max_con')
-			)
-			.where(
-				(Metrics.serv.in_(server_ips)) &
-				(Metrics.date >= one_hour_ago) &
-				(Metrics.date <= now)
-			)
-			.group_by(Metrics.serv)
-		)
+		one_hour_metrics = table_metrics_query(server_ips, one_hour_ago, now)
 
 		for metric in one_hour_metrics:
 			if metric.serv in results:
@@ -226,21 +678,7 @@ def select_table_metrics(group_id):
 				results[metric.serv]['max_con_1h'] = metric.max_con or 0
 
 		# 24 hour metrics
-		day_metrics = (Metrics
-			.select(
-				Metrics.serv,
-				fn.ROUND(fn.AVG(Metrics.sess_rate), 1).alias('avg_sess'),
-				fn.MAX(Metrics.sess_rate).alias('max_sess'),
-				fn.ROUND(fn.AVG(Metrics.curr_con + Metrics.cur_ssl_con), 1).alias('avg_cur'),
-				fn.MAX(Metrics.curr_con).alias('max_con')
-			)
-			.where(
-				(Metrics.serv.in_(server_ips)) &
-				(Metrics.date >= one_day_ago) &
-				(Metrics.date <= now)
-			)
-			.group_by(Metrics.serv)
-		)
+		day_metrics = table_metrics_query(server_ips, one_day_ago, now)
 
 		for metric in day_metrics:
 			if metric.serv in results:
@@ -250,21 +688,7 @@ def select_table_metrics(group_id):
 				results[metric.serv]['max_con_24h'] = metric.max_con or 0
 
 		# 3 day metrics
-		three_day_metrics = (Metrics
-			.select(
-				Metrics.serv,
-				fn.ROUND(fn.AVG(Metrics.sess_rate), 1).alias('avg_sess'),
-				fn.MAX(Metrics.sess_rate).alias('max_sess'),
-				fn.ROUND(fn.AVG(Metrics.curr_con + Metrics.cur_ssl_con), 1).alias('avg_cur'),
-				fn.MAX(Metrics.curr_con).alias('max_con')
-			)
-			.where(
-				(Metrics.serv.in_(server_ips)) &
-				(Metrics.date >= three_days_ago) &
-				(Metrics.date <= now)
-			)
-			.group_by(Metrics.serv)
-		)
+		three_day_metrics = table_metrics_query(server_ips, three_days_ago, now)
 
 		for metric in three_day_metrics:
 			if metric.serv in results:
@@ -334,19 +758,7 @@ def select_service_table_metrics(service: str, group_id: int):
 
 		# Calculate metrics for each time range
 		# 1 hour metrics
-		one_hour_metrics = (model
-			.select(
-				model.serv,
-				fn.ROUND(fn.AVG(model.conn), 1).alias('avg_cur'),
-				fn.MAX(model.conn).alias('max_con')
-			)
-			.where(
-				(model.serv.in_(server_ips)) &
-				(model.date >= one_hour_ago) &
-				(model.date <= now)
-			)
-			.group_by(model.serv)
-		)
+		one_hour_metrics = service_table_metrics_query(model, server_ips, one_hour_ago, now)
 
 		for metric in one_hour_metrics:
 			if metric.serv in results:
@@ -354,19 +766,7 @@ def select_service_table_metrics(service: str, group_id: int):
 				results[metric.serv]['max_con_1h'] = metric.max_con or 0
 
 		# 24 hour metrics
-		day_metrics = (model
-			.select(
-				model.serv,
-				fn.ROUND(fn.AVG(model.conn), 1).alias('avg_cur'),
-				fn.MAX(model.conn).alias('max_con')
-			)
-			.where(
-				(model.serv.in_(server_ips)) &
-				(model.date >= one_day_ago) &
-				(model.date <= now)
-			)
-			.group_by(model.serv)
-		)
+		day_metrics = service_table_metrics_query(model, server_ips, one_day_ago, now)
 
 		for metric in day_metrics:
 			if metric.serv in results:
@@ -374,19 +774,7 @@ def select_service_table_metrics(service: str, group_id: int):
 				results[metric.serv]['max_con_24h'] = metric.max_con or 0
 
 		# 3 day metrics
-		three_day_metrics = (model
-			.select(
-				model.serv,
-				fn.ROUND(fn.AVG(model.conn), 1).alias('avg_cur'),
-				fn.MAX(model.conn).alias('max_con')
-			)
-			.where(
-				(model.serv.in_(server_ips)) &
-				(model.date >= three_days_ago) &
-				(model.date <= now)
-			)
-			.group_by(model.serv)
-		)
+		three_day_metrics = service_table_metrics_query(model, server_ips, three_days_ago, now)
 
 		for metric in three_day_metrics:
 			if metric.serv in results:
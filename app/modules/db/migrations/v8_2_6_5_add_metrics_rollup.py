@@ -0,0 +1,34 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect, MetricsRollup, Setting
+
+migrator = connect(get_migrator=1)
+
+RETENTION_SETTINGS = [
+    {'param': 'metrics_1m_keep_history_range', 'value': '7', 'section': 'monitoring', 'desc': 'Retention period for 1-minute metric rollups (in days)', 'group_id': '1'},
+    {'param': 'metrics_10m_keep_history_range', 'value': '60', 'section': 'monitoring', 'desc': 'Retention period for 10-minute metric rollups (in days)', 'group_id': '1'},
+    {'param': 'metrics_1h_keep_history_range', 'value': '365', 'section': 'monitoring', 'desc': 'Retention period for 1-hour metric rollups (in days)', 'group_id': '1'},
+]
+
+
+def up():
+    """Apply the migration."""
+    # This migration adds the metrics_rollup table and retention settings for its tiers
+    try:
+        conn = connect()
+        conn.create_tables([MetricsRollup], safe=True)
+        Setting.insert_many(RETENTION_SETTINGS).on_conflict_ignore().execute()
+    except Exception as e:
+        print(f"Error applying migration: {str(e)}")
+        raise e
+
+
+def down():
+    """Roll back the migration."""
+    # This migration drops the metrics_rollup table and its retention settings
+    try:
+        conn = connect()
+        conn.drop_tables([MetricsRollup], safe=True)
+        Setting.delete().where(Setting.param.in_([s['param'] for s in RETENTION_SETTINGS])).execute()
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
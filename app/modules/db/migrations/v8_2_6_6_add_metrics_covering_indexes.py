@@ -0,0 +1,55 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect
+
+migrator = connect(get_migrator=1)
+
+# Table, columns of the new index, columns of the index it replaces
+INDEXES = [
+    ('metrics', ('serv', 'date', 'curr_con', 'cur_ssl_con', 'sess_rate'), ('serv', 'date')),
+    ('waf_metrics', ('serv', 'date', 'conn'), ('serv', 'date')),
+    ('nginx_metrics', ('serv', 'date', 'conn'), ('serv', 'date')),
+    ('apache_metrics', ('serv', 'date', 'conn'), ('serv', 'date')),
+    ('metrics_http_status', ('serv', 'date', '2xx', '3xx', '4xx', '5xx'), None),
+    ('smon_history', ('smon_id', 'date'), None),
+    ('smon_history', ('smon_id', 'check_id', 'date'), None),
+    ('smon_history', ('date',), None),
+]
+
+
+def _find_index(conn, table, columns):
+    for index in conn.get_indexes(table):
+        if tuple(index.columns) == tuple(columns):
+            return index.name
+    return None
+
+
+def up():
+    """Apply the migration."""
+    # This migration adds covering (serv, date) indexes to the metric tables and indexes for SMON history
+    try:
+        conn = connect()
+        for table, columns, replaces in INDEXES:
+            if not _find_index(conn, table, columns):
+                migrate(migrator.add_index(table, columns))
+            if replaces:
+                old_index = _find_index(conn, table, replaces)
+                if old_index:
+                    migrate(migrator.drop_index(table, old_index))
+    except Exception as e:
+        print(f"Error applying migration: {str(e)}")
+        raise e
+
+
+def down():
+    """Roll back the migration."""
+    try:
+        conn = connect()
+        for table, columns, replaces in reversed(INDEXES):
+            if replaces and not _find_index(conn, table, replaces):
+                migrate(migrator.add_index(table, replaces))
+            index = _find_index(conn, table, columns)
+            if index:
+                migrate(migrator.drop_index(table, index))
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
@@ -0,0 +1,36 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect, SmonHistory, SmonUptime
+
+migrator = connect(get_migrator=1)
+
+
+def up():
+    """Apply the migration."""
+    # This migration adds hourly uptime counters for SMON checks and fills them from the kept history
+    try:
+        conn = connect()
+        conn.create_tables([SmonUptime], safe=True)
+        counters = {}
+        query = SmonHistory.select(SmonHistory.smon_id, SmonHistory.status, SmonHistory.date).tuples()
+        for smon_id, status, date in query.iterator():
+            key = (smon_id, str(date)[:13] + ':00:00')
+            counter = counters.setdefault(key, [0, 0])
+            counter[0] += 1
+            counter[1] += 1 if status == 1 else 0
+        rows = [{'smon_id': k[0], 'date': k[1], 'total': v[0], 'up': v[1]} for k, v in counters.items()]
+        with conn.atomic():
+            for i in range(0, len(rows), 100):
+                SmonUptime.insert_many(rows[i:i + 100]).on_conflict_ignore().execute()
+    except Exception as e:
+        print(f"Error applying migration: {str(e)}")
+        raise e
+
+
+def down():
+    """Roll back the migration."""
+    try:
+        conn = connect()
+        conn.drop_tables([SmonUptime], safe=True)
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
@@ -0,0 +1,26 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect, SmonHistoryRollup
+
+migrator = connect(get_migrator=1)
+
+
+def up():
+    """Apply the migration."""
+    # This migration adds the smon_history_rollup table with hourly and daily aggregates of SMON checks
+    try:
+        conn = connect()
+        conn.create_tables([SmonHistoryRollup], safe=True)
+    except Exception as e:
+        print(f"Error applying migration: {str(e)}")
+        raise e
+
+
+def down():
+    """Roll back the migration."""
+    # This migration drops the smon_history_rollup table
+    try:
+        conn = connect()
+        conn.drop_tables([SmonHistoryRollup], safe=True)
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
@@ -0,0 +1,26 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect, WorkerHeartbeat
+
+migrator = connect(get_migrator=1)
+
+
+def up():
+    """Apply the migration."""
+    # This migration adds the worker_heartbeat table where checker and metrics workers register themselves
+    try:
+        conn = connect()
+        conn.create_tables([WorkerHeartbeat], safe=True)
+    except Exception as e:
+        print(f"Error applying migration: {str(e)}")
+        raise e
+
+
+def down():
+    """Roll back the migration."""
+    # This migration drops the worker_heartbeat table
+    try:
+        conn = connect()
+        conn.drop_tables([WorkerHeartbeat], safe=True)
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
@@ -0,0 +1,57 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect
+
+migrator = connect(get_migrator=1)
+
+TABLE = 'metrics_rollup'
+KEY = ('service', 'serv', 'resolution', 'metric', 'date')
+VALUES = 'MAX(value_avg), MIN(value_min), MAX(value_max), MAX(value_last), MAX(samples)'
+COLUMNS = 'service, serv, resolution, metric, date, value_avg, value_min, value_max, value_last, samples'
+
+
+def _find_index(conn, table, columns):
+    for index in conn.get_indexes(table):
+        if tuple(index.columns) == tuple(columns):
+            return index.name
+    return None
+
+
+def _delete_duplicates(conn):
+    key = ', '.join(KEY)
+    duplicates = conn.execute_sql(
+        f'SELECT COUNT(*) FROM (SELECT 1 FROM {TABLE} GROUP BY {key} HAVING COUNT(*) > 1) d'
+    ).fetchone()[0]
+    if not duplicates:
+        return
+    # Rollup jobs of several processes wrote the same buckets, one row of each is kept
+    with conn.atomic():
+        conn.execute_sql(f'CREATE TABLE {TABLE}_dedup AS SELECT {key}, {VALUES} FROM {TABLE} GROUP BY {key}')
+        conn.execute_sql(f'DELETE FROM {TABLE}')
+        conn.execute_sql(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT * FROM {TABLE}_dedup')
+        conn.execute_sql(f'DROP TABLE {TABLE}_dedup')
+
+
+def up():
+    """Apply the migration."""
+    # This migration makes the buckets of metrics_rollup unique, so rollup jobs running in several processes
+    # cannot write the same bucket twice
+    try:
+        conn = connect()
+        if not _find_index(conn, TABLE, KEY):
+            _delete_duplicates(conn)
+            migrate(migrator.add_index(TABLE, KEY, True))
+    except Exception as e:
+        print(f"Error applying migration: {str(e)}")
+        raise e
+
+
+def down():
+    """Roll back the migration."""
+    try:
+        conn = connect()
+        index = _find_index(conn, TABLE, KEY)
+        if index:
+            migrate(migrator.drop_index(TABLE, index))
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
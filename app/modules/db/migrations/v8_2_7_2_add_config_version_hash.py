@@ -0,0 +1,51 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect
+
+migrator = connect(get_migrator=1)
+
+INDEX_COLUMNS = ('server_id', 'service', 'date')
+
+
+def _find_index(conn, table, columns):
+    for index in conn.get_indexes(table):
+        if tuple(index.columns) == tuple(columns):
+            return index.name
+    return None
+
+
+def up():
+    """Apply the migration."""
+    # This migration adds the content_hash column, which points a config version to its blob in the version store,
+    # and the (server_id, service, date) index the version list is read by
+    try:
+        migrate(
+            migrator.add_column('config_versions', 'content_hash', CharField(null=True)),
+        )
+    except Exception as e:
+        if (e.args[0] == 'duplicate column name: content_hash'
+                or str(e) == '(1060, "Duplicate column name \'content_hash\'")'):
+            print('Column already exists')
+        else:
+            raise e
+    try:
+        conn = connect()
+        if not _find_index(conn, 'config_versions', INDEX_COLUMNS):
+            migrate(migrator.add_index('config_versions', INDEX_COLUMNS))
+    except Exception as e:
+        print(f"Error applying migration: {str(e)}")
+        raise e
+
+
+def down():
+    """Roll back the migration."""
+    try:
+        conn = connect()
+        index = _find_index(conn, 'config_versions', INDEX_COLUMNS)
+        if index:
+            migrate(migrator.drop_index('config_versions', index))
+        migrate(
+            migrator.drop_column('config_versions', 'content_hash'),
+        )
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
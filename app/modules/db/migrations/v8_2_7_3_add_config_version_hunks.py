@@ -0,0 +1,30 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect
+
+migrator = connect(get_migrator=1)
+
+
+def up():
+    """Apply the migration."""
+    # This migration adds the diff_hunks column, where the diff of a config version is kept as JSON hunks
+    try:
+        migrate(
+            migrator.add_column('config_versions', 'diff_hunks', TextField(null=True)),
+        )
+    except Exception as e:
+        if (e.args[0] == 'duplicate column name: diff_hunks'
+                or str(e) == '(1060, "Duplicate column name \'diff_hunks\'")'):
+            print('Column already exists')
+        else:
+            raise e
+
+
+def down():
+    """Roll back the migration."""
+    try:
+        migrate(
+            migrator.drop_column('config_versions', 'diff_hunks'),
+        )
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
@@ -0,0 +1,43 @@
+from playhouse.migrate import *
+from app.modules.db.db_model import connect
+
+migrator = connect(get_migrator=1)
+
+# Table, columns of the new index
+INDEXES = [
+    ('metrics_http_status', ('date',)),
+    ('smon_uptime', ('date',)),
+]
+
+
+def _find_index(conn, table, columns):
+    for index in conn.get_indexes(table):
+        if tuple(index.columns) == tuple(columns):
+            return index.name
+    return None
+
+
+def up():
+    """Apply the migration."""
+    # This migration adds the date indexes the retention deletes of the HTTP status metrics and SMON uptime search by
+    try:
+        conn = connect()
+        for table, columns in INDEXES:
+            if not _find_index(conn, table, columns):
+                migrate(migrator.add_index(table, columns))
+    except Exception as e:
+        print(f"Error applying migration: {str(e)}")
+        raise e
+
+
+def down():
+    """Roll back the migration."""
+    try:
+        conn = connect()
+        for table, columns in reversed(INDEXES):
+            index = _find_index(conn, table, columns)
+            if index:
+                migrate(migrator.drop_index(table, index))
+    except Exception as e:
+        print(f"Error rolling back migration: {str(e)}")
+        raise e
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+import os
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path so we can import the app modules
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../..')))
+
+from app.modules.db.db_model import mysql_enable
+import app.modules.db.metric as metric_sql
+import app.modules.db.smon as smon_sql
+
+
+def hot_queries() -> dict:
+    """
+    Queries the metric charts, table metrics and SMON pages run most often, built with placeholder arguments
+    by the same functions app/modules/db/metric.py and app/modules/db/smon.py run them with.
+    """
+    serv = '127.0.0.1'
+    servers = [serv, '127.0.0.2']
+    smon_id = 1
+    now = datetime.utcnow()
+    # Retention deletes compare with the dates GetDate.return_date() gives as strings
+    day_ago = (now - timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+    three_days_ago = (now - timedelta(days=3)).strftime('%Y-%m-%d %H:%M:%S')
+    month_ago = (now - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
+    since, step = metric_sql.bucket_window(720)
+    queries = {}
+
+    for service in ('haproxy', 'http_metrics', 'nginx', 'apache', 'waf'):
+        table = metric_sql._metrics_model(service)._meta.table_name
+        queries[f'{table}: chart buckets'] = metric_sql.raw_buckets_query(service, serv, since, step)
+        queries[f'{table}: last values'] = metric_sql.raw_last_values_query(service, serv, [now])
+        queries[f'{table}: live chart'] = metric_sql.metrics_query(serv, service, now - timedelta(minutes=30))
+        queries[f'{table}: retention'] = metric_sql.service_metrics_retention_query(metric_sql._metrics_model(service), three_days_ago)
+
+    queries['metrics: table metrics'] = metric_sql.table_metrics_query(servers, now - timedelta(days=3), now)
+    for service in ('nginx', 'apache'):
+        model = metric_sql.MODELS[service]
+        queries[f'{model._meta.table_name}: table metrics'] = metric_sql.service_table_metrics_query(
+            model, servers, now - timedelta(days=3), now
+        )
+    queries['metrics_rollup: chart buckets'] = metric_sql.rollup_buckets_query('haproxy', serv, 600, since, now, step)
+    queries['metrics_rollup: last values'] = metric_sql.rollup_last_values_query('haproxy', serv, 600, [now])
+    queries['metrics_rollup: watermark'] = metric_sql.rollup_watermark_query('haproxy', serv, 600)
+    queries['metrics_rollup: retention'] = metric_sql.rollup_retention_query(60, now - timedelta(days=1))
+
+    queries['smon_history: latest statuses'] = smon_sql.latest_smon_statuses_query([smon_id, 2])
+    queries['smon_history: last response time'] = smon_sql.last_smon_res_time_query(smon_id, 1)
+    queries['smon_history: history'] = smon_sql.smon_history_query(smon_id)
+    queries['smon_history: count checks'] = smon_sql.smon_history_count_query(smon_id, status=1)
+    queries['smon_history: retention'] = smon_sql.smon_history_retention_query(day_ago)
+    queries['smon_history: rollup hour'] = smon_sql.hour_rollup_source_query(now - timedelta(hours=1), now)
+    queries['smon_uptime: uptime'] = smon_sql.smon_uptime_query([smon_id, 2], now.replace(minute=0, second=0, microsecond=0))
+    queries['smon_uptime: retention'] = smon_sql.smon_uptime_retention_query(month_ago)
+    queries['smon_history_rollup: range'] = smon_sql.smon_history_range_query(smon_id, smon_sql.HISTORY_HOUR, now - timedelta(days=7))
+    queries['smon_history_rollup: retention'] = smon_sql.smon_history_rollup_retention_query(
+        now - timedelta(days=30), now - timedelta(days=smon_sql.HISTORY_DAILY_KEEP)
+    )
+    return queries
+
+
+def explain(query) -> list:
+    """
+    Plan of the query as a list of dicts, from EXPLAIN on MySQL and EXPLAIN QUERY PLAN on SQLite.
+    """
+    sql, params = query.sql()
+    database = query.model._meta.database
+    if mysql_enable == '1':
+        cursor = database.execute_sql(f'EXPLAIN {sql}', params)
+    else:
+        cursor = database.execute_sql(f'EXPLAIN QUERY PLAN {sql}', params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def find_full_scans(plan: list) -> list:
+    """
+    Steps of the plan that read a whole table instead of searching an index.
+    """
+    scans = []
+    # Subquery results the plan builds first, reading them whole is expected
+    derived = {str(step.get('detail', '')).split()[-1] for step in plan if str(step.get('detail', '')).startswith('MATERIALIZE')}
+    for step in plan:
+        if mysql_enable == '1':
+            if str(step.get('type')).upper() == 'ALL' and not str(step.get('table')).startswith('<derived'):
+                scans.append(f"{step.get('table')}: full table scan, {step.get('rows')} rows")
+        else:
+            detail = str(step.get('detail', ''))
+            if detail.startswith('SCAN') and 'INDEX' not in detail and 'CONSTANT ROW' not in detail:
+                if detail.split()[1] not in derived:
+                    scans.append(detail)
+    return scans
+
+
+def audit() -> list:
+    results = []
+    for name, query in hot_queries().items():
+        try:
+            plan = explain(query)
+        except Exception as e:
+            results.append({'name': name, 'plan': [], 'full_scans': [], 'error': str(e)})
+            continue
+        results.append({'name': name, 'plan': plan, 'full_scans': find_full_scans(plan), 'error': ''})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the query plans of hot metric and SMON queries for full table scans')
+    parser.add_argument('--verbose', action='store_true', help='Print the whole plan of every query')
+    args = parser.parse_args()
+
+    failed = 0
+    for result in audit():
+        if result['error']:
+            status = 'ERROR'
+        elif result['full_scans']:
+            status = 'FULL SCAN'
+        else:
+            status = 'OK'
+        print(f"{status:10} {result['name']}")
+        if result['error']:
+            print(f"           {result['error']}")
+        for scan in result['full_scans']:
+            print(f"           {scan}")
+        if args.verbose:
+            for step in result['plan']:
+                print(f"           {step}")
+        if status != 'OK':
+            failed += 1
+
+    if failed:
+        print(f"{failed} queries need attention")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,37 @@
 import uuid
+from datetime import datetime, timedelta
 
-from peewee import fn
+from peewee import fn, Case
 
-from app.modules.db.db_model import SmonAgent, Server, SMON, SmonTcpCheck, SmonHttpCheck, SmonDnsCheck, SmonPingCheck, SmonHistory, SmonStatusPageCheck, SmonStatusPage
+from app.modules.db.db_model import mysql_enable, SmonAgent, Server, SMON, SmonTcpCheck, SmonHttpCheck, SmonDnsCheck, SmonPingCheck, SmonHistory, SmonUptime, SmonHistoryRollup, SmonStatusPageCheck, SmonStatusPage
 from app.modules.db.common import out_error
+from app.modules.db.sql import get_setting
 import app.modules.roxy_wi_tools as roxy_wi_tools
 
+# Rolling uptime windows, in hours
+UPTIME_WINDOWS = {'24h': 24, '7d': 24 * 7, '30d': 24 * 30}
+# Width of the rollup buckets in seconds. Hourly rows are kept for smon_keep_history_range days, daily ones for a year
+HISTORY_HOUR = 3600
+HISTORY_DAY = 86400
+HISTORY_DAILY_KEEP = 365
+HISTORY_ROLLUP_DELAY = 120
+# Rollup rows inserted per statement: 10 columns each stays under the 999 bound variables SQLite allows
+HISTORY_INSERT_BATCH = 90
+_status_version = 0
+
+
+def _bump_status_version() -> None:
+	global _status_version
+	_status_version += 1
+
+
+def get_status_version() -> int:
+	"""
+	Counter that changes whenever a check status or a status page is changed by this process.
+	It is not shared between processes, in other processes the cached pages expire by their TTL.
+	"""
+	return _status_version
+
 
 def get_agents(group_id: int):
 	try:
@@ -163,6 +189,7 @@ def change_status(status, smon_id):
 		out_error(e)
 		return False
 	else:
+		_bump_status_version()
 		return True
 
 
@@ -190,8 +217,65 @@ def insert_smon_history(smon_id: int, resp_time: float, status: int, check_id: i
 	cur_date = get_date.return_date('regular')
 	try:
 		SmonHistory.insert(smon_id=smon_id, response_time=resp_time, status=status, date=cur_date, check_id=check_id, mes=mes).execute()
+		_count_smon_uptime(smon_id, status, cur_date)
+	except Exception as e:
+		out_error(e)
+
+
+def _count_smon_uptime(smon_id: int, status: int, cur_date: str) -> None:
+	"""
+	Add the check result to the uptime counters of its hour.
+	"""
+	hour = cur_date[:13] + ':00:00'
+	up = 1 if int(status) == 1 else 0
+	update = {SmonUptime.total: SmonUptime.total + 1, SmonUptime.up: SmonUptime.up + up}
+	query = SmonUptime.insert(smon_id=smon_id, date=hour, total=1, up=up)
+	if mysql_enable == '1':
+		query = query.on_conflict(update=update)
+	else:
+		query = query.on_conflict(conflict_target=[SmonUptime.smon_id, SmonUptime.date], update=update)
+	query.execute()
+
+
+def smon_uptime_query(smon_ids: list, cur_hour: datetime):
+	"""
+	Total and successful checks of every check for every window of UPTIME_WINDOWS ending with cur_hour.
+	"""
+	fields = [SmonUptime.smon_id]
+	for window, hours in UPTIME_WINDOWS.items():
+		since = cur_hour - timedelta(hours=hours - 1)
+		fields.append(fn.SUM(Case(None, [(SmonUptime.date >= since, SmonUptime.total)], 0)).alias(f'total_{window}'))
+		fields.append(fn.SUM(Case(None, [(SmonUptime.date >= since, SmonUptime.up)], 0)).alias(f'up_{window}'))
+	longest = cur_hour - timedelta(hours=max(UPTIME_WINDOWS.values()) - 1)
+	return (
+		SmonUptime.select(*fields)
+		.where(SmonUptime.smon_id.in_(smon_ids) & (SmonUptime.date >= longest))
+		.group_by(SmonUptime.smon_id)
+	)
+
+
+def get_smon_uptime(smon_ids: list) -> dict:
+	"""
+	Uptime of the checks in percent for every window of UPTIME_WINDOWS, read from the hourly counters.
+
+	:param smon_ids: IDs of the checks
+	:return: {smon_id: {'24h': float, '7d': float, '30d': float}}, 0 for a window without checks
+	"""
+	smon_ids = [int(smon_id) for smon_id in smon_ids]
+	uptime = {smon_id: {window: 0 for window in UPTIME_WINDOWS} for smon_id in smon_ids}
+	if not smon_ids:
+		return uptime
+	cur_hour = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+	try:
+		for row in smon_uptime_query(smon_ids, cur_hour).dicts():
+			smon_id = row['smon_id']
+			for window in UPTIME_WINDOWS:
+				total = row[f'total_{window}'] or 0
+				if total:
+					uptime[smon_id][window] = round((row[f'up_{window}'] or 0) * 100 / total, 2)
 	except Exception as e:
 		out_error(e)
+	return uptime
 
 
 def select_one_smon(smon_id: int, check_id: int) -> tuple:
@@ -324,6 +408,7 @@ def delete_smon(smon_id, user_group):
 		out_error(e)
 		return False
 	else:
+		_bump_status_version()
 		return True
 
 
@@ -359,6 +444,8 @@ def edit_status_page(page_id: int, name: str, slug: str, desc: str) -> None:
 		SmonStatusPage.update(name=name, slug=slug, desc=desc).where(SmonStatusPage.id == page_id).execute()
 	except Exception as e:
 		out_error(e)
+	finally:
+		_bump_status_version()
 
 
 def add_status_page_checks(page_id: int, checks: list) -> None:
@@ -367,6 +454,7 @@ def add_status_page_checks(page_id: int, checks: list) -> None:
 			SmonStatusPageCheck.insert(page_id=page_id, check_id=int(check)).execute()
 		except Exception as e:
 			out_error(e)
+	_bump_status_version()
 
 
 def delete_status_page_checks(page_id: int) -> None:
@@ -374,6 +462,8 @@ def delete_status_page_checks(page_id: int) -> None:
 		SmonStatusPageCheck.delete().where(SmonStatusPageCheck.page_id == page_id).execute()
 	except Exception as e:
 		out_error(e)
+	finally:
+		_bump_status_version()
 
 
 def select_status_pages(group_id: int):
@@ -417,48 +507,87 @@ def delete_status_page(page_id):
 		SmonStatusPage.delete().where(SmonStatusPage.id == page_id).execute()
 	except Exception as e:
 		out_error(e)
+	finally:
+		_bump_status_version()
 
 
-def get_last_smon_status_by_check(smon_id: int) -> object:
-	query = SmonHistory.select().where(
-		SmonHistory.smon_id == smon_id
-	).limit(1).order_by(SmonHistory.date.desc())
+def latest_smon_statuses_query(smon_ids: list):
+	last_dates = (
+		SmonHistory.select(SmonHistory.smon_id, fn.MAX(SmonHistory.date).alias('last_date'))
+		.where(SmonHistory.smon_id.in_(smon_ids))
+		.group_by(SmonHistory.smon_id)
+		.alias('last_dates')
+	)
+	return (
+		SmonHistory.select(
+			SmonHistory.smon_id, SmonHistory.status, SmonHistory.response_time, SmonHistory.check_id, SmonHistory.mes,
+			SmonHistory.date, SMON.time_state
+		)
+		.join(last_dates, on=((SmonHistory.smon_id == last_dates.c.smon_id) & (SmonHistory.date == last_dates.c.last_date)))
+		.switch(SmonHistory)
+		.join(SMON, on=(SmonHistory.smon_id == SMON.id))
+	)
+
+
+def select_latest_smon_statuses(smon_ids: list) -> dict:
+	"""
+	Latest history row of every check with one query.
+
+	:param smon_ids: IDs of the checks
+	:return: {smon_id: {'status', 'response_time', 'check_id', 'mes', 'date', 'time_state'}} for the checks that have
+		history, time_state is the time of the last status change
+	"""
+	smon_ids = [int(smon_id) for smon_id in smon_ids]
+	if not smon_ids:
+		return {}
 	try:
-		query_res = query.execute()
+		return {row['smon_id']: row for row in latest_smon_statuses_query(smon_ids).dicts()}
 	except Exception as e:
 		out_error(e)
-	else:
-		try:
-			for i in query_res:
-				return i.status
-		except Exception:
-			return ''
 
 
-def get_last_smon_res_time_by_check(smon_id: int, check_id: int) -> int:
-	query = SmonHistory.select().where(
+def get_last_smon_status_by_check(smon_id: int) -> object:
+	last = select_latest_smon_statuses([smon_id]).get(int(smon_id))
+	return last['status'] if last else ''
+
+
+def last_smon_res_time_query(smon_id: int, check_id: int):
+	return SmonHistory.select(SmonHistory.response_time).where(
 		(SmonHistory.smon_id == smon_id) &
 		(SmonHistory.check_id == check_id)
-	).limit(1).order_by(SmonHistory.date.desc())
+	).order_by(SmonHistory.date.desc()).limit(1)
+
+
+def get_last_smon_res_time_by_check(smon_id: int, check_id: int) -> int:
 	try:
-		query_res = query.execute()
+		last = last_smon_res_time_query(smon_id, check_id).first()
 	except Exception as e:
 		out_error(e)
 	else:
-		try:
-			for i in query_res:
-				return i.response_time
-		except Exception:
-			return ''
+		return last.response_time if last else ''
+
+
+def select_smons_by_ids(smon_ids: list) -> dict:
+	try:
+		return {smon.id: smon for smon in SMON.select().where(SMON.id.in_([int(i) for i in smon_ids]))}
+	except Exception as e:
+		out_error(e)
+
+
+def smon_history_count_query(smon_id: int, status: int = None):
+	"""
+	Number of the checks in the history of the check, only of those with the status when it is given.
+	"""
+	query = SmonHistory.select(fn.Count(SmonHistory.status)).where(SmonHistory.smon_id == smon_id)
+	if status is not None:
+		query = query.where(SmonHistory.status == status)
+	return query
 
 
 def get_smon_history_count_checks(smon_id: int) -> dict:
 	count_checks = {}
-	query = SmonHistory.select(fn.Count(SmonHistory.status)).where(
-		SmonHistory.smon_id == smon_id
-	)
 	try:
-		query_res = query.execute()
+		query_res = smon_history_count_query(smon_id).execute()
 	except Exception as e:
 		out_error(e)
 	else:
@@ -468,12 +597,8 @@ def get_smon_history_count_checks(smon_id: int) -> dict:
 		except Exception as e:
 			raise Exception(f'error: {e}')
 
-	query = SmonHistory.select(fn.Count(SmonHistory.status)).where(
-		(SmonHistory.smon_id == smon_id) &
-		(SmonHistory.status == 1)
-	)
 	try:
-		query_res = query.execute()
+		query_res = smon_history_count_query(smon_id, status=1).execute()
 	except Exception as e:
 		out_error(e)
 	else:
@@ -500,12 +625,15 @@ def get_smon_service_name_by_id(smon_id: int) -> str:
 			return ''
 
 
-def select_smon_history(smon_id: int) -> object:
-	query = SmonHistory.select().where(
+def smon_history_query(smon_id: int):
+	return SmonHistory.select().where(
 		SmonHistory.smon_id == smon_id
 	).limit(40).order_by(SmonHistory.date.desc())
+
+
+def select_smon_history(smon_id: int) -> object:
 	try:
-		query_res = query.execute()
+		query_res = smon_history_query(smon_id).execute()
 	except Exception as e:
 		out_error(e)
 	else:
@@ -518,6 +646,7 @@ def update_smon(smon_id, name, telegram, slack, pd, mm, group, desc, en):
 	).where(SMON.id == smon_id))
 	try:
 		query.execute()
+		_bump_status_version()
 		return True
 	except Exception as e:
 		out_error(e)
@@ -643,11 +772,181 @@ def count_agents() -> int:
 		out_error(e)
 
 
+def smon_history_retention_query(cur_date: str):
+	return SmonHistory.delete().where(SmonHistory.date < cur_date)
+
+
+def smon_uptime_retention_query(cur_date: str):
+	return SmonUptime.delete().where(SmonUptime.date < cur_date)
+
+
+def smon_history_rollup_retention_query(hour_date: datetime, day_date: datetime):
+	return SmonHistoryRollup.delete().where(
+		((SmonHistoryRollup.resolution == HISTORY_HOUR) & (SmonHistoryRollup.date < hour_date))
+		| ((SmonHistoryRollup.resolution == HISTORY_DAY) & (SmonHistoryRollup.date < day_date))
+	)
+
+
 def delete_smon_history():
 	get_date = roxy_wi_tools.GetDate()
 	cur_date = get_date.return_date('regular', timedelta_minus=1)
-	query = SmonHistory.delete().where(SmonHistory.date < cur_date)
+	uptime_date = get_date.return_date('regular', timedelta_minus=max(UPTIME_WINDOWS.values()) // 24)
 	try:
-		query.execute()
+		smon_history_retention_query(cur_date).execute()
+		smon_uptime_retention_query(uptime_date).execute()
+	except Exception as e:
+		out_error(e)
+	hour_date = datetime.utcnow() - timedelta(days=get_setting('smon_keep_history_range', group_id=1))
+	day_date = datetime.utcnow() - timedelta(days=HISTORY_DAILY_KEEP)
+	try:
+		smon_history_rollup_retention_query(hour_date, day_date).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def _percentile(values: list, percent: int) -> float:
+	"""
+	Nearest-rank percentile of sorted values.
+	"""
+	if not values:
+		return 0
+	rank = -(-len(values) * percent // 100)
+	return values[max(rank, 1) - 1]
+
+
+def _history_watermark(resolution: int, default: datetime) -> datetime:
+	"""
+	End of the last rolled up bucket of the resolution, or default when nothing has been rolled up yet.
+	"""
+	last_date = SmonHistoryRollup.select(fn.MAX(SmonHistoryRollup.date)).where(SmonHistoryRollup.resolution == resolution).scalar()
+	if not last_date:
+		return default
+	if not isinstance(last_date, datetime):
+		last_date = datetime.strptime(str(last_date), '%Y-%m-%d %H:%M:%S')
+	return last_date + timedelta(seconds=resolution)
+
+
+def hour_rollup_source_query(since: datetime, until: datetime):
+	return (
+		SmonHistory.select(SmonHistory.smon_id, SmonHistory.status, SmonHistory.response_time)
+		.where((SmonHistory.date >= since) & (SmonHistory.date < until))
+	)
+
+
+def _hour_rollup_rows(since: datetime, until: datetime) -> list:
+	"""
+	Aggregates of the raw checks of one hour, a row for every check.
+	Response times are taken from the successful checks only, a failed check has no meaningful response time.
+	"""
+	checks = {}
+	for smon_id, status, resp_time in hour_rollup_source_query(since, until).tuples():
+		check = checks.setdefault(smon_id, {'checks': 0, 'up': 0, 'resp': []})
+		check['checks'] += 1
+		if int(status) == 1:
+			check['up'] += 1
+			check['resp'].append(float(resp_time or 0))
+
+	rows = []
+	for smon_id, check in checks.items():
+		resp = sorted(check['resp'])
+		rows.append({
+			'smon_id': smon_id, 'resolution': HISTORY_HOUR, 'date': since, 'checks': check['checks'], 'up': check['up'],
+			'resp_avg': round(sum(resp) / len(resp), 3) if resp else 0,
+			'resp_p50': _percentile(resp, 50), 'resp_p95': _percentile(resp, 95), 'resp_max': resp[-1] if resp else 0,
+		})
+	return rows
+
+
+def _day_rollup_rows(since: datetime, until: datetime) -> list:
+	"""
+	Aggregates of one day built from its hourly rows. Availability, average and max are exact.
+	Raw points are gone by then, so p95 is the highest hourly p95 and p50 is the median of the hourly p50s
+	weighted by the successful checks of every hour.
+	"""
+	hours = {}
+	query = SmonHistoryRollup.select().where(
+		(SmonHistoryRollup.resolution == HISTORY_HOUR) & (SmonHistoryRollup.date >= since) & (SmonHistoryRollup.date < until)
+	)
+	for row in query:
+		hours.setdefault(row.smon_id_id, []).append(row)
+
+	rows = []
+	for smon_id, check_hours in hours.items():
+		up = sum(hour.up for hour in check_hours)
+		p50 = 0
+		seen = 0
+		for hour in sorted(check_hours, key=lambda h: h.resp_p50):
+			seen += hour.up
+			if hour.up and seen * 2 >= up:
+				p50 = hour.resp_p50
+				break
+		rows.append({
+			'smon_id': smon_id, 'resolution': HISTORY_DAY, 'date': since, 'checks': sum(hour.checks for hour in check_hours), 'up': up,
+			'resp_avg': round(sum(hour.resp_avg * hour.up for hour in check_hours) / up, 3) if up else 0,
+			'resp_p50': p50, 'resp_p95': max(hour.resp_p95 for hour in check_hours), 'resp_max': max(hour.resp_max for hour in check_hours),
+		})
+	return rows
+
+
+def rollup_smon_history() -> None:
+	"""
+	Roll finished hours of the raw SMON history into hourly aggregates and finished days into daily ones.
+	A bucket is rolled up once it has been closed for HISTORY_ROLLUP_DELAY seconds, so late checks are not lost.
+	"""
+	now = datetime.utcnow() - timedelta(seconds=HISTORY_ROLLUP_DELAY)
+	tiers = (
+		(HISTORY_HOUR, now.replace(minute=0, second=0, microsecond=0), _hour_rollup_rows),
+		(HISTORY_DAY, now.replace(hour=0, minute=0, second=0, microsecond=0), _day_rollup_rows),
+	)
+	for resolution, until, build_rows in tiers:
+		try:
+			if resolution == HISTORY_HOUR:
+				first_date = SmonHistory.select(fn.MIN(SmonHistory.date)).scalar()
+			else:
+				first_date = SmonHistoryRollup.select(fn.MIN(SmonHistoryRollup.date)).where(SmonHistoryRollup.resolution == HISTORY_HOUR).scalar()
+			if not first_date:
+				continue
+			if not isinstance(first_date, datetime):
+				first_date = datetime.strptime(str(first_date)[:19], '%Y-%m-%d %H:%M:%S')
+			first_date = first_date.replace(minute=0, second=0, microsecond=0)
+			if resolution == HISTORY_DAY:
+				first_date = first_date.replace(hour=0)
+			# Nothing older than the source rows can be rolled up, so gaps in the history are not walked through
+			since = max(_history_watermark(resolution, first_date), first_date)
+			while since < until:
+				bucket_end = since + timedelta(seconds=resolution)
+				rows = build_rows(since, bucket_end)
+				if rows:
+					# Another process may roll up the same bucket at the same time, its rows are kept
+					with SmonHistoryRollup._meta.database.atomic():
+						for i in range(0, len(rows), HISTORY_INSERT_BATCH):
+							SmonHistoryRollup.insert_many(rows[i:i + HISTORY_INSERT_BATCH]).on_conflict_ignore().execute()
+				since = bucket_end
+		except Exception as e:
+			out_error(e)
+
+
+def smon_history_range_query(smon_id: int, resolution: int, since: datetime):
+	return SmonHistoryRollup.select().where(
+		(SmonHistoryRollup.smon_id == smon_id) & (SmonHistoryRollup.resolution == resolution) & (SmonHistoryRollup.date >= since)
+	).order_by(SmonHistoryRollup.date)
+
+
+def select_smon_history_range(smon_id: int, days: int) -> list:
+	"""
+	Rolled up history of the check for the last days, hourly while the hourly rows cover the range and daily beyond.
+
+	:param smon_id: ID of the check
+	:param days: Length of the range in days
+	:return: Rollup rows as dicts ordered by date, availability in percent is added as 'uptime'
+	"""
+	days = int(days)
+	resolution = HISTORY_HOUR if days <= get_setting('smon_keep_history_range', group_id=1) else HISTORY_DAY
+	since = datetime.utcnow() - timedelta(days=days)
+	try:
+		rows = list(smon_history_range_query(smon_id, resolution, since).dicts())
 	except Exception as e:
 		out_error(e)
+	for row in rows:
+		row['uptime'] = round(row['up'] * 100 / row['checks'], 2) if row['checks'] else 0
+	return rows
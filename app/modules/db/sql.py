@@ -1,7 +1,53 @@
-from flask import g
+from flask import g, has_app_context
 
 from app.modules.db.db_model import GeoipCodes, Setting, Role
 from app.modules.db.common import out_error
+from app.modules.common.cache_utils import TTLCache
+
+
+_INT_SETTINGS = frozenset({
+	'nginx_stats_port', 'session_ttl', 'token_ttl', 'haproxy_stats_port', 'haproxy_sock_port', 'ldap_type',
+	'ldap_port', 'ldap_enable', 'log_time_storage', 'syslog_server_enable', 'checker_check_interval', 'port_scan_interval',
+	'smon_keep_history_range', 'checker_keep_history_range', 'portscanner_keep_history_range', 'checker_maxconn_threshold',
+	'apache_stats_port', 'smon_ssl_expire_warning_alert', 'smon_ssl_expire_critical_alert', 'action_keep_history_range',
+	'metrics_1m_keep_history_range', 'metrics_10m_keep_history_range', 'metrics_1h_keep_history_range'
+})
+_settings_cache = TTLCache(ttl=10)
+
+
+def _get_group_settings(group_id: int) -> dict:
+	"""
+	Return all settings of the group as {param: value}. The whole group is loaded with one query and kept
+	for the rest of the request in flask.g and for a few seconds across requests.
+	"""
+	group_id = int(group_id)
+	request_cache = None
+	if has_app_context():
+		request_cache = g.setdefault('_settings', {})
+		if group_id in request_cache:
+			return request_cache[group_id]
+
+	settings = _settings_cache.get(group_id)
+	if settings is None:
+		query = Setting.select(Setting.param, Setting.value).where(Setting.group_id == group_id)
+		try:
+			settings = {setting.param: setting.value for setting in query.execute()}
+		except Exception as e:
+			out_error(e)
+		_settings_cache.set(group_id, settings)
+
+	if request_cache is not None:
+		request_cache[group_id] = settings
+	return settings
+
+
+def invalidate_settings_cache(group_id: int = None) -> None:
+	if group_id is None:
+		_settings_cache.clear()
+	else:
+		_settings_cache.delete(int(group_id))
+	if has_app_context():
+		g.pop('_settings', None)
 
 
 def get_setting(param, **kwargs):
@@ -13,31 +59,23 @@ def get_setting(param, **kwargs):
 		except Exception:
 			user_group_id = 1
 
-	if kwargs.get('all') and not kwargs.get('section'):
-		query = Setting.select().where(Setting.group_id == user_group_id).order_by(Setting.section.desc())
-	elif kwargs.get('section'):
-		query = Setting.select().where((Setting.group_id == user_group_id) & (Setting.section == kwargs.get('section')))
-	else:
-		query = Setting.select().where((Setting.param == param) & (Setting.group_id == user_group_id))
-
-	try:
-		query_res = query.execute()
-	except Exception as e:
-		out_error(e)
-	else:
-		if kwargs.get('all') or kwargs.get('section'):
-			return query_res
+	if kwargs.get('all') or kwargs.get('section'):
+		if kwargs.get('all') and not kwargs.get('section'):
+			query = Setting.select().where(Setting.group_id == user_group_id).order_by(Setting.section.desc())
 		else:
-			for setting in query_res:
-				if param in (
-					'nginx_stats_port', 'session_ttl', 'token_ttl', 'haproxy_stats_port', 'haproxy_sock_port', 'ldap_type',
-					'ldap_port', 'ldap_enable', 'log_time_storage', 'syslog_server_enable', 'checker_check_interval', 'port_scan_interval',
-					'smon_keep_history_range', 'checker_keep_history_range', 'portscanner_keep_history_range', 'checker_maxconn_threshold',
-					'apache_stats_port', 'smon_ssl_expire_warning_alert', 'smon_ssl_expire_critical_alert', 'action_keep_history_range'
-				):
-					return int(setting.value)
-				else:
-					return setting.value
+			query = Setting.select().where((Setting.group_id == user_group_id) & (Setting.section == kwargs.get('section')))
+
+		try:
+			return query.execute()
+		except Exception as e:
+			out_error(e)
+
+	settings = _get_group_settings(user_group_id)
+	if param not in settings:
+		return None
+	if param in _INT_SETTINGS:
+		return int(settings[param])
+	return settings[param]
 
 
 def update_setting(param: str, val: str, user_group: int) -> None:
@@ -46,6 +84,8 @@ def update_setting(param: str, val: str, user_group: int) -> None:
 		query.execute()
 	except Exception as e:
 		out_error(e)
+	finally:
+		invalidate_settings_cache(user_group)
 
 
 def select_roles():
@@ -1,11 +1,64 @@
+import time
+import atexit
+import threading
+from datetime import datetime
+
+import pytz
 from peewee import Case, JOIN
 
 from app.modules.db.db_model import User, UserGroups, Groups
 from app.modules.db.sql import get_setting
 from app.modules.db.common import out_error
+from app.modules.common.cache_utils import TTLCache
 import app.modules.roxy_wi_tools as roxy_wi_tools
 from app.modules.roxywi.exception import RoxywiResourceNotFound
 
+_user_context_cache = TTLCache(ttl=10)
+
+
+def invalidate_user_cache(user_id: int = None) -> None:
+	if user_id is None:
+		_user_context_cache.clear()
+	else:
+		_user_context_cache.delete_where(lambda key: key[0] == int(user_id))
+
+
+def select_user_context(user_id: int, group_id: int) -> dict:
+	"""
+	Return the user fields needed to authorize a request together with the role of the user in the group.
+	The user and the role are read with one query and kept for a few seconds across requests.
+
+	:param user_id: ID of the user
+	:param group_id: Group from the token of the user
+	:return: Dict with user, group_id, enabled, user_services and role, role is None if the user is not in the group
+	"""
+	key = (int(user_id), int(group_id))
+	context = _user_context_cache.get(key)
+	if context is not None:
+		return context
+
+	query = (
+		User.select(User.username, User.group_id, User.enabled, User.user_services, UserGroups.user_role_id)
+		.join(UserGroups, JOIN.LEFT_OUTER, on=((UserGroups.user_id == User.user_id) & (UserGroups.user_group_id == group_id)))
+		.where(User.user_id == user_id)
+		.dicts()
+	)
+	try:
+		row = query.get()
+	except User.DoesNotExist:
+		raise RoxywiResourceNotFound
+	except Exception as e:
+		out_error(e)
+	context = {
+		'user': row['username'],
+		'group_id': row['group_id'],
+		'enabled': int(row['enabled']),
+		'user_services': row['user_services'],
+		'role': None if row['user_role_id'] is None else int(row['user_role_id']),
+	}
+	_user_context_cache.set(key, context)
+	return context
+
 
 def add_user(user, email, password, role, enabled, group):
 	if password != 'aduser':
@@ -30,6 +83,7 @@ def update_user_from_admin_area(user_id, **kwargs):
 		User.update(**kwargs).where(User.user_id == user_id).execute()
 	except Exception as e:
 		out_error(e)
+	invalidate_user_cache(user_id)
 
 
 def delete_user_groups(user_id):
@@ -40,6 +94,7 @@ def delete_user_groups(user_id):
 		out_error(e)
 		return False
 	else:
+		invalidate_user_cache(user_id)
 		return True
 
 
@@ -48,6 +103,7 @@ def update_user_current_groups(group_id: int, user_id: int) -> None:
 		User.update(group_id=group_id).where(User.user_id == user_id).execute()
 	except Exception as e:
 		out_error(e)
+	invalidate_user_cache(user_id)
 
 
 def update_user_current_groups_by_id(groups, user_id):
@@ -56,6 +112,7 @@ def update_user_current_groups_by_id(groups, user_id):
 		user_update.execute()
 	except Exception as e:
 		out_error(e)
+	invalidate_user_cache(user_id)
 
 
 def update_user_password(password, user_id):
@@ -78,6 +135,7 @@ def delete_user(user_id):
 		raise RoxywiResourceNotFound
 	except Exception as e:
 		out_error(e)
+	invalidate_user_cache(user_id)
 
 
 def update_user_role(user_id: int, group_id: int, role_id: int) -> None:
@@ -85,6 +143,7 @@ def update_user_role(user_id: int, group_id: int, role_id: int) -> None:
 		UserGroups.insert(user_id=user_id, user_group_id=group_id, user_role_id=role_id).on_conflict('replace').execute()
 	except Exception as e:
 		out_error(e)
+	invalidate_user_cache(user_id)
 
 
 def select_users(**kwargs):
@@ -181,6 +240,7 @@ def select_users_roles():
 
 
 def update_last_act_user(user_id: int, ip: str) -> None:
+	_activity.discard(user_id)
 	get_date = roxy_wi_tools.GetDate(get_setting('time_zone'))
 	cur_date = get_date.return_date('regular')
 	try:
@@ -189,6 +249,67 @@ def update_last_act_user(user_id: int, ip: str) -> None:
 		out_error(e)
 
 
+class LastActivityTracker:
+	"""
+	Keeps the last activity of users in memory and writes it from a background thread every flush_interval seconds,
+	so a user costs at most one UPDATE per interval however many requests they make.
+	"""
+
+	def __init__(self, flush_interval: float = 60):
+		self.flush_interval = flush_interval
+		self._pending = {}
+		self._lock = threading.Lock()
+		self._flush_lock = threading.Lock()
+		self._thread = None
+		atexit.register(self.flush)
+
+	def touch(self, user_id: int, ip: str) -> None:
+		with self._lock:
+			self._pending[int(user_id)] = (datetime.now(pytz.utc), ip)
+			if self._thread is None or not self._thread.is_alive():
+				self._thread = threading.Thread(target=self._run, name='last-activity', daemon=True)
+				self._thread.start()
+
+	def discard(self, user_id: int) -> None:
+		with self._lock:
+			self._pending.pop(int(user_id), None)
+
+	def flush(self) -> None:
+		with self._flush_lock:
+			with self._lock:
+				pending, self._pending = self._pending, {}
+			if not pending:
+				return
+			try:
+				time_zone = pytz.timezone(get_setting('time_zone') or 'UTC')
+				with User._meta.database.atomic():
+					for user_id, (last_act, ip) in pending.items():
+						cur_date = last_act.astimezone(time_zone).strftime('%Y-%m-%d %H:%M:%S')
+						User.update(last_login_date=cur_date, last_login_ip=ip).where(User.user_id == user_id).execute()
+			except Exception as e:
+				print(f'error: cannot save the last activity of {len(pending)} users: {e}')
+				with self._lock:
+					# A newer activity that came in meanwhile wins over the failed one
+					for user_id, activity in pending.items():
+						self._pending.setdefault(user_id, activity)
+
+	def _run(self) -> None:
+		while True:
+			time.sleep(self.flush_interval)
+			if self._pending:
+				self.flush()
+
+
+_activity = LastActivityTracker()
+
+
+def touch_last_act_user(user_id: int, ip: str) -> None:
+	"""
+	Remember the last activity of the user, it is written to the database within a minute.
+	"""
+	_activity.touch(user_id, ip)
+
+
 def get_user_by_username(username: str) -> User:
 	try:
 		return User.get(User.username == username)
@@ -226,6 +347,7 @@ def update_user_services(services, user_id):
 		out_error(e)
 		return False
 	else:
+		invalidate_user_cache(user_id)
 		return True
 
 
@@ -292,3 +414,4 @@ def delete_user_from_group(group_id: int, user_id):
 		raise RoxywiResourceNotFound
 	except Exception as e:
 		out_error(e)
+	invalidate_user_cache(user_id)
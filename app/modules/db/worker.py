@@ -0,0 +1,98 @@
+from datetime import datetime, timedelta
+
+from peewee import fn, Case
+
+from app.modules.db.db_model import mysql_enable, WorkerHeartbeat
+from app.modules.db.common import out_error
+
+# A worker that has not sent a heartbeat for WORKER_STALE seconds is shown as stale,
+# after WORKER_KEEP_DEAD days it is removed from the registry
+WORKER_STALE = 90
+WORKER_KEEP_DEAD = 1
+
+
+def worker_heartbeat(worker: str, server_ip: str, pid: int, started: datetime = None) -> None:
+	"""
+	Register the worker or refresh its heartbeat. Workers call it every WORKER_STALE / 3 seconds.
+
+	:param worker: Script of the worker, e.g. checker_haproxy or metrics_nginx, the part before "_" is its kind
+	:param server_ip: IP of the server the worker serves
+	:param pid: PID of the worker process
+	:param started: Start time of the worker process in UTC, now for a new worker by default
+	"""
+	now = datetime.utcnow().replace(microsecond=0)
+	update = {WorkerHeartbeat.pid: pid, WorkerHeartbeat.last_heartbeat: now}
+	if started:
+		update[WorkerHeartbeat.started] = started
+	query = WorkerHeartbeat.insert(
+		worker=worker, kind=worker.split('_')[0], server_ip=server_ip, pid=pid, started=started or now, last_heartbeat=now
+	)
+	if mysql_enable == '1':
+		query = query.on_conflict(update=update)
+	else:
+		query = query.on_conflict(conflict_target=[WorkerHeartbeat.worker, WorkerHeartbeat.server_ip], update=update)
+	try:
+		query.execute()
+	except Exception as e:
+		out_error(e)
+
+
+def delete_worker(worker: str, server_ip: str) -> None:
+	"""
+	Remove the worker from the registry, for a worker that stops on purpose.
+	"""
+	try:
+		WorkerHeartbeat.delete().where((WorkerHeartbeat.worker == worker) & (WorkerHeartbeat.server_ip == server_ip)).execute()
+	except Exception as e:
+		out_error(e)
+
+
+def count_workers(server_ips: list = None) -> dict:
+	"""
+	Number of alive and stale workers of every kind, from one grouped query.
+
+	:param server_ips: Count only workers of these servers, all workers by default
+	:return: {kind: {'alive': int, 'stale': int}}, empty if no worker has ever sent a heartbeat
+	"""
+	alive_since = datetime.utcnow() - timedelta(seconds=WORKER_STALE)
+	query = WorkerHeartbeat.select(
+		WorkerHeartbeat.kind,
+		fn.SUM(Case(None, [(WorkerHeartbeat.last_heartbeat >= alive_since, 1)], 0)).alias('alive'),
+		fn.COUNT(WorkerHeartbeat.worker).alias('total')
+	)
+	if server_ips:
+		query = query.where(WorkerHeartbeat.server_ip.in_(server_ips))
+	query = query.group_by(WorkerHeartbeat.kind)
+	try:
+		return {
+			row['kind']: {'alive': int(row['alive'] or 0), 'stale': row['total'] - int(row['alive'] or 0)}
+			for row in query.dicts()
+		}
+	except Exception as e:
+		out_error(e)
+
+
+def select_workers(server_ips: list = None) -> list:
+	"""
+	Workers in the registry with their last heartbeat, the stale ones first.
+	"""
+	alive_since = datetime.utcnow() - timedelta(seconds=WORKER_STALE)
+	query = WorkerHeartbeat.select()
+	if server_ips:
+		query = query.where(WorkerHeartbeat.server_ip.in_(server_ips))
+	query = query.order_by(WorkerHeartbeat.last_heartbeat, WorkerHeartbeat.worker)
+	try:
+		workers = list(query.dicts())
+	except Exception as e:
+		out_error(e)
+	for worker in workers:
+		worker['alive'] = worker['last_heartbeat'] >= alive_since
+	return workers
+
+
+def delete_dead_workers() -> None:
+	cur_date = datetime.utcnow() - timedelta(days=WORKER_KEEP_DEAD)
+	try:
+		WorkerHeartbeat.delete().where(WorkerHeartbeat.last_heartbeat < cur_date).execute()
+	except Exception as e:
+		out_error(e)
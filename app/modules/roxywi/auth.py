@@ -14,21 +14,17 @@ def check_login(user_id: int) -> Union[str, None]:
     if user_id is None:
         return 'login_page'
 
-    if user_sql.get_user_id(user_id) is None:
-        return 'login_page'
-    else:
-        try:
-            ip = request.remote_addr
-        except Exception:
-            ip = ''
+    try:
+        ip = request.remote_addr
+    except Exception:
+        ip = ''
 
-        user_sql.update_last_act_user(user_id, ip)
+    user_sql.touch_last_act_user(user_id, ip)
 
 
 def is_access_permit_to_service(service: str) -> bool:
     service_id = service_sql.select_service_id_by_slug(service)
-    claims = roxywi_common.get_jwt_token_claims()
-    user_services = user_sql.select_user_services(claims['user_id'])
+    user_services = roxywi_common.get_user_context()['user_services']
     if str(service_id) in user_services:
         return True
     else:
@@ -39,12 +35,8 @@ def is_admin(level=1, **kwargs):
     if kwargs.get('role_id'):
         role = kwargs.get('role_id')
     else:
-        claims = roxywi_common.get_jwt_token_claims()
-        user_id = claims['user_id']
-        group_id = claims['group']
-
         try:
-            role = user_sql.get_user_role_in_group(user_id, group_id)
+            role = roxywi_common.get_user_context()['role']
         except Exception:
             role = 4
     try:
@@ -109,6 +101,8 @@ def do_login(user_params: dict, next_url: str):
     response = jsonify({"status": "done", "next_url": redirect_to})
     access_token = create_jwt_token(user_params)
     set_access_cookies(response, access_token)
+    # The login itself is saved right away, later activity goes through the throttled tracker
+    user_sql.update_last_act_user(user_params['user'], request.remote_addr)
 
     return response
 
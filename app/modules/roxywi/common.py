@@ -232,51 +232,83 @@ def get_dick_permit(**kwargs):
 		return []
 
 
-def get_users_params(**kwargs):
-	user_data = get_jwt_token_claims()
+class UserContext(dict):
+	"""
+	Parameters of the user of the current request: user, role, user_services, lang, user_id and group_id.
+	The server list is loaded on the first access to 'servers' with the server filter of the context.
+	"""
+
+	def __init__(self, params: dict, server_filter: dict = None, servers: dict = None):
+		super().__init__(params)
+		self.server_filter = server_filter or {}
+		self._servers = {} if servers is None else servers
+
+	def with_server_filter(self, **kwargs) -> 'UserContext':
+		"""
+		Copy of the context with another server filter. Server lists are shared, so each one is loaded once per request.
+		"""
+		return UserContext(self, kwargs, self._servers)
+
+	def __missing__(self, key):
+		if key != 'servers':
+			raise KeyError(key)
+		filter_key = tuple(sorted(self.server_filter.items()))
+		if filter_key not in self._servers:
+			try:
+				self._servers[filter_key] = server_sql.get_dick_permit(int(self['group_id']), **self.server_filter)
+			except Exception as e:
+				raise Exception(e)
+		return self._servers[filter_key]
+
+
+def get_user_context() -> UserContext:
+	"""
+	Return the context of the user from the token. It is built once per request and kept in flask.g,
+	the user and the role are read through the short-lived cache of user_sql.select_user_context.
+	"""
+	claims = get_jwt_token_claims()
+	key = (int(claims['user_id']), int(claims['group']))
+	context = g.get('_user_context')
+	if context is not None and g.get('_user_context_key') == key:
+		return context
 
 	try:
-		user_id = user_data['user_id']
-		user = user_sql.get_user_id(user_id)
+		user = user_sql.select_user_context(*key)
 	except Exception:
 		raise Exception('error: Cannot get user id')
 
-	if int(user_data['group']) != int(user.group_id):
+	context = UserContext({
+		'user': user['user'],
+		'role': user['role'],
+		'user_services': user['user_services'],
+		'lang': get_user_lang_for_flask(),
+		'user_id': claims['user_id'],
+		'group_id': user['group_id'],
+		'enabled': user['enabled'],
+	})
+	g._user_context = context
+	g._user_context_key = key
+	return context
+
+
+def get_users_params(**kwargs) -> UserContext:
+	user_data = get_jwt_token_claims()
+	user_params = get_user_context()
+
+	if int(user_data['group']) != int(user_params['group_id']):
 		raise Exception('error: Wrong active group')
 
-	try:
-		role = user_sql.get_role_id(user_id, user.group_id)
-	except Exception as e:
-		raise Exception(f'error: Cannot get user role {e}')
-
-	try:
-		user_services = user_sql.select_user_services(user_id)
-	except Exception as e:
-		raise Exception(f'error: Cannot get user services {e}')
+	if user_params['role'] is None:
+		raise Exception('error: Cannot get user role')
 
 	if kwargs.get('virt') and kwargs.get('service') == 'haproxy':
-		servers = get_dick_permit(virt=1, haproxy=1)
+		return user_params.with_server_filter(virt=1, haproxy=1)
 	elif kwargs.get('virt'):
-		servers = get_dick_permit(virt=1)
+		return user_params.with_server_filter(virt=1)
 	elif kwargs.get('disable'):
-		servers = get_dick_permit(disable=0)
+		return user_params.with_server_filter(disable=0)
 	elif kwargs.get('service'):
-		servers = get_dick_permit(service=kwargs.get('service'))
-	else:
-		servers = get_dick_permit()
-
-	user_lang = get_user_lang_for_flask()
-
-	user_params = {
-		'user': user.username,
-		'role': role,
-		'servers': servers,
-		'user_services': user_services,
-		'lang': user_lang,
-		'user_id': user_id,
-		'group_id': user.group_id
-	}
-
+		return user_params.with_server_filter(service=kwargs.get('service'))
 	return user_params
 
 
@@ -0,0 +1,264 @@
+import os
+import json
+import sqlite3
+import logging
+import threading
+from typing import Optional
+from datetime import datetime, timedelta
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    ts TEXT NOT NULL,
+    level TEXT,
+    user_id INTEGER,
+    username TEXT,
+    user_group TEXT,
+    server_ip TEXT,
+    service TEXT,
+    message TEXT,
+    line TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_ts ON entries (ts);
+CREATE INDEX IF NOT EXISTS entries_group ON entries (user_group, id);
+CREATE INDEX IF NOT EXISTS entries_level ON entries (level, id);
+CREATE INDEX IF NOT EXISTS entries_user ON entries (user_id, id);
+CREATE INDEX IF NOT EXISTS entries_server ON entries (server_ip, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(message, content='entries', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, message) VALUES (new.id, new.message);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, message) VALUES ('delete', old.id, old.message);
+END;
+"""
+INSERT = (
+    'INSERT INTO entries (ts, level, user_id, username, user_group, server_ip, service, message, line) '
+    'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'
+)
+BATCH = 500
+
+
+def _entry(data: dict, line: str) -> tuple:
+    return (
+        data.get('timestamp'), data.get('level'), data.get('user_id'), data.get('username'),
+        data.get('user_group'), data.get('server_ip'), data.get('service'), data.get('message'), line
+    )
+
+
+class LogIndex:
+    """
+    SQLite index next to roxy-wi.log. Every record written by the logger is stored with the fields it is searched by,
+    so the log can be queried by time, level, user, group, server and text without reading the log file.
+    Free text is searched with FTS5 where SQLite has it, with LIKE otherwise.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._fts = None
+        self._schema_lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self._schema_lock:
+                conn.executescript(SCHEMA)
+                if self._fts is None:
+                    try:
+                        conn.executescript(FTS_SCHEMA)
+                        self._fts = True
+                    except sqlite3.OperationalError:
+                        self._fts = False
+            self._local.conn = conn
+        return conn
+
+    def add(self, data: dict, line: str) -> None:
+        self._conn().execute(INSERT, _entry(data, line))
+
+    def backfill(self, log_file: str) -> None:
+        """
+        Index the records already written to the log file, once, when the index is created next to an existing log.
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            done = conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone()
+            # An index that has entries already was filled by the logger from the start
+            if done is None and conn.execute('SELECT 1 FROM entries LIMIT 1').fetchone() is None and os.path.isfile(log_file):
+                rows = []
+                with open(log_file, 'r', encoding='utf-8', errors='backslashreplace') as f:
+                    for line in f:
+                        line = line.rstrip('\n')
+                        try:
+                            data = json.loads(line)
+                        except ValueError:
+                            continue
+                        if not isinstance(data, dict) or not data.get('timestamp'):
+                            continue
+                        rows.append(_entry(data, line))
+                        if len(rows) >= BATCH:
+                            conn.executemany(INSERT, rows)
+                            rows = []
+                if rows:
+                    conn.executemany(INSERT, rows)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', ?)", (datetime.utcnow().isoformat(),))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def search(
+            self, since: Optional[datetime] = None, until: Optional[datetime] = None, level: Optional[str] = None,
+            user: Optional[str] = None, group: Optional[str] = None, server_ip: Optional[str] = None,
+            text: Optional[str] = None, before_id: Optional[int] = None, limit: int = 100
+    ) -> list:
+        """
+        Return the newest entries matching all given filters as dicts, newest first.
+
+        :param since: Only entries at or after this UTC time
+        :param until: Only entries before this UTC time
+        :param level: Log level, e.g. ERROR
+        :param user: User name or user ID
+        :param group: Name of the user group
+        :param server_ip: IP of the server the entry is about
+        :param text: Words that must be in the message
+        :param before_id: Only entries older than this entry, for the next page
+        :param limit: Maximum number of entries
+        """
+        where = []
+        params = []
+        if since:
+            where.append('e.ts >= ?')
+            params.append(since.isoformat())
+        if until:
+            where.append('e.ts < ?')
+            params.append(until.isoformat())
+        if level:
+            where.append('e.level = ?')
+            params.append(level.upper())
+        if user:
+            if str(user).isdigit():
+                where.append('e.user_id = ?')
+                params.append(int(user))
+            else:
+                where.append('e.username = ?')
+                params.append(user)
+        if group:
+            where.append('e.user_group = ?')
+            params.append(group)
+        if server_ip:
+            where.append('e.server_ip = ?')
+            params.append(server_ip)
+        if before_id:
+            where.append('e.id < ?')
+            params.append(int(before_id))
+
+        conn = self._conn()
+        sql = 'SELECT e.id, e.ts, e.level, e.user_id, e.username, e.user_group, e.server_ip, e.service, e.message, e.line FROM entries e'
+        if text and self._fts:
+            sql += ' JOIN entries_fts f ON f.rowid = e.id'
+            where.append('entries_fts MATCH ?')
+            # Every word is quoted, so the text is never parsed as FTS query syntax
+            params.append(' '.join('"{}"'.format(word.replace('"', '""')) for word in text.split()))
+        elif text:
+            where.append('e.message LIKE ?')
+            params.append(f'%{text}%')
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY e.id DESC LIMIT ?'
+        params.append(int(limit))
+
+        columns = ('id', 'ts', 'level', 'user_id', 'username', 'user_group', 'server_ip', 'service', 'message', 'line')
+        return [dict(zip(columns, row)) for row in conn.execute(sql, params)]
+
+    def query_lines(
+            self, rows: int = 10, grep: str = None, exgrep: str = None, time_from: str = None, time_to: str = None,
+            cursor: int = None, group: str = None
+    ) -> dict:
+        """
+        Same page as log_reader.query_log for the log file, taken from the index.
+        time_from and time_to are times of day (HH:MM:SS) like in the log viewer, the cursor is an entry ID.
+        grep and exgrep are plain text, as in log_reader.
+        """
+        where = []
+        params = []
+        if group:
+            where.append('user_group = ?')
+            params.append(group)
+        # The time of day is the HH:MM:SS part of the ISO timestamp
+        if time_from:
+            where.append('substr(ts, 12, 8) >= ?')
+            params.append(time_from)
+        if time_to:
+            where.append('substr(ts, 12, 8) <= ?')
+            params.append(time_to)
+        if grep:
+            where.append('instr(line, ?) > 0')
+            params.append(grep)
+        if exgrep:
+            where.append('instr(line, ?) = 0')
+            params.append(exgrep)
+        if cursor:
+            where.append('id < ?')
+            params.append(int(cursor))
+        sql = 'SELECT id, line FROM entries'
+        if where:
+            sql += ' WHERE ' + ' AND '.join(where)
+        sql += ' ORDER BY id DESC LIMIT ?'
+        params.append(int(rows))
+
+        entries = self._conn().execute(sql, params).fetchall()
+        next_cursor = entries[-1][0] if len(entries) == int(rows) else None
+        return {'lines': [line for _id, line in reversed(entries)], 'cursor': next_cursor}
+
+    def prune(self, days: int) -> None:
+        cur_date = datetime.utcnow() - timedelta(days=int(days))
+        self._conn().execute('DELETE FROM entries WHERE ts < ?', (cur_date.isoformat(),))
+
+
+class LogIndexHandler(logging.Handler):
+    """
+    Logging handler that feeds the records to a LogIndex in the same JSON form as they are written to the log file.
+    """
+
+    def __init__(self, index: LogIndex):
+        super().__init__()
+        self.index = index
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            line = self.format(record)
+            self.index.add(json.loads(line), line)
+        except Exception:
+            self.handleError(record)
+
+
+_index = None
+
+
+def setup_index(log_path: str, log_file: str) -> LogIndex:
+    """
+    Create the index of the log file. It is kept in <log name>.index.db, which the log file list does not pick up.
+    """
+    global _index
+    _index = LogIndex(os.path.join(log_path, f'{os.path.splitext(log_file)[0]}.index.db'))
+    try:
+        _index.backfill(os.path.join(log_path, log_file))
+    except Exception as e:
+        print(f'error: cannot index the existing log file: {e}')
+    return _index
+
+
+def get_index() -> Optional[LogIndex]:
+    return _index
+
@@ -0,0 +1,265 @@
+import os
+import re
+import base64
+import shlex
+import subprocess
+
+import app.modules.server.ssh as mod_ssh
+
+CHUNK_SIZE = 65536
+# Every read of a remote log is an SSH command, so they are read in bigger chunks
+REMOTE_CHUNK_SIZE = 1048576
+PROBE_SIZE = 4096
+MAX_LINE = 1048576
+# Bytes one page reads at most. When the filters match less lines than that, the page ends with a cursor
+# to go on from where the search stopped
+MAX_SCAN = 8388608
+_TIME_RE = re.compile(r'(?<!\d)(\d{2}:\d{2}:\d{2})')
+# Day of the timestamps syslog, ISO 8601 and the Apache logs write: "Oct 18", "2024-10-18" or "18/Oct/2024"
+_DAY_RE = re.compile(r'(\d{4}-\d{2}-\d{2}|\d{1,2}/[A-Za-z]{3}/\d{4}|[A-Za-z]{3} +\d{1,2})[T: ]+\d{2}:\d{2}:\d{2}')
+
+
+class LocalLogFile:
+	"""
+	Log file on the Roxy-WI server. With sudo the file is read with "sudo dd", for logs only root can read.
+	"""
+
+	chunk_size = CHUNK_SIZE
+
+	def __init__(self, path: str, sudo: bool = False):
+		self.path = path
+		self.sudo = sudo
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		pass
+
+	def _run(self, cmd: str) -> bytes:
+		p = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		if p.returncode:
+			raise Exception(f"error: {p.stderr.decode('utf-8', errors='backslashreplace').strip()}")
+		return p.stdout
+
+	def size(self) -> int:
+		if self.sudo:
+			return int(self._run(f'sudo stat -c %s {shlex.quote(self.path)}').strip())
+		try:
+			return os.path.getsize(self.path)
+		except OSError as e:
+			raise Exception(f'error: {e}')
+
+	def read(self, offset: int, length: int) -> bytes:
+		if self.sudo:
+			return self._run(
+				f'sudo dd if={shlex.quote(self.path)} iflag=skip_bytes,count_bytes skip={offset} count={length} status=none'
+			)
+		with open(self.path, 'rb') as f:
+			f.seek(offset)
+			return f.read(length)
+
+
+class RemoteLogFile:
+	"""
+	Log file on a server, read with sudo over the pooled SSH connection of the server.
+	Use it as a context manager, so all reads of one query share the connection.
+	"""
+
+	chunk_size = REMOTE_CHUNK_SIZE
+
+	def __init__(self, server_ip: str, path: str, timeout: int = 10):
+		self.server_ip = server_ip
+		self.path = path
+		self.timeout = timeout
+		self._ssh = None
+
+	def __enter__(self):
+		self._ssh = mod_ssh.ssh_connect(self.server_ip).__enter__()
+		return self
+
+	def __exit__(self, exc_type, exc_val, exc_tb):
+		if self._ssh is not None:
+			self._ssh.__exit__(exc_type, exc_val, exc_tb)
+			self._ssh = None
+
+	def _run(self, cmd: str) -> str:
+		stdin, stdout, stderr = self._ssh.run_command(cmd, timeout=self.timeout)
+		stdin.close()
+		output = stdout.read().decode('utf-8', errors='backslashreplace')
+		if stdout.channel.recv_exit_status():
+			raise Exception(f'error: {output.strip()}')
+		return output
+
+	def size(self) -> int:
+		return int(self._run(f'sudo stat -c %s {shlex.quote(self.path)}').strip())
+
+	def read(self, offset: int, length: int) -> bytes:
+		# The command runs in a pty, which rewrites line ends, so the bytes travel as base64
+		output = self._run(
+			f'sudo dd if={shlex.quote(self.path)} iflag=skip_bytes,count_bytes skip={offset} count={length} status=none | base64 -w0'
+		)
+		return base64.b64decode(''.join(output.split()))
+
+
+def line_time(line: str) -> str:
+	"""
+	Time of day of the line as HH:MM:SS, taken from the first timestamp in it, or an empty string.
+	"""
+	match = _TIME_RE.search(line)
+	return match.group(1) if match else ''
+
+
+def line_day(line: str) -> str:
+	"""
+	Day of the first timestamp of the line, as it is written there, or an empty string if the line has no date.
+	"""
+	match = _DAY_RE.search(line)
+	return ' '.join(match.group(1).split()) if match else ''
+
+
+def _first_day(data: bytes) -> str:
+	for line in data.split(b'\n'):
+		day = line_day(line.decode('utf-8', errors='backslashreplace'))
+		if day:
+			return day
+	return ''
+
+
+def _is_single_day(log, end: int) -> bool:
+	"""
+	Whether the first and the last dated lines before end are of the same day. Only then the time of day
+	of the lines grows through the file, and lines can be searched by it.
+	"""
+	first_day = _first_day(log.read(0, min(PROBE_SIZE, end)))
+	if not first_day:
+		return False
+	tail_from = max(0, end - PROBE_SIZE)
+	last_day = ''
+	for line in reversed(log.read(tail_from, end - tail_from).split(b'\n')):
+		last_day = line_day(line.decode('utf-8', errors='backslashreplace'))
+		if last_day:
+			break
+	return first_day == last_day
+
+
+def _lines_backward(log, end: int):
+	"""
+	Yield (offset, line) for the lines before the end offset, the newest first, reading chunk_size bytes of the log
+	at a time.
+	"""
+	pos = end
+	rest = b''
+	while pos > 0:
+		read_from = max(0, pos - log.chunk_size)
+		data = log.read(read_from, pos - read_from) + rest
+		pos = read_from
+		lines = data.split(b'\n')
+		# The first piece may be the end of a line that starts in the previous chunk
+		rest = lines.pop(0)
+		offset = pos + len(rest) + 1
+		found = []
+		for line in lines:
+			found.append((offset, line))
+			offset += len(line) + 1
+		for found_line in reversed(found):
+			yield found_line
+		if len(rest) > MAX_LINE:
+			yield pos, rest
+			rest = b''
+	if rest:
+		yield 0, rest
+
+
+def _find_end(log, end: int, time_to: str) -> int:
+	"""
+	Offset before which all lines later than time_to end, found by binary search over probes of PROBE_SIZE bytes.
+	The lines are expected in time order, as log files are written, and of one day, see _is_single_day.
+	"""
+	lo, hi = 0, end
+	while hi - lo > PROBE_SIZE:
+		mid = (lo + hi) // 2
+		chunk = log.read(mid, PROBE_SIZE)
+		first_line = chunk.find(b'\n')
+		if first_line == -1:
+			break
+		line_start = mid + first_line + 1
+		probe_time = ''
+		for line in chunk[first_line + 1:].split(b'\n')[:-1]:
+			probe_time = line_time(line.decode('utf-8', errors='backslashreplace'))
+			if probe_time:
+				break
+		if not probe_time or line_start >= hi:
+			break
+		if probe_time > time_to:
+			hi = line_start
+		else:
+			lo = line_start
+	return hi
+
+
+def query_log(
+		log, rows: int = 10, grep: str = None, exgrep: str = None, time_from: str = None, time_to: str = None,
+		cursor: int = None, must_contain: str = None
+) -> dict:
+	"""
+	Return the last lines of the log that match the filters, reading the file from its end.
+
+	:param log: LocalLogFile or RemoteLogFile
+	:param rows: Number of lines to return
+	:param grep: Text the lines must contain
+	:param exgrep: Text the lines must not contain
+	:param time_from: Lines with a time of day (HH:MM:SS) before this are skipped. In a log of one day the search
+		stops at the first one, in a log of several days the lines of every day are searched
+	:param time_to: Lines with a time of day (HH:MM:SS) after this are skipped
+	:param cursor: Offset returned with the previous page, to get the lines before it
+	:param must_contain: Plain string the lines must contain
+	:return: {'lines': lines in file order, 'cursor': offset for the previous page or None at the start of the file}
+	"""
+	include = _compile(grep)
+	exclude = _compile(exgrep)
+	with log:
+		end = log.size()
+		if cursor is not None:
+			end = min(int(cursor), end)
+		single_day = (time_from or time_to) and end > PROBE_SIZE and _is_single_day(log, end)
+		if single_day and time_to and time_to < '23:59:59':
+			end = _find_end(log, end, time_to)
+
+		lines = []
+		next_cursor = None
+		for offset, raw_line in _lines_backward(log, end):
+			if end - offset > MAX_SCAN:
+				next_cursor = offset + len(raw_line) + 1
+				break
+			line = raw_line.decode('utf-8', errors='backslashreplace').rstrip('\r')
+			if not line:
+				continue
+			if time_from or time_to:
+				cur_time = line_time(line)
+				if cur_time and time_to and cur_time > time_to:
+					continue
+				if cur_time and time_from and cur_time < time_from:
+					if single_day:
+						break
+					continue
+			if must_contain and must_contain not in line:
+				continue
+			if include and not include.search(line):
+				continue
+			if exclude and exclude.search(line):
+				continue
+			lines.append(line)
+			if len(lines) >= int(rows):
+				next_cursor = offset or None
+				break
+
+	lines.reverse()
+	return {'lines': lines, 'cursor': next_cursor}
+
+
+def _compile(pattern: str):
+	# The filters are plain text: a regular expression from the user could take forever to match (ReDoS)
+	if not pattern:
+		return None
+	return re.compile(re.escape(pattern))
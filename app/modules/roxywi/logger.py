@@ -7,6 +7,8 @@ from datetime import datetime
 
 from flask import request, has_request_context
 
+from app.modules.roxywi.log_index import LogIndexHandler, setup_index
+
 # Define log levels
 DEBUG = logging.DEBUG
 INFO = logging.INFO
@@ -101,6 +103,15 @@ def setup_logger(
     file_handler.setFormatter(StructuredLogFormatter())
     logger.addHandler(file_handler)
 
+    # Index the records next to the log file, so the log can be searched without reading the file
+    try:
+        index_handler = LogIndexHandler(setup_index(log_path, log_file))
+        index_handler.setLevel(log_level)
+        index_handler.setFormatter(StructuredLogFormatter())
+        logger.addHandler(index_handler)
+    except Exception as e:
+        print(f'error: cannot create the log index: {e}')
+
     # Add console handler if requested
     if console_logging:
         console_handler = logging.StreamHandler(sys.stdout)
@@ -1,9 +1,14 @@
+from datetime import datetime
+
 import app.modules.db.sql as sql
 import app.modules.common.common as common
 import app.modules.server.server as server_mod
 from app.modules.common.common import checkAjaxInput
 import app.modules.roxy_wi_tools as roxy_wi_tools
+import app.modules.roxywi.auth as roxywi_auth
 import app.modules.roxywi.common as roxywi_common
+import app.modules.roxywi.log_reader as log_reader
+import app.modules.roxywi.log_index as log_index
 
 get_config_var = roxy_wi_tools.GetConfigVar()
 
@@ -11,12 +16,21 @@ get_config_var = roxy_wi_tools.GetConfigVar()
 def roxy_wi_log() -> list:
 	log_path = get_config_var.get_config_var('main', 'log_path')
 	user_group_id = roxywi_common.get_user_group(id=1)
+	index = log_index.get_index()
 
 	if user_group_id != 1:
 		user_group = roxywi_common.get_user_group()
 		group_grep = f'|grep "group: {user_group}"'
 	else:
+		user_group = None
 		group_grep = ''
+
+	if index is not None:
+		try:
+			return [entry['line'] for entry in index.search(group=user_group, limit=10)]
+		except Exception as e:
+			print(f'error: cannot search the log index: {e}')
+
 	cmd = f"find {log_path}/roxy-wi.log -type f -exec stat --format '%Y :%y %n' '{{}}' \; | sort -nr | cut -d: -f2- " \
 			f"| head -1 |awk '{{print $4}}' |xargs tail {group_grep}|sort -r"
 	try:
@@ -26,6 +40,34 @@ def roxy_wi_log() -> list:
 		return ['']
 
 
+def search_roxy_log(
+		since: str = None, until: str = None, level: str = None, user: str = None, group: str = None,
+		server_ip: str = None, text: str = None, cursor: int = None, rows: int = 100
+) -> dict:
+	"""
+	Search the own log of Roxy-WI in its index. Only superAdmins can search entries of other groups.
+	since and until are UTC times in ISO format.
+	"""
+	index = log_index.get_index()
+	if index is None:
+		raise Exception('error: the log index is not available')
+	if not roxywi_auth.is_admin(level=1):
+		group = roxywi_common.get_user_group()
+	try:
+		since = datetime.fromisoformat(since) if since else None
+		until = datetime.fromisoformat(until) if until else None
+	except ValueError as e:
+		raise Exception(f'error: wrong time: {e}')
+	rows = min(int(rows or 100), 1000)
+	entries = index.search(
+		since=since, until=until, level=level, user=user, group=group, server_ip=server_ip, text=text,
+		before_id=cursor, limit=rows
+	)
+	for entry in entries:
+		del entry['line']
+	return {'entries': entries, 'cursor': entries[-1]['id'] if len(entries) == rows else None}
+
+
 def show_log(stdout, **kwargs):
 	i = 0
 	out = ''
@@ -43,24 +85,34 @@ def show_log(stdout, **kwargs):
 	return out
 
 
-def show_roxy_log(
-		serv, rows='10', waf=0, grep=None, exgrep=None, hour='00',
-		minute='00', hour1='24', minute1='00', service='haproxy', log_file='123', **kwargs
-) -> str:
-	date = checkAjaxInput(hour) + ':' + checkAjaxInput(minute)
-	date1 = checkAjaxInput(hour1) + ':' + checkAjaxInput(minute1)
-	rows = checkAjaxInput(rows)
-	cmd = ''
-	awk_column = 3
-	grep_act = ''
-	exgrep_act = ''
-
+def render_log_page(page: dict, grep: str = None):
+	"""
+	Yield the lines of a log page as HTML, with a link to the older lines first when there are more.
+	"""
+	if page['cursor'] is not None:
+		yield f'<div class="log-older"><a href="#" onclick="loadOlderLog({page["cursor"]}); return false;">...</a></div>'
 	if grep:
-		grep = checkAjaxInput(grep)
-		grep_act = f"|grep '{grep}'"
+		grep = common.sanitize_input_word(grep)
+	for i, line in enumerate(page['lines'], start=1):
+		if grep:
+			line = common.highlight_word(line, grep)
+		line_class = "line3" if i % 2 == 0 else "line"
+		yield common.wrap_line(line, line_class)
+
 
-	if exgrep:
-		exgrep_act = '|egrep -v "%s"' % checkAjaxInput(exgrep)
+def query_roxy_log(
+		serv, rows='10', waf=0, grep=None, exgrep=None, hour='00',
+		minute='00', hour1='24', minute1='00', service='haproxy', log_file='123', cursor=None, **kwargs
+) -> dict:
+	"""
+	Read a page of the log with log_reader, from the end of the file and without loading the whole file.
+	Logs of services are read over the pooled SSH connection of the server (or of the syslog server), the own logs of
+	Roxy-WI locally.
+	"""
+	time_from = f'{checkAjaxInput(hour or "00")}:{checkAjaxInput(minute or "00")}:00'
+	time_to = f'{checkAjaxInput(hour1 or "24")}:{checkAjaxInput(minute1 or "00")}:00'
+	rows = int(checkAjaxInput(rows))
+	must_contain = None
 
 	if log_file is not None:
 		log_file = checkAjaxInput(log_file)
@@ -72,72 +124,67 @@ def show_roxy_log(
 		syslog_server_enable = sql.get_setting('syslog_server_enable')
 		if syslog_server_enable is None or syslog_server_enable == 0:
 			local_path_logs = sql.get_setting(f'{service}_path_logs')
-			if service == 'nginx':
-				commands = "sudo cat %s/%s |tail -%s %s %s" % (local_path_logs, log_file, rows, grep_act, exgrep_act)
-			elif service == 'apache':
-				commands = "sudo cat %s/%s| awk -F\"/|:\" '$3>\"%s:00\" && $3<\"%s:00\"' |tail -%s %s %s" % (local_path_logs, log_file, date, date1, rows, grep_act, exgrep_act)
-			elif service == 'keepalived':
-				commands = "sudo cat %s/%s| awk '$3>\"%s:00\" && $3<\"%s:00\"' |tail -%s %s %s" % (local_path_logs, log_file, date, date1, rows, grep_act, exgrep_act)
-			else:
-				commands = "sudo cat %s/%s| awk '$3>\"%s:00\" && $3<\"%s:00\"' |tail -%s %s %s" % (local_path_logs, log_file, date, date1, rows, grep_act, exgrep_act)
-
+			log_path = f'{local_path_logs}/{log_file}'
 			syslog_server = serv
+			if service == 'nginx':
+				time_from = time_to = None
 		else:
 			if '..' in serv: raise Exception('error: nice try')
 
-			commands = "sudo cat /var/log/%s/syslog.log | sed '/ %s:00/,/ %s:00/! d' |tail -%s %s %s %s" % (serv, date, date1, rows, grep_act, grep, exgrep_act)
+			log_path = f'/var/log/{serv}/syslog.log'
 			syslog_server = sql.get_setting('syslog_server')
 			if syslog_server is None or syslog_server == '':
 				raise Exception('error: Syslog server is enabled, but there is no IP for syslog server')
 
 		if waf and service == 'haproxy':
-			local_path_logs = '/var/log/waf.log'
-			commands = "sudo cat %s |tail -%s %s %s" % (local_path_logs, rows, grep_act, exgrep_act)
+			log_path = '/var/log/waf.log'
+			time_from = time_to = None
 
-		if kwargs.get('html') == 0:
-			a = server_mod.ssh_command(syslog_server, commands)
-			return show_log(a, html=0, grep=grep)
-		else:
-			return server_mod.ssh_command(syslog_server, commands, show_log='1', grep=grep, timeout=10)
+		log = log_reader.RemoteLogFile(syslog_server, log_path)
 	elif service == 'apache_internal':
 		apache_log_path = sql.get_setting('apache_log_path')
 
-		if serv == 'roxy-wi.access.log':
-			cmd = 'sudo cat {}| awk -F"/|:" \'$3>"{}:00" && $3<"{}:00"\' |tail -{} {} {}'.format(apache_log_path + "/" + serv, date, date1, rows, grep_act, exgrep_act)
-		elif serv == 'roxy-wi.error.log':
-			cmd = "sudo cat {}| awk '$4>\"{}:00\" && $4<\"{}:00\"' |tail -{} {} {}".format(apache_log_path + "/" + serv, date, date1, rows, grep_act, exgrep_act)
+		if serv in ('roxy-wi.access.log', 'roxy-wi.error.log'):
+			log = log_reader.LocalLogFile(f'{apache_log_path}/{serv}', sudo=True)
 		elif serv == 'fail2ban.log':
-			cmd = 'sudo cat {}| awk -F"/|:" \'$3>"{}:00" && $3<"{}:00\' |tail -{} {} {}'.format("/var/log/" + serv, date, date1, rows, grep_act, exgrep_act)
-
-		output, stderr = server_mod.subprocess_execute(cmd)
-
-		return show_log(output, grep=grep)
+			log = log_reader.LocalLogFile(f'/var/log/{serv}', sudo=True)
+		else:
+			return {'lines': [], 'cursor': None}
 	elif service == 'internal':
 		log_path = get_config_var.get_config_var('main', 'log_path')
 		logs_files = roxywi_common.get_files(log_path, "log")
 		user_group = roxywi_common.get_user_group()
-		user_grep = ''
 
 		if user_group != '' and user_group != 'Default':
-			user_grep = f"|grep 'group: {user_group}'"
+			must_contain = f'group: {user_group}'
+		else:
+			user_group = None
 
 		for key, value in logs_files:
 			if int(serv) == key:
 				serv = value
 				break
 		else:
-			return 'Haha'
+			return {'lines': [], 'cursor': None}
 
-		if serv == 'backup.log':
-			awk_column = 2
+		index = log_index.get_index()
+		if serv == 'roxy-wi.log' and index is not None:
+			# Entries of the group are found by the group field of the index, not by searching the lines
+			return index.query_lines(
+				rows=rows, grep=grep, exgrep=exgrep, time_from=time_from, time_to=time_to, cursor=cursor,
+				group=user_group
+			)
+
+		log = log_reader.LocalLogFile(f'{log_path}/{serv}')
+	else:
+		return {'lines': [], 'cursor': None}
+
+	return log_reader.query_log(
+		log, rows=rows, grep=grep, exgrep=exgrep, time_from=time_from, time_to=time_to, cursor=cursor,
+		must_contain=must_contain
+	)
 
-		if serv == 'roxy-wi.log':
-			cmd = (f"awk -F'\"' -v t_start=\"{date}:00\" -v t_end=\"{date1}:00\" '{{for(i=1;i<NF;i++) if($i==\"timestamp\"){{split($(i+2),d,\"T\"); "
-				   f"if(d[2]>=t_start && d[2]<=t_end) print; break}}}}' {log_path}/roxy-wi.log"
-				   f"{user_grep} {grep_act} {exgrep_act} |tail -{rows}")
-		else:
-			cmd = f"cat {log_path}/{serv}| awk '${awk_column}>\"{date}:00\" && ${awk_column}<\"{date1}:00\"' {user_grep} {grep_act} {exgrep_act} |tail -{rows}"
-		output, stderr = server_mod.subprocess_execute(cmd)
 
-		return show_log(output, grep=grep)
-	return ''
+def show_roxy_log(serv, grep=None, **kwargs) -> str:
+	page = query_roxy_log(serv, grep=grep, **kwargs)
+	return ''.join(render_log_page(page, grep))
@@ -1,3 +1,5 @@
+from datetime import datetime
+
 import psutil
 
 import app.modules.db.metric as metric_sql
@@ -43,84 +45,47 @@ def show_cpu_metrics(server_ip: str) -> dict:
     return metrics
 
 
+def _chart_data(server_ip: str, service: str, time_range: int, series: dict) -> dict:
+    """
+    Chart data in columns: one array of numbers per series and one slot per time bucket. A bucket of the array
+    i starts at start + i * step (epoch seconds, UTC), tz_offset moves it to the user time zone. Buckets without
+    samples are null. Every value is the peak of its bucket, so short spikes stay visible.
+    """
+    since, step = metric_sql.bucket_window(time_range)
+    start = int((since - metric_sql.EPOCH).total_seconds())
+    count = max(0, (int((datetime.utcnow() - metric_sql.EPOCH).total_seconds()) - start) // step + 1)
+    chart_data = {name: [None] * count for name in series}
+
+    for i in metric_sql.select_metrics_buckets(server_ip, service, time_range):
+        index = (int((i['date'] - metric_sql.EPOCH).total_seconds()) - start) // step
+        if 0 <= index < count:
+            for name, column in series.items():
+                chart_data[name][index] = i[f'{column}_max']
+
+    chart_data['start'] = start
+    chart_data['step'] = step
+    chart_data['tz_offset'] = common.get_time_zone_offset()
+    return {'chartData': chart_data}
+
+
 def haproxy_metrics(server_ip: str, hostname: str, time_range: int) -> dict:
-    metric = metric_sql.select_metrics(server_ip, 'haproxy', time_range=time_range)
-    metrics = {'chartData': {}}
-    metrics['chartData']['labels'] = {}
-    labels = ''
-    curr_con = ''
-    curr_ssl_con = ''
-    sess_rate = ''
-    server = ''
-
-    for i in metric:
-        label = i['date']
-        metric_time = common.get_time_zoned_date(label, '%H:%M:%S')
-        label = metric_time
-        labels += label + ','
-        curr_con += str(i['curr_con']) + ','
-        curr_ssl_con += str(i['cur_ssl_con']) + ','
-        sess_rate += str(i['sess_rate']) + ','
-        server = str(i['serv'])
-
-    metrics['chartData']['labels'] = labels
-    metrics['chartData']['curr_con'] = curr_con
-    metrics['chartData']['curr_ssl_con'] = curr_ssl_con
-    metrics['chartData']['sess_rate'] = sess_rate
-    metrics['chartData']['server'] = hostname + ' (' + server + ')'
+    series = {'curr_con': 'curr_con', 'curr_ssl_con': 'cur_ssl_con', 'sess_rate': 'sess_rate'}
+    metrics = _chart_data(server_ip, 'haproxy', time_range, series)
+    metrics['chartData']['server'] = f'{hostname} ({server_ip})'
 
     return metrics
 
 
 def haproxy_http_metrics(server_ip: str, hostname: str, time_range: int) -> dict:
-    metric = metric_sql.select_metrics(server_ip, 'http_metrics', time_range=time_range)
-    metrics = {'chartData': {}}
-    metrics['chartData']['labels'] = {}
-    labels = ''
-    http_2xx = ''
-    http_3xx = ''
-    http_4xx = ''
-    http_5xx = ''
-    server = ''
-
-    for i in metric:
-        label = i['date']
-        metric_time = common.get_time_zoned_date(label, '%H:%M:%S')
-        label = metric_time
-        labels += label + ','
-        http_2xx += str(i['ok_ans']) + ','
-        http_3xx += str(i['redir_ans']) + ','
-        http_4xx += str(i['not_found_ans']) + ','
-        http_5xx += str(i['err_ans']) + ','
-        server = str(i['serv'])
-
-    metrics['chartData']['labels'] = labels
-    metrics['chartData']['http_2xx'] = http_2xx
-    metrics['chartData']['http_3xx'] = http_3xx
-    metrics['chartData']['http_4xx'] = http_4xx
-    metrics['chartData']['http_5xx'] = http_5xx
-    metrics['chartData']['server'] = f'{hostname} ({server})'
+    series = {'http_2xx': 'ok_ans', 'http_3xx': 'redir_ans', 'http_4xx': 'not_found_ans', 'http_5xx': 'err_ans'}
+    metrics = _chart_data(server_ip, 'http_metrics', time_range, series)
+    metrics['chartData']['server'] = f'{hostname} ({server_ip})'
 
     return metrics
 
 
 def service_metrics(server_ip: str, hostname: str, service: str, time_range: int) -> dict:
-    metric = metric_sql.select_metrics(server_ip, service, time_range=time_range)
-
-    metrics = {'chartData': {}}
-    metrics['chartData']['labels'] = {}
-    labels = ''
-    curr_con = ''
-
-    for i in metric:
-        label = i['date']
-        metric_time = common.get_time_zoned_date(label, '%H:%M:%S')
-        label = metric_time
-        labels += label + ','
-        curr_con += str(i['conn']) + ','
-
-    metrics['chartData']['labels'] = labels
-    metrics['chartData']['curr_con'] = curr_con
+    metrics = _chart_data(server_ip, service, time_range, {'curr_con': 'conn'})
     metrics['chartData']['server'] = f'{hostname} ({server_ip})'
 
     return metrics
@@ -1,3 +1,7 @@
+import os
+import socket
+from datetime import datetime
+
 import psutil
 import requests
 from flask import render_template, request
@@ -7,13 +11,19 @@ import app.modules.db.waf as waf_sql
 import app.modules.db.roxy as roxy_sql
 import app.modules.db.user as user_sql
 import app.modules.db.metric as metric_sql
+import app.modules.db.worker as worker_sql
 import app.modules.db.server as server_sql
 import app.modules.db.checker as checker_sql
 import app.modules.common.common as common
 import app.modules.tools.common as tools_common
 import app.modules.roxywi.common as roxywi_common
 import app.modules.server.server as server_mod
-import app.modules.service.common as service_common
+import app.modules.config.runtime_client as runtime_client
+from app.modules.common.cache_utils import TTLCache
+
+# The process table is scanned at most this often, by the heartbeat job or by the overview
+WORKER_SCAN_TTL = 30
+_worker_scan = TTLCache(ttl=WORKER_SCAN_TTL)
 
 
 def user_owv() -> str:
@@ -63,25 +73,18 @@ def show_overview(serv) -> str:
         waf_len = 0
 
     if haproxy:
-        cmd = f'echo "show info" |nc {server.ip} {sql.get_setting("haproxy_sock_port")} -w 1|grep -e "Process_num"'
         try:
-            haproxy_process = service_common.server_status(server_mod.subprocess_execute(cmd))
+            haproxy_process = runtime_client.get_client(server.ip).show_info().get('Process_num', 1)
+        except runtime_client.RuntimeApiError:
+            haproxy_process = 0
         except Exception as e:
             return f'error: {e} for server {server.hostname}'
 
     if nginx:
-        nginx_cmd = f'echo "something" |nc {server.ip} {sql.get_setting("nginx_stats_port")} -w 1'
-        try:
-            nginx_process = service_common.server_status(server_mod.subprocess_execute(nginx_cmd))
-        except Exception as e:
-            return f'error: {e} for server {server.hostname}'
+        nginx_process = _is_port_open(server.ip, sql.get_setting('nginx_stats_port'))
 
     if apache:
-        apache_cmd = f'echo "something" |nc {server.ip} {sql.get_setting("apache_stats_port")} -w 1'
-        try:
-            apache_process = service_common.server_status(server_mod.subprocess_execute(apache_cmd))
-        except Exception as e:
-            return f'error: {e} for server {server.hostname}'
+        apache_process = _is_port_open(server.ip, sql.get_setting('apache_stats_port'))
 
     if keepalived:
         command = "ps ax |grep keepalived|grep -v grep|wc -l|tr -d '\n'"
@@ -108,25 +111,19 @@ def show_overview(serv) -> str:
     return render_template('ajax/overview.html', service_status=servers_sorted, role=role, lang=lang)
 
 
+def _is_port_open(server_ip: str, port: int) -> int:
+    try:
+        with socket.create_connection((server_ip, int(port)), timeout=1):
+            return 1
+    except OSError:
+        return 0
+
+
 def show_haproxy_binout(server_ip: str) -> str:
-    port = sql.get_setting('haproxy_sock_port')
+    stats = runtime_client.get_client(server_ip).show_stat()
     bin_bout = []
-    cmd = "echo 'show stat' |nc {} {} |cut -d ',' -f 1-2,9|grep -E '[0-9]'|awk -F',' '{{sum+=$3;}}END{{print sum;}}'".format(
-        server_ip, port)
-    bit_in, stderr = server_mod.subprocess_execute(cmd)
-    bin_bout.append(bit_in[0])
-    cmd = "echo 'show stat' |nc {} {} |cut -d ',' -f 1-2,10|grep -E '[0-9]'|awk -F',' '{{sum+=$3;}}END{{print sum;}}'".format(
-        server_ip, port)
-    bout, stderr1 = server_mod.subprocess_execute(cmd)
-    bin_bout.append(bout[0])
-    cmd = "echo 'show stat' |nc {} {} |cut -d ',' -f 1-2,5|grep -E '[0-9]'|awk -F',' '{{sum+=$3;}}END{{print sum;}}'".format(
-        server_ip, port)
-    cin, stderr2 = server_mod.subprocess_execute(cmd)
-    bin_bout.append(cin[0])
-    cmd = "echo 'show stat' |nc {} {} |cut -d ',' -f 1-2,8|grep -E '[0-9]'|awk -F',' '{{sum+=$3;}}END{{print sum;}}'".format(
-        server_ip, port)
-    cout, stderr3 = server_mod.subprocess_execute(cmd)
-    bin_bout.append(cout[0])
+    for column in ('bin', 'bout', 'scur', 'stot'):
+        bin_bout.append(sum(int(row[column]) for row in stats if row.get(column, '').isdigit()))
     lang = roxywi_common.get_user_lang_for_flask()
 
     return render_template('ajax/bin_bout.html', bin_bout=bin_bout, serv=server_ip, service='haproxy', lang=lang)
@@ -182,23 +179,16 @@ def show_apache_bytes(server_ip: str) -> str:
         raise Exception('Cannot connect to Apache stat page')
 
 
-def show_services_overview():
-    user_params = roxywi_common.get_users_params()
+def _worker_processes() -> dict:
+    """
+    Checker and metrics workers and grafana processes in the process table: {'workers': [(worker, server_ip, pid, started)],
+    'grafana': count}. The scan is cached for WORKER_SCAN_TTL seconds.
+    """
+    processes = _worker_scan.get('processes')
+    if processes is not None:
+        return processes
+    workers = []
     grafana = 0
-    metrics_worker = 0
-    checker_worker = 0
-    servers_group = []
-    host = request.host
-    user_group = roxywi_common.get_user_group(id=1)
-    lang = roxywi_common.get_user_lang_for_flask()
-
-    if (user_params['role'] == 2 or user_params['role'] == 3) and int(user_group) != 1:
-        for s in user_params['servers']:
-            servers_group.append(s[2])
-
-    is_checker_worker = len(checker_sql.select_all_alerts(user_group))
-    is_metrics_worker = len(metric_sql.select_servers_metrics_for_master(user_group))
-
     for pids in psutil.pids():
         if pids < 300:
             continue
@@ -206,39 +196,102 @@ def show_services_overview():
             pid = psutil.Process(pids)
             cmdline_out = pid.cmdline()
             if len(cmdline_out) > 2:
-                if 'checker_' in cmdline_out[1]:
-                    if len(servers_group) > 0:
-                        if cmdline_out[2] in servers_group:
-                            checker_worker += 1
-                    else:
-                        checker_worker += 1
-                elif 'metrics_' in cmdline_out[1]:
-                    if len(servers_group) > 0:
-                        if cmdline_out[2] in servers_group:
-                            metrics_worker += 1
-                    else:
-                        metrics_worker += 1
-                if len(servers_group) == 0:
-                    if 'grafana' in cmdline_out[1]:
-                        grafana += 1
+                script = os.path.basename(cmdline_out[1])
+                if script.startswith(('checker_', 'metrics_')):
+                    started = datetime.utcfromtimestamp(pid.create_time()).replace(microsecond=0)
+                    workers.append((os.path.splitext(script)[0], cmdline_out[2], pids, started))
+                elif 'grafana' in cmdline_out[1]:
+                    grafana += 1
         except psutil.NoSuchProcess:
             pass
+    processes = {'workers': workers, 'grafana': grafana}
+    _worker_scan.set('processes', processes)
+    return processes
+
 
-    roxy_tools = roxy_sql.get_roxy_tools()
-    roxy_tools_status = {}
-    for tool in roxy_tools:
-        if tool == 'roxy-wi-prometheus-exporter':
+def _scan_worker_processes(servers_group: list) -> tuple:
+    """
+    Count checker and metrics workers and grafana from the process table, for workers that do not send heartbeats.
+    """
+    processes = _worker_processes()
+    metrics_worker = 0
+    checker_worker = 0
+    for worker, server_ip, _pid, _started in processes['workers']:
+        if servers_group and server_ip not in servers_group:
             continue
-        status = tools_common.is_tool_active(tool)
-        roxy_tools_status.setdefault(tool, status)
+        if worker.startswith('checker_'):
+            checker_worker += 1
+        else:
+            metrics_worker += 1
+    grafana = 0 if servers_group else processes['grafana']
+    return grafana, metrics_worker, checker_worker
+
+
+def publish_worker_heartbeats() -> None:
+    """
+    Send the heartbeats of the checker and metrics workers running on this server to the worker registry.
+    A worker that has stopped is not refreshed any more, so the overview shows it as stale.
+    """
+    _worker_scan.delete('processes')
+    for worker, server_ip, pid, started in _worker_processes()['workers']:
+        worker_sql.worker_heartbeat(worker, server_ip, pid, started)
+
+
+def _get_servers_group(user_params: dict, user_group: int) -> list:
+    servers_group = []
+    if (user_params['role'] == 2 or user_params['role'] == 3) and int(user_group) != 1:
+        for s in user_params['servers']:
+            servers_group.append(s[2])
+    return servers_group
+
+
+def show_services_overview():
+    user_params = roxywi_common.get_users_params()
+    grafana = 0
+    host = request.host
+    user_group = roxywi_common.get_user_group(id=1)
+    lang = roxywi_common.get_user_lang_for_flask()
+    servers_group = _get_servers_group(user_params, user_group)
+
+    is_checker_worker = len(checker_sql.select_all_alerts(user_group))
+    is_metrics_worker = len(metric_sql.select_servers_metrics_for_master(user_group))
+
+    workers = worker_sql.count_workers(servers_group)
+    if workers:
+        checker_worker = workers.get('checker', {}).get('alive', 0)
+        metrics_worker = workers.get('metrics', {}).get('alive', 0)
+        checker_stale = workers.get('checker', {}).get('stale', 0)
+        metrics_stale = workers.get('metrics', {}).get('stale', 0)
+        if not servers_group:
+            grafana = _worker_processes()['grafana']
+    else:
+        grafana, metrics_worker, checker_worker = _scan_worker_processes(servers_group)
+        checker_stale = metrics_stale = 0
+
+    roxy_tools = [tool for tool in roxy_sql.get_roxy_tools() if tool != 'roxy-wi-prometheus-exporter']
+    roxy_tools_status = tools_common.get_tools_status(roxy_tools)
 
     return render_template(
         'ajax/show_services_ovw.html', role=user_params['role'], roxy_tools_status=roxy_tools_status, grafana=grafana,
         is_checker_worker=is_checker_worker, is_metrics_worker=is_metrics_worker, host=host,
-        checker_worker=checker_worker, metrics_worker=metrics_worker, lang=lang
+        checker_worker=checker_worker, metrics_worker=metrics_worker, checker_stale=checker_stale,
+        metrics_stale=metrics_stale, lang=lang
     )
 
 
+def show_workers() -> list:
+    """
+    Checker and metrics workers from the registry with their last heartbeat, limited to the servers of the user group.
+    """
+    user_params = roxywi_common.get_users_params()
+    user_group = roxywi_common.get_user_group(id=1)
+    workers = worker_sql.select_workers(_get_servers_group(user_params, user_group))
+    for worker in workers:
+        for field in ('started', 'last_heartbeat'):
+            worker[field] = common.get_time_zoned_date(worker[field])
+    return workers
+
+
 def keepalived_became_master(server_ip) -> str:
     commands = "sudo kill -USR2 $(cat /var/run/keepalived.pid) && sudo grep 'Became master' /tmp/keepalived.stats |awk '{print $3}'"
     became_master = server_mod.ssh_command(server_ip, commands)
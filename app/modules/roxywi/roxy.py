@@ -13,7 +13,20 @@ import app.modules.roxywi.common as roxywi_common
 import app.modules.server.server as server_mod
 
 
+_in_docker = None
+
+
 def is_docker() -> bool:
+	"""
+	Whether Roxy-WI runs in a container. That cannot change while the process lives, so it is detected once.
+	"""
+	global _in_docker
+	if _in_docker is None:
+		_in_docker = _detect_docker()
+	return _in_docker
+
+
+def _detect_docker() -> bool:
 	path = "/proc/self/cgroup"
 	if not os.path.isfile(path):
 		return False
@@ -1,7 +1,10 @@
 import json
 import os
+import time
+from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor, wait
 
-from flask import render_template
+from flask import render_template, g, request, current_app, has_app_context, has_request_context
 
 import app.modules.db.sql as sql
 import app.modules.db.waf as waf_sql
@@ -12,6 +15,7 @@ import app.modules.db.service as service_sql
 import app.modules.db.history as history_sql
 import app.modules.db.portscanner as ps_sql
 import app.modules.server.ssh as mod_ssh
+from app.modules.server.ssh_connection import pool as ssh_pool
 import app.modules.common.common as common
 import app.modules.roxywi.common as roxywi_common
 
@@ -54,6 +58,94 @@ def ssh_command(server_ip: str, commands: str, **kwargs):
 		roxywi_common.handle_exceptions(e, server_ip, '')
 
 
+FAN_OUT_WORKERS = 10
+
+
+def _bind_flask_context(func: Callable) -> Callable:
+	"""
+	Wrap func so it runs in a worker thread with the current app context and a copy of g.
+	Every call of this function makes its own request context from the WSGI environ of the current request,
+	so call it once per task, in the request thread. The request context of the request itself is never pushed
+	in a worker, as popping it there would run the teardown of the request that is still running.
+	"""
+	if not has_app_context():
+		return func
+	app = current_app._get_current_object()
+	g_values = dict(vars(g))
+	environ = dict(request.environ) if has_request_context() else None
+
+	def wrapper(*args, **kwargs):
+		with app.app_context():
+			vars(g).update(g_values)
+			if environ is None:
+				return func(*args, **kwargs)
+			with app.request_context(environ):
+				return func(*args, **kwargs)
+	return wrapper
+
+
+def fan_out(hosts: list, action: Callable[[str], Any], max_workers: int = FAN_OUT_WORKERS, deadline: float = None) -> dict:
+	"""
+	Run action(host) for every host in a bounded thread pool.
+
+	One task is started per host, so a host never gets more than one task at a time; the SSH pool additionally caps
+	the channels per host.
+
+	:param hosts: IPs of the servers. Duplicates are run once.
+	:param action: Callable taking the IP of the server.
+	:param max_workers: How many hosts are processed at the same time.
+	:param deadline: Seconds to wait for all hosts. Hosts that are not finished by then are reported as 'timeout'.
+	:return: {host: {'status': 'ok' | 'failed' | 'timeout', 'output': Any, 'error': str, 'elapsed': float}} in the order of hosts.
+	"""
+	hosts = list(dict.fromkeys(host for host in hosts if host))
+	results = {host: {'status': 'timeout', 'output': None, 'error': 'Deadline exceeded', 'elapsed': 0.0} for host in hosts}
+	if not hosts:
+		return results
+
+	def run(host: str) -> None:
+		start = time.monotonic()
+		try:
+			output = action(host)
+		except Exception as e:
+			results[host] = {'status': 'failed', 'output': None, 'error': str(e), 'elapsed': time.monotonic() - start}
+		else:
+			results[host] = {'status': 'ok', 'output': output, 'error': '', 'elapsed': time.monotonic() - start}
+
+	executor = ThreadPoolExecutor(max_workers=min(max_workers, len(hosts)), thread_name_prefix='fan_out')
+	try:
+		futures = {}
+		for host in hosts:
+			# A context of its own for every task, made here in the request thread
+			futures[executor.submit(_bind_flask_context(run), host)] = host
+		done, _not_done = wait(futures, timeout=deadline)
+	finally:
+		executor.shutdown(wait=False, cancel_futures=True)
+	for future in done:
+		# run() catches the errors of action, this is what failed around it, e.g. pushing the context
+		error = future.exception()
+		if error is not None:
+			results[futures[future]] = {'status': 'failed', 'output': None, 'error': str(error), 'elapsed': 0.0}
+	return results
+
+
+def ssh_command_many(hosts: list, commands: str, deadline: float = None, **kwargs) -> dict:
+	"""
+	Run ssh_command on several servers at once. See fan_out() for the result format.
+	"""
+	return fan_out(hosts, lambda host: ssh_command(host, commands, **kwargs), deadline=deadline)
+
+
+def upload_many(hosts: list, path: str, file: str, deadline: float = None) -> dict:
+	"""
+	Upload a local file to the same path on several servers at once. See fan_out() for the result format.
+	"""
+	def upload(host: str) -> None:
+		with mod_ssh.ssh_connect(host) as ssh:
+			ssh.put_sftp(file, path)
+
+	return fan_out(hosts, upload, deadline=deadline)
+
+
 def subprocess_execute(cmd):
 	import subprocess
 	p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, shell=True, universal_newlines=True, errors='backslashreplace')
@@ -482,6 +574,8 @@ def delete_server(server_id: int) -> None:
 		server_sql.delete_system_info(server_id)
 		service_sql.delete_service_settings(server_id)
 		roxywi_common.logging(server.ip, f'The server {server.hostname} has been deleted', login=1)
+		ssh_pool.close_host(server.ip)
+		mod_ssh.invalidate_ssh_cache(server.ip)
 		os.system(f'ssh-keygen -R {server.ip}')
 
 
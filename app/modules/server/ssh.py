@@ -1,5 +1,7 @@
 import os
 import base64
+import hashlib
+import threading
 from cryptography.fernet import Fernet
 
 from flask import render_template
@@ -9,6 +11,7 @@ import app.modules.db.cred as cred_sql
 import app.modules.db.group as group_sql
 import app.modules.db.server as server_sql
 from app.modules.server import ssh_connection
+from app.modules.common.cache_utils import TTLCache
 from app.modules.db.db_model import Cred
 import app.modules.roxywi.common as roxywi_common
 import app.modules.roxy_wi_tools as roxy_wi_tools
@@ -17,9 +20,29 @@ from app.modules.roxywi.class_models import IdResponse, IdDataResponse, CredRequ
 get_config = roxy_wi_tools.GetConfigVar()
 
 
-def return_ssh_keys_path(server_ip: str) -> dict:
+_ssh_settings_cache = TTLCache(ttl=300)
+_key_files = {}
+_key_files_lock = threading.Lock()
+
+
+def return_ssh_keys_path(server_ip: str, cred_id: int = None) -> dict:
+	"""
+	Return decrypted SSH settings for the server. The result is cached per (server_ip, cred_id)
+	until it expires or invalidate_ssh_cache() is called.
+	:param server_ip: IP of the server
+	:param cred_id: Use these credentials instead of the ones assigned to the server
+	:return: dict with enabled, user, password, key, passphrase and port
+	"""
+	cache_key = (server_ip, cred_id)
+	ssh_settings = _ssh_settings_cache.get(cache_key)
+	if ssh_settings is not None and (not ssh_settings['key'] or os.path.isfile(ssh_settings['key'])):
+		return dict(ssh_settings)
+
 	ssh_settings = {}
-	sshs = cred_sql.select_ssh(serv=server_ip)
+	if cred_id:
+		sshs = cred_sql.select_ssh(id=cred_id)
+	else:
+		sshs = cred_sql.select_ssh(serv=server_ip)
 
 	for ssh in sshs:
 		if ssh.password:
@@ -53,7 +76,18 @@ def return_ssh_keys_path(server_ip: str) -> dict:
 	except Exception as e:
 		raise Exception(f'error: Cannot get SSH port: {e}')
 
-	return ssh_settings
+	_ssh_settings_cache.set(cache_key, ssh_settings)
+	return dict(ssh_settings)
+
+
+def invalidate_ssh_cache(server_ip: str = None) -> None:
+	"""
+	Drop cached SSH settings. Without server_ip the whole cache is dropped, since one credential is shared by many servers.
+	"""
+	if server_ip:
+		_ssh_settings_cache.delete_where(lambda key: key[0] == server_ip)
+	else:
+		_ssh_settings_cache.clear()
 
 
 def ssh_connect(server_ip):
@@ -114,6 +148,8 @@ def upload_ssh_key(ssh_id: int, key: str, passphrase: str) -> None:
 	except Exception as e:
 		raise Exception(e)
 
+	invalidate_ssh_cache()
+
 	roxywi_common.logging("Roxy-WI server", "A new SSH cert has been uploaded", roxywi=1, login=1)
 
 
@@ -126,6 +162,7 @@ def update_ssh_key(body: CredRequest, group_id: int, ssh_id: int) -> None:
 
 	try:
 		cred_sql.update_ssh(ssh_id, body.name, body.key_enabled, group_id, body.username, body.password, body.shared)
+		invalidate_ssh_cache()
 		roxywi_common.logging('Roxy-WI server', f'The SSH credentials {body.name} has been updated ', roxywi=1, login=1)
 	except Exception as e:
 		raise Exception(e)
@@ -140,8 +177,11 @@ def delete_ssh_key(ssh_id: int) -> None:
 			os.remove(ssh_key_name)
 		except Exception:
 			pass
+		with _key_files_lock:
+			_key_files.pop(ssh_key_name, None)
 	try:
 		cred_sql.delete_ssh(ssh_id)
+		invalidate_ssh_cache()
 		roxywi_common.logging('Roxy-WI server', f'The SSH credentials {sshs.name} has deleted', roxywi=1, login=1)
 	except Exception as e:
 		raise e
@@ -218,23 +258,31 @@ def _return_correct_ssh_file(cred: CredRequest, ssh_id: int = None) -> str:
 	else:
 		key_file = f'{lib_path}/keys/{cred.name}.pem'
 
-	if not ssh_id:
-		ssh_id = cred.id
-
 	try:
-		private_key = cred_sql.get_ssh(ssh_id).private_key
+		private_key = getattr(cred, 'private_key', None)
+		if ssh_id or not private_key:
+			private_key = cred_sql.get_ssh(ssh_id or cred.id).private_key
 		private_key = decrypt_password(private_key)
 		private_key = private_key.strip()
-		private_key = f'{private_key}\n'
+		private_key = f'{private_key}\n'.encode()
 	except Exception as e:
 		raise e
 
-	with open(key_file, 'wb') as key:
-		key.write(private_key.encode())
+	key_hash = hashlib.sha256(private_key).hexdigest()
+	with _key_files_lock:
+		if key_file not in _key_files and os.path.isfile(key_file):
+			with open(key_file, 'rb') as key:
+				_key_files[key_file] = hashlib.sha256(key.read()).hexdigest()
+		if _key_files.get(key_file) == key_hash and os.path.isfile(key_file):
+			return key_file
 
-	try:
-		os.chmod(key_file, 0o600)
-	except IOError as e:
-		raise Exception(e)
+		with open(key_file, 'wb') as key:
+			key.write(private_key)
+
+		try:
+			os.chmod(key_file, 0o600)
+		except IOError as e:
+			raise Exception(e)
+		_key_files[key_file] = key_hash
 
 	return key_file
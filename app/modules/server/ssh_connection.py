@@ -1,13 +1,202 @@
+import time
 import select
+import hashlib
+import threading
 
 import paramiko
 
 
+class _PooledTransport:
+    """One authenticated SSH client per host, shared by every caller."""
+
+    def __init__(self, server_ip: str, fingerprint: str, client: paramiko.SSHClient, max_sessions: int):
+        self.server_ip = server_ip
+        self.fingerprint = fingerprint
+        self.client = client
+        self.sessions = threading.BoundedSemaphore(max_sessions)
+        self.in_use = 0
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+    def is_alive(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self) -> None:
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class SshConnectionPool:
+    """
+    Keeps one SSH transport per server and multiplexes channels over it.
+
+    Callers borrow a session slot with acquire() and give it back with release(). The transport stays
+    open between calls, is kept alive with SSH keepalives, is reopened when it dies and is closed after
+    idle_timeout seconds without users.
+    """
+
+    def __init__(self, max_sessions_per_host: int = 8, idle_timeout: int = 300, keepalive: int = 30, acquire_timeout: int = 30):
+        self.max_sessions_per_host = max_sessions_per_host
+        self.idle_timeout = idle_timeout
+        self.keepalive = keepalive
+        self.acquire_timeout = acquire_timeout
+        self._entries = {}
+        self._host_locks = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'opens': 0, 'reconnects': 0, 'evictions': 0, 'failures': 0}
+
+    @staticmethod
+    def fingerprint(connect_kwargs: dict) -> str:
+        """
+        Fingerprint of the connection settings. A host is reconnected when its credentials change.
+        """
+        parts = [str(connect_kwargs.get(k)) for k in ('hostname', 'port', 'username', 'password', 'key_filename', 'passphrase')]
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+    def _host_lock(self, server_ip: str) -> threading.Lock:
+        with self._lock:
+            return self._host_locks.setdefault(server_ip, threading.Lock())
+
+    def _inc(self, stat: str) -> None:
+        with self._lock:
+            self._stats[stat] += 1
+
+    def _open(self, server_ip: str, fingerprint: str, connect_kwargs: dict) -> _PooledTransport:
+        client = paramiko.SSHClient()
+        client.load_system_host_keys()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        try:
+            client.connect(**connect_kwargs)
+        except Exception:
+            client.close()
+            self._inc('failures')
+            raise
+        client.get_transport().set_keepalive(self.keepalive)
+        self._inc('opens')
+        return _PooledTransport(server_ip, fingerprint, client, self.max_sessions_per_host)
+
+    def acquire(self, server_ip: str, connect_kwargs: dict) -> _PooledTransport:
+        """
+        Borrow a session slot on the transport for server_ip, opening or reopening the transport if needed.
+        """
+        self.evict_idle()
+        fingerprint = self.fingerprint(connect_kwargs)
+        with self._host_lock(server_ip):
+            entry = self._entries.get(server_ip)
+            if entry is not None and entry.fingerprint == fingerprint and entry.is_alive():
+                self._inc('hits')
+            else:
+                if entry is not None:
+                    self._drop(entry)
+                    self._inc('reconnects')
+                entry = self._open(server_ip, fingerprint, connect_kwargs)
+                self._entries[server_ip] = entry
+
+        if not entry.sessions.acquire(timeout=self.acquire_timeout):
+            raise paramiko.SSHException(f'{server_ip} Too many concurrent SSH sessions')
+        with self._lock:
+            entry.in_use += 1
+            entry.last_used = time.monotonic()
+        return entry
+
+    def release(self, entry: _PooledTransport) -> None:
+        """
+        Return a session slot. Dead transports are dropped so the next acquire() reconnects.
+        """
+        with self._lock:
+            entry.in_use -= 1
+            entry.last_used = time.monotonic()
+            orphaned = self._entries.get(entry.server_ip) is not entry
+        entry.sessions.release()
+        if orphaned:
+            if entry.in_use == 0:
+                entry.close()
+        elif not entry.is_alive():
+            with self._host_lock(entry.server_ip):
+                self._drop(entry)
+
+    def reconnect(self, entry: _PooledTransport, connect_kwargs: dict) -> _PooledTransport:
+        """
+        Replace a broken transport while keeping the caller's session slot.
+        """
+        with self._host_lock(entry.server_ip):
+            current = self._entries.get(entry.server_ip)
+            if current is not None and current is not entry and current.is_alive():
+                new_entry = current
+            else:
+                self._drop(entry)
+                new_entry = self._open(entry.server_ip, entry.fingerprint, connect_kwargs)
+                self._entries[entry.server_ip] = new_entry
+            self._inc('reconnects')
+        self.release(entry)
+        if not new_entry.sessions.acquire(timeout=self.acquire_timeout):
+            raise paramiko.SSHException(f'{entry.server_ip} Too many concurrent SSH sessions')
+        with self._lock:
+            new_entry.in_use += 1
+            new_entry.last_used = time.monotonic()
+        return new_entry
+
+    def _drop(self, entry: _PooledTransport) -> None:
+        with self._lock:
+            if self._entries.get(entry.server_ip) is entry:
+                del self._entries[entry.server_ip]
+            in_use = entry.in_use
+        if in_use == 0:
+            entry.close()
+
+    def evict_idle(self) -> None:
+        """
+        Close transports that have not been used for idle_timeout seconds.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                e for e in self._entries.values()
+                if e.in_use == 0 and (now - e.last_used > self.idle_timeout or not e.is_alive())
+            ]
+            for entry in idle:
+                del self._entries[entry.server_ip]
+                self._stats['evictions'] += 1
+        for entry in idle:
+            entry.close()
+
+    def close_host(self, server_ip: str) -> None:
+        """
+        Close the transport of a server, e.g. after it has been deleted or its credentials changed.
+        """
+        with self._host_lock(server_ip):
+            entry = self._entries.get(server_ip)
+            if entry is not None:
+                self._drop(entry)
+                self._inc('evictions')
+
+    def close_all(self) -> None:
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.close()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats['hosts'] = len(self._entries)
+            stats['sessions_in_use'] = sum(e.in_use for e in self._entries.values())
+            stats['max_sessions_per_host'] = self.max_sessions_per_host
+            stats['idle_timeout'] = self.idle_timeout
+        return stats
+
+
+pool = SshConnectionPool()
+
+
 class SshConnection:
     def __init__(self, server_ip: str, ssh_settings: dict):
-        self.ssh = paramiko.SSHClient()
-        self.ssh.load_system_host_keys()
-        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.ssh = None
+        self._pooled = None
         self.server_ip = server_ip
         self.ssh_port = ssh_settings['port']
         self.ssh_user_name = ssh_settings['user']
@@ -16,8 +205,7 @@ class SshConnection:
         self.ssh_key_name = ssh_settings['key']
         self.ssh_passphrase = ssh_settings['passphrase']
 
-    # noinspection PyExceptClausesOrder
-    def __enter__(self):
+    def _connect_kwargs(self) -> dict:
         kwargs = {
             'hostname': self.server_ip,
             'port': self.ssh_port,
@@ -32,8 +220,12 @@ class SshConnection:
                 kwargs.setdefault('passphrase', self.ssh_passphrase)
         else:
             kwargs.setdefault('password', self.ssh_user_password)
+        return kwargs
+
+    # noinspection PyExceptClausesOrder
+    def __enter__(self):
         try:
-            self.ssh.connect(**kwargs)
+            self._pooled = pool.acquire(self.server_ip, self._connect_kwargs())
         except paramiko.AuthenticationException:
             raise paramiko.SSHException(f'{self.server_ip} Authentication failed, please verify your credentials')
         except paramiko.SSHException as sshException:
@@ -49,10 +241,24 @@ class SshConnection:
                 raise paramiko.SSHException(f'{self.server_ip} Check the IP of the server')
             else:
                 raise paramiko.SSHException(f'{self.server_ip} {e}')
+        self.ssh = self._pooled.client
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.ssh.close()
+        if self._pooled is not None:
+            pool.release(self._pooled)
+            self._pooled = None
+
+    def _reconnect(self) -> None:
+        try:
+            self._pooled = pool.reconnect(self._pooled, self._connect_kwargs())
+        except Exception as e:
+            self._pooled = None
+            raise paramiko.SSHException(f'{self.server_ip} Unable to re-establish SSH connection: {e}')
+        self.ssh = self._pooled.client
+
+    def _is_alive(self) -> bool:
+        return self._pooled is not None and self._pooled.is_alive()
 
     def run_command(self, command, **kwargs):
         if kwargs.get('timeout'):
@@ -62,16 +268,31 @@ class SshConnection:
         try:
             stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True, timeout=timeout)
         except Exception as e:
-            raise paramiko.SSHException(str(e))
+            if self._is_alive():
+                raise paramiko.SSHException(str(e))
+            self._reconnect()
+            try:
+                stdin, stdout, stderr = self.ssh.exec_command(command, get_pty=True, timeout=timeout)
+            except Exception as e:
+                raise paramiko.SSHException(str(e))
 
         return stdin, stdout, stderr
 
-    def get_sftp(self, config_path, cfg):
+    def _open_sftp(self) -> paramiko.SFTPClient:
+        try:
+            return self.ssh.open_sftp()
+        except Exception as e:
+            if self._is_alive():
+                raise paramiko.SSHException(str(e))
+        self._reconnect()
         try:
-            sftp = self.ssh.open_sftp()
+            return self.ssh.open_sftp()
         except Exception as e:
             raise paramiko.SSHException(str(e))
 
+    def get_sftp(self, config_path, cfg):
+        sftp = self._open_sftp()
+
         try:
             sftp.get(config_path, cfg)
         except Exception as e:
@@ -84,10 +305,7 @@ class SshConnection:
             raise paramiko.SSHException(str(e))
 
     def put_sftp(self, file, full_path):
-        try:
-            sftp = self.ssh.open_sftp()
-        except Exception as e:
-            raise paramiko.SSHException(str(e))
+        sftp = self._open_sftp()
 
         try:
             sftp.put(file, full_path)
@@ -100,7 +318,7 @@ class SshConnection:
             raise paramiko.SSHException(str(e))
 
     def remove_sftp(self, full_path):
-        sftp = self.ssh.open_sftp()
+        sftp = self._open_sftp()
         sftp.remove(full_path)
         sftp.close()
 
@@ -157,4 +375,3 @@ class SshConnection:
             # close all the pseudofiles
             stdout.close()
             stderr.close()
-            self.ssh.close()
@@ -8,6 +8,7 @@ import app.modules.db.sql as sql
 import app.modules.server.server as server_mod
 import app.modules.config.config as config_mod
 import app.modules.config.common as config_common
+import app.modules.config.section as section_mod
 import app.modules.roxywi.common as roxywi_common
 
 
@@ -62,7 +63,7 @@ def show_map(serv: str, group_id: int) -> str:
         return f'error: Cannot read import config file {error}'
 
     try:
-        conf = open(cfg, "r")
+        parsed = section_mod.load_config(cfg)
     except IOError as e:
         return f'error: Cannot read import config file {e}'
 
@@ -71,62 +72,62 @@ def show_map(serv: str, group_id: int) -> str:
     line_new2 = [1, ""]
     sections = {'listens': dict(), 'backends': dict()}
 
-    for line in conf:
-        if line.startswith('listen') or line.startswith('frontend'):
-            if "stats" not in line:
+    for section in parsed.sections:
+        for line in section.lines:
+            if line.startswith('listen') or line.startswith('frontend'):
+                if "stats" not in line:
+                    node = line
+            if line.find("backend") == 0:
                 node = line
-        if line.find("backend") == 0:
-            node = line
-            node = node.split('\n')[0]
-            sections['backends'][node] = {'servers': dict()}
-
-        if "bind" in line or (line.startswith('listen') and ":" in line) or (
-                line.startswith('frontend') and ":" in line):
-            try:
-                if "@" not in line:
-                    bind = line.split(":")
-                else:
-                    bind = line.split("@")
-                if str(stats_port) not in bind[1]:
-                    bind[1] = bind[1].strip(' ')
-                    bind = bind[1].split("crt")
-                    node = node.strip(' \t\n\r')
-                    node = node + ":" + bind[0]
-                    node = node.split('\n')[0]
-                    sections['listens'][node] = {'servers': dict()}
-            except Exception:
-                pass
-
-        if "server " in line or "use_backend" in line or "default_backend" in line and "stats" not in line and "#" not in line:
-            if "timeout" not in line and "default-server" not in line and "#" not in line and "stats" not in line:
-                if "check" in line:
-                    line_new = line.split("check")
-                else:
-                    line_new = line.split("if ")
-                if "server" in line:
-                    line_new1 = line_new[0].split("server")
-                    line_new[0] = line_new1[1]
-                    line_new2 = line_new[0].split(":")
-                    line_new[0] = line_new2[0]
-
-                line_new[0] = line_new[0].strip(' \t\n\r')
+                node = node.split('\n')[0]
+                sections['backends'][node] = {'servers': dict()}
 
+            if "bind" in line or (line.startswith('listen') and ":" in line) or (
+                    line.startswith('frontend') and ":" in line):
                 try:
-                    backend_server_port = line_new2[1].strip(' \t\n\r')
-                    backend_server_port = 'port: ' + backend_server_port
-                except Exception:
-                    backend_server_port = ''
-
-                try:
-                    sections['listens'][node]['servers'][line_new[0]] = {line_new[0]: backend_server_port}
+                    if "@" not in line:
+                        bind = line.split(":")
+                    else:
+                        bind = line.split("@")
+                    if str(stats_port) not in bind[1]:
+                        bind[1] = bind[1].strip(' ')
+                        bind = bind[1].split("crt")
+                        node = node.strip(' \t\n\r')
+                        node = node + ":" + bind[0]
+                        node = node.split('\n')[0]
+                        sections['listens'][node] = {'servers': dict()}
                 except Exception:
                     pass
 
-                try:
-                    sections['backends'][node]['servers'][line_new[0]] = {line_new[0]: backend_server_port}
-                except Exception:
-                    pass
-    conf.close()
+            if "server " in line or "use_backend" in line or "default_backend" in line and "stats" not in line and "#" not in line:
+                if "timeout" not in line and "default-server" not in line and "#" not in line and "stats" not in line:
+                    if "check" in line:
+                        line_new = line.split("check")
+                    else:
+                        line_new = line.split("if ")
+                    if "server" in line:
+                        line_new1 = line_new[0].split("server")
+                        line_new[0] = line_new1[1]
+                        line_new2 = line_new[0].split(":")
+                        line_new[0] = line_new2[0]
+
+                    line_new[0] = line_new[0].strip(' \t\n\r')
+
+                    try:
+                        backend_server_port = line_new2[1].strip(' \t\n\r')
+                        backend_server_port = 'port: ' + backend_server_port
+                    except Exception:
+                        backend_server_port = ''
+
+                    try:
+                        sections['listens'][node]['servers'][line_new[0]] = {line_new[0]: backend_server_port}
+                    except Exception:
+                        pass
+
+                    try:
+                        sections['backends'][node]['servers'][line_new[0]] = {line_new[0]: backend_server_port}
+                    except Exception:
+                        pass
     os.remove(cfg)
 
     i, k, j = 0, 0, 0
@@ -3,7 +3,7 @@ import json
 import random
 import threading
 from datetime import datetime
-from typing import Union, Literal
+from typing import Union
 from packaging import version
 
 import ansible
@@ -163,32 +163,6 @@ def generate_haproxy_inv(json_data: ServiceInstall, installed_service: str) -> o
 	return inv, server_ips
 
 
-def generate_section_inv(json_data: dict, cfg: str, service: Literal['haproxy', 'nginx']) -> dict:
-	cert_path = sql.get_setting('cert_path')
-	service_dir = sql.get_setting(f'{service}_dir')
-	inv = {"server": {"hosts": {}}}
-	inv['server']['hosts']['localhost'] = {
-		"config": json_data,
-		"cert_path": cert_path,
-		"service_dir": service_dir,
-		"cfg": cfg,
-		"action": 'create'
-	}
-	return inv
-
-
-def generate_section_inv_for_del(cfg: str, section_type: str, section_name: str) -> dict:
-	config = {'type': section_type, 'name': section_name}
-	inv = {"server": {"hosts": {}}}
-	inv['server']['hosts']['localhost'] = {
-		"config": config,
-		"cfg": cfg,
-		"action": 'delete'
-	}
-
-	return inv
-
-
 def generate_service_inv(json_data: ServiceInstall, installed_service: str) -> object:
 	inv = {"server": {"hosts": {}}}
 	server_ips = []
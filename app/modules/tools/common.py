@@ -1,8 +1,13 @@
+import shlex
+
 import distro
 
 import app.modules.db.roxy as roxy_sql
 import app.modules.roxywi.roxy as roxywi_mod
 import app.modules.server.server as server_mod
+from app.modules.common.cache_utils import TTLCache
+
+_tools_status = TTLCache(ttl=10)
 
 
 def get_services_status(update_cur_ver=0):
@@ -15,12 +20,14 @@ def get_services_status(update_cur_ver=0):
         except Exception as e:
             raise Exception(f'error: Cannot update current versions: {e}')
 
+    try:
+        statuses = get_tools_status(list(services_name))
+    except Exception as e:
+        raise Exception(f'error: Cannot get status for tools: {e}')
+
     try:
         for s, v in services_name.items():
-            try:
-                status = is_tool_active(s)
-            except Exception as e:
-                raise Exception(f'error: Cannot get status for tool {s}: {e}')
+            status = statuses[s]
             try:
                 services.append([s, status, v])
             except Exception as e:
@@ -59,13 +66,56 @@ def update_roxy_wi(service: str) -> str:
 
 
 def is_tool_active(tool_name: str) -> str:
-    is_in_docker = roxywi_mod.is_docker()
-    if is_in_docker:
-        cmd = f"sudo supervisorctl status {tool_name}|awk '{{print $2}}'"
+    return get_tools_status([tool_name])[tool_name]
+
+
+def get_tools_status(tools: list) -> dict:
+    """
+    Statuses of the tools as {tool: status}, "active"/"inactive" from systemd or "RUNNING"/"STOPPED" from supervisor.
+    Tools that are not cached are asked for with one command, and the answers are kept for a few seconds.
+    """
+    statuses = {}
+    missing = []
+    for tool in tools:
+        status = _tools_status.get(tool)
+        if status is None:
+            missing.append(tool)
+        else:
+            statuses[tool] = status
+    if missing:
+        for tool, status in _query_tools_status(missing).items():
+            _tools_status.set(tool, status)
+            statuses[tool] = status
+    return statuses
+
+
+def invalidate_tools_status(tool_name: str = None) -> None:
+    if tool_name is None:
+        _tools_status.clear()
     else:
-        cmd = f"systemctl is-active {tool_name}"
-    status, stderr = server_mod.subprocess_execute(cmd)
-    return status[0]
+        _tools_status.delete(tool_name)
+
+
+def _query_tools_status(tools: list) -> dict:
+    names = ' '.join(shlex.quote(tool) for tool in tools)
+    statuses = {tool: '' for tool in tools}
+    if roxywi_mod.is_docker():
+        output, stderr = server_mod.subprocess_execute(f"sudo supervisorctl status {names}")
+        for line in output:
+            parts = line.split()
+            if len(parts) > 1 and parts[0].rstrip(':') in statuses:
+                statuses[parts[0].rstrip(':')] = parts[1]
+        return statuses
+
+    # systemctl show prints a block of properties for every unit, in the order of the units, separated by an empty line
+    output, stderr = server_mod.subprocess_execute(f"systemctl show -p ActiveState {names}")
+    states = [line.split('=', 1)[1] for line in output if line.startswith('ActiveState=')]
+    if len(states) != len(tools):
+        for tool in tools:
+            output, stderr = server_mod.subprocess_execute(f"systemctl is-active {shlex.quote(tool)}")
+            statuses[tool] = output[0] if output else ''
+        return statuses
+    return dict(zip(tools, states))
 
 
 def update_cur_tool_versions() -> None:
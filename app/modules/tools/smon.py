@@ -1,11 +1,19 @@
-from flask import render_template, abort
+import hashlib
+from datetime import datetime
+
+from flask import render_template, abort, make_response, request
 
 import app.modules.db.smon as smon_sql
+from app.modules.common.cache_utils import TTLCache
 import app.modules.common.common as common
 import app.modules.server.server as server_mod
 import app.modules.tools.smon_agent as smon_agent
 import app.modules.roxywi.common as roxywi_common
 
+# Public status pages are rebuilt at most this often, or when a check status changes
+STATUS_PAGE_TTL = 30
+_status_pages = TTLCache(ttl=STATUS_PAGE_TTL)
+
 
 def create_smon(json_data, user_group, show_new=1) -> bool:
     try:
@@ -210,12 +218,39 @@ def history_metrics(server_id: int) -> dict:
     return metrics
 
 
-def history_statuses(dashboard_id: int) -> str:
+def history_range_metrics(server_id: int, days: int) -> dict:
+    """
+    Chart data of the check for the last days, read from the hourly or daily rollups.
+    curr_con is the median response time, so the chart can be drawn like the one of the last checks.
+    """
+    rows = smon_sql.select_smon_history_range(server_id, days)
+    date_format = '%m-%d %H:%M' if rows and rows[0]['resolution'] == smon_sql.HISTORY_HOUR else '%Y-%m-%d'
+    labels = ''
+    curr_con = ''
+    p95 = ''
+    uptime = ''
+
+    for row in rows:
+        labels += f"{common.get_time_zoned_date(row['date'], date_format)},"
+        curr_con += f"{row['resp_p50']},"
+        p95 += f"{row['resp_p95']},"
+        uptime += f"{row['uptime']},"
+
+    return {'chartData': {'labels': labels, 'curr_con': curr_con, 'p95': p95, 'uptime': uptime}}
+
+
+def _render_history_statuses(dashboard_id: int) -> str:
     smon_statuses = smon_sql.select_smon_history(dashboard_id)
 
     return render_template('ajax/smon/history_status.html', smon_statuses=smon_statuses)
 
 
+def history_statuses(dashboard_id: int):
+    dashboard_id = int(dashboard_id)
+    cached = _get_cached(('history', dashboard_id), lambda: _render_history_statuses(dashboard_id))
+    return _conditional_response(cached)
+
+
 def history_cur_status(dashboard_id: int, check_id: int) -> str:
     cur_status = smon_sql.get_last_smon_status_by_check(dashboard_id)
     smon = smon_sql.select_one_smon(dashboard_id, check_id)
@@ -223,15 +258,8 @@ def history_cur_status(dashboard_id: int, check_id: int) -> str:
     return render_template('ajax/smon/cur_status.html', cur_status=cur_status, smon=smon)
 
 
-def check_uptime(smon_id: int) -> int:
-    count_checks = smon_sql.get_smon_history_count_checks(smon_id)
-
-    try:
-        uptime = round(count_checks['up'] * 100 / count_checks['total'], 2)
-    except Exception:
-        uptime = 0
-
-    return uptime
+def check_uptime(smon_id: int, window: str = '24h') -> float:
+    return smon_sql.get_smon_uptime([smon_id])[int(smon_id)][window]
 
 
 def create_status_page(name: str, slug: str, desc: str, checks: list) -> str:
@@ -261,7 +289,7 @@ def edit_status_page(page_id: int, name: str, slug: str, desc: str, checks: list
     return render_template('ajax/smon/status_pages.html', pages=pages)
 
 
-def show_status_page(slug: str) -> str:
+def _render_status_page(slug: str) -> str:
     page = smon_sql.select_status_page(slug)
     checks_status = {}
     if not page:
@@ -270,41 +298,89 @@ def show_status_page(slug: str) -> str:
     for p in page:
         page_id = p.id
 
-    checks = smon_sql.select_status_page_checks(page_id)
+    check_ids = [check.check_id_id for check in smon_sql.select_status_page_checks(page_id)]
+    uptimes = smon_sql.get_smon_uptime(check_ids)
+    smons = smon_sql.select_smons_by_ids(check_ids)
 
-    for check in checks:
+    for smon_id in check_ids:
         name = ''
         desc = ''
         group = ''
         check_type = ''
-        check_id = str(check.check_id)
-        smon = smon_sql.select_smon_by_id(check_id)
-        uptime = check_uptime(check_id)
+        check_id = str(smon_id)
+        uptime = uptimes[smon_id]
         en = ''
-        for s in smon:
+        s = smons.get(smon_id)
+        if s:
             name = s.name
             desc = s.desc
             check_type = s.check_type
             en = s.en
             group = s.group if s.group else 'No group'
 
-        checks_status[check_id] = {'uptime': uptime, 'name': name, 'desc': desc, 'group': group, 'check_type': check_type, 'en': en}
+        checks_status[check_id] = {
+            'uptime': uptime['24h'], 'uptime_7d': uptime['7d'], 'uptime_30d': uptime['30d'], 'name': name, 'desc': desc,
+            'group': group, 'check_type': check_type, 'en': en,
+            # The history is part of the cached page, so a view of the page does not query it for every check
+            'history': smon_sql.select_smon_history(smon_id)
+        }
 
     return render_template('smon/status_page.html', page=page, checks_status=checks_status)
 
 
-def avg_status_page_status(page_id: int) -> str:
-    page_id = int(page_id)
-    checks = smon_sql.select_status_page_checks(page_id)
+def _get_cached(key: tuple, build) -> dict:
+    """
+    Return the cached public response for the key, built again when it has expired or a status has been changed
+    by this process. Changes made by other processes, like the checks, show up when the TTL has expired.
+    Last-Modified only moves when the content itself changes.
+    """
+    version = smon_sql.get_status_version()
+    cached = _status_pages.get(key)
+    if cached is not None and cached['version'] == version:
+        return cached
+
+    body = build()
+    etag = hashlib.sha1(body.encode('utf-8')).hexdigest()
+    if cached is not None and cached['etag'] == etag:
+        last_modified = cached['last_modified']
+    else:
+        last_modified = datetime.utcnow().replace(microsecond=0)
+    cached = {'body': body, 'etag': etag, 'last_modified': last_modified, 'version': version}
+    _status_pages.set(key, cached)
+    return cached
+
+
+def _conditional_response(cached: dict):
+    response = make_response(cached['body'])
+    response.set_etag(cached['etag'])
+    response.last_modified = cached['last_modified']
+    response.cache_control.public = True
+    response.cache_control.max_age = STATUS_PAGE_TTL
+    return response.make_conditional(request)
+
 
-    for check in checks:
-        check_id = str(check.check_id)
-        if not smon_sql.get_last_smon_status_by_check(check_id):
+def show_status_page(slug: str):
+    cached = _get_cached(('page', slug), lambda: _render_status_page(slug))
+    return _conditional_response(cached)
+
+
+def _avg_status_page_status(page_id: int) -> str:
+    check_ids = [check.check_id_id for check in smon_sql.select_status_page_checks(page_id)]
+    latest = smon_sql.select_latest_smon_statuses(check_ids)
+
+    for check_id in check_ids:
+        if check_id not in latest or not latest[check_id]['status']:
             return '0'
 
     return '1'
 
 
+def avg_status_page_status(page_id: int):
+    page_id = int(page_id)
+    cached = _get_cached(('avg', page_id), lambda: _avg_status_page_status(page_id))
+    return _conditional_response(cached)
+
+
 def change_smon_port(new_port: int) -> None:
     cmd = f"sudo sed -i 's/\(^ExecStart.*$\)/ExecStart=gunicorn --workers 1 --bind 0.0.0.0:{new_port} -m 007 smon:app/' /etc/systemd/system/roxy-wi-smon.service"
     server_mod.subprocess_execute(cmd)
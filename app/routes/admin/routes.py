@@ -15,6 +15,7 @@ import app.modules.roxywi.auth as roxywi_auth
 import app.modules.roxywi.common as roxywi_common
 import app.modules.tools.common as tools_common
 import app.modules.server.ssh as ssh_mod
+from app.modules.server.ssh_connection import pool as ssh_pool
 from app.views.admin.views import SettingsView
 
 bp.add_url_rule(
@@ -88,8 +89,10 @@ def update_tools(service):
 @bp.route('/tools/action/<service>/<any(start, stop, restart):action>')
 def action_tools(service, action):
     roxywi_auth.page_for_admin()
+    output = roxy.action_service(action, service)
+    tools_common.invalidate_tools_status(service)
 
-    return roxy.action_service(action, service)
+    return output
 
 
 @bp.route('/update')
@@ -111,6 +114,12 @@ def check_update():
     return 'ok'
 
 
+@bp.get('/ssh/pool')
+def ssh_pool_stats():
+    roxywi_auth.page_for_admin()
+    return ssh_pool.get_stats()
+
+
 @bp.get('/settings')
 @get_user_params()
 def get_settings():
@@ -17,6 +17,7 @@ import app.modules.roxywi.auth as roxywi_auth
 import app.modules.roxywi.common as roxywi_common
 import app.modules.config.config as config_mod
 import app.modules.config.common as config_common
+import app.modules.config.version_store as version_store
 import app.modules.config.section as section_mod
 import app.modules.service.haproxy as service_haproxy
 import app.modules.server.server as server_mod
@@ -73,6 +74,17 @@ def show_config_files(service):
 def find_in_config(service):
     server_ip = common.is_ip_or_dns(request.form.get('serv'))
     finding_words = common.checkAjaxInput(request.form.get('words'))
+    if service == 'haproxy':
+        # HAProxy has one config, it is searched in its parsed copy
+        cfg = config_common.generate_config_path(service, server_ip)
+        try:
+            config_mod.get_config(server_ip, cfg, service=service)
+            return_find = section_mod.load_config(cfg).find(finding_words)
+            return_find = config_mod.show_finding_in_config(return_find, grep=finding_words)
+        except Exception as e:
+            return str(e)
+        return return_find
+
     log_path = sql.get_setting(service + '_dir')
     log_path = common.return_nice_path(log_path)
     commands = f'sudo grep "{finding_words}" {log_path}*/*.conf -C 2 -Rn'
@@ -205,8 +217,10 @@ def show_version(service, server_ip: Union[IPvAnyAddress, DomainName], configver
 def save_version(service, server_ip: Union[IPvAnyAddress, DomainName], configver):
     server_ip = str(server_ip)
     roxywi_auth.page_for_admin(level=3)
-    config_dir = config_common.get_config_dir('haproxy')
-    configver = config_dir + configver
+    try:
+        configver = version_store.materialize(service, configver)
+    except Exception as e:
+        return roxywi_common.handler_exceptions_for_json_data(e, '')
     service_desc = service_sql.select_service(service)
     save_action = request.json.get('action')
     try:
@@ -352,10 +366,11 @@ def show_configs_for_compare(service, server_ip):
 def show_compare(service, server_ip):
     left = common.checkAjaxInput(request.json.get('left'))
     right = common.checkAjaxInput(request.json.get('right'))
+    ignore_whitespace = bool(request.json.get('ignore_whitespace', True))
     if '..' in left or '..' in right:
         return jsonify({'error': 'error: .. is not allowed'})
     try:
-        compare = config_mod.compare_config(service, left, right)
+        compare = config_mod.compare_config(service, left, right, ignore_whitespace=ignore_whitespace)
     except Exception as e:
         return roxywi_common.handler_exceptions_for_json_data(e, '')
     return jsonify({'compare': compare})
@@ -1,4 +1,4 @@
-from flask import render_template, request, redirect, url_for, g
+from flask import render_template, request, redirect, url_for, g, Response, stream_with_context, jsonify
 from flask_jwt_extended import jwt_required
 
 from app.modules.roxywi.exception import RoxywiResourceNotFound
@@ -49,6 +49,20 @@ def logs_internal():
     return render_template('logs_internal.html', **kwargs)
 
 
+@bp.route('/internal/search')
+@get_user_params()
+def search_internal_log():
+    roxywi_auth.page_for_admin(level=2)
+    try:
+        return jsonify(roxy_logs.search_roxy_log(
+            since=request.args.get('since'), until=request.args.get('until'), level=request.args.get('level'),
+            user=request.args.get('user'), group=request.args.get('group'), server_ip=request.args.get('server_ip'),
+            text=request.args.get('text'), cursor=request.args.get('cursor'), rows=request.args.get('rows')
+        ))
+    except Exception as e:
+        return roxywi_common.handle_json_exceptions(e, 'Cannot search the log')
+
+
 @bp.route('/<service>', defaults={'waf': None})
 @bp.route('/<service>/<waf>')
 @check_services
@@ -121,18 +135,19 @@ def show_logs(service, serv, rows, waf):
     hour1 = request.form.get('hour1') or request.args.get('hour1')
     minute1 = request.form.get('minute1') or request.args.get('minute1')
     log_file = request.form.get('file') or request.args.get('file')
+    cursor = request.form.get('cursor') or request.args.get('cursor')
 
     if roxywi_common.check_user_group_for_flask():
         try:
-            out = roxy_logs.show_roxy_log(
+            page = roxy_logs.query_roxy_log(
                 serv=serv, rows=rows, waf=waf, grep=grep, exgrep=exgrep, hour=hour, minute=minute,
-                hour1=hour1, minute1=minute1, service=service, log_file=log_file
+                hour1=hour1, minute1=minute1, service=service, log_file=log_file, cursor=cursor
             )
-            if 'No such file or directory' in out:
-                return roxywi_common.handle_json_exceptions(Exception('File not found'), serv, 'File not found'), 500
         except Exception as e:
+            if 'No such file or directory' in str(e):
+                return roxywi_common.handle_json_exceptions(Exception('File not found'), serv, 'File not found'), 500
             return str(e)
         else:
-            return out
+            return Response(stream_with_context(roxy_logs.render_log_page(page, grep)), mimetype='text/html')
 
     return 'error: no log file', 500
@@ -1,6 +1,6 @@
 from typing import Union
 
-from flask import render_template, g
+from flask import render_template, g, jsonify
 from flask_jwt_extended import jwt_required
 from flask_pydantic import validate
 from pydantic import IPvAnyAddress
@@ -38,6 +38,11 @@ def show_services_overview():
     return roxy_overview.show_services_overview()
 
 
+@bp.route('/overview/workers')
+def show_workers():
+    return jsonify(roxy_overview.show_workers())
+
+
 @bp.route('/overview/server/<server_ip>')
 @validate()
 def overview_server(server_ip: Union[IPvAnyAddress, DomainName]):
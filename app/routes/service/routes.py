@@ -8,7 +8,6 @@ from pydantic import IPvAnyAddress
 
 from app import cache
 from app.routes.service import bp
-import app.modules.db.sql as sql
 import app.modules.db.waf as waf_sql
 import app.modules.db.ha_cluster as ha_sql
 import app.modules.db.server as server_sql
@@ -16,6 +15,7 @@ import app.modules.db.service as service_sql
 from app.middleware import check_services, get_user_params
 import app.modules.common.common as common
 import app.modules.server.server as server_mod
+import app.modules.config.runtime_client as runtime_client
 import app.modules.service.common as service_common
 import app.modules.roxywi.common as roxywi_common
 import app.modules.roxywi.overview as roxy_overview
@@ -147,18 +147,15 @@ def ssl_service(service):
 @validate()
 def cpu_ram_metrics(server_ip: Union[IPvAnyAddress, DomainName], server_id: int, name: str, service: str):
     if service == 'haproxy':
-        sock_port = sql.get_setting('haproxy_sock_port')
-        cmd = f'echo "show info" |nc {server_ip} {sock_port} -w 1|grep -e "node\|Nbproc\|Maxco\|MB\|Nbthread"'
-        out = server_mod.subprocess_execute(cmd)
-        return_out = ""
-
-        for k in out:
-            if "Ncat:" not in k:
-                for r in k:
-                    return_out += r
-                    return_out += "\n"
-            else:
-                return_out = "Cannot connect to HAProxy"
+        try:
+            info = runtime_client.get_client(str(server_ip)).show_info()
+        except Exception:
+            return_out = "Cannot connect to HAProxy"
+        else:
+            return_out = ''.join(
+                f'{key}: {value}\n' for key, value in info.items()
+                if any(s in key for s in ('node', 'Nbproc', 'Maxco', 'MB', 'Nbthread'))
+            )
     else:
         return_out = ''
 
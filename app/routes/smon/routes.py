@@ -372,6 +372,12 @@ def smon_history_metric(dashboard_id):
     return jsonify(smon_mod.history_metrics(dashboard_id))
 
 
+@bp.route('/history/metric/<int:dashboard_id>/<int:days>')
+@jwt_required()
+def smon_history_range_metric(dashboard_id, days):
+    return jsonify(smon_mod.history_range_metrics(dashboard_id, days))
+
+
 @bp.route('/history/statuses/<int:dashboard_id>')
 def smon_history_statuses(dashboard_id):
     return smon_mod.history_statuses(dashboard_id)
@@ -181,18 +181,20 @@ function showApacheLog(serv) {
 	let hour1 = $('#time_range_out_hour1').val();
 	let minute1 = $('#time_range_out_minut1').val();
 	let url = "/logs/apache_internal/" + serv + "/" + rows;
+	let data = {
+		rows: rows,
+		serv: serv,
+		grep: grep,
+		exgrep: exgrep,
+		hour: hour,
+		minute: minute,
+		hour1: hour1,
+		minute1: minute1
+	};
+	lastLogRequest = {url: url, data: data};
 	$.ajax( {
 		url: url,
-		data: {
-			rows: rows,
-			serv: serv,
-			grep: grep,
-			exgrep: exgrep,
-			hour: hour,
-			minute: minute,
-			hour1: hour1,
-			minute1: minute1
-		},
+		data: data,
 		type: "POST",
 		success: function( data ) {
 			$("#ajax").html(data);
@@ -172,6 +172,7 @@ function showCompare() {
 		data: JSON.stringify({
 			left: $('#left').val(),
 			right: $("#right").val(),
+			ignore_whitespace: $('#ignore_whitespace').is(':checked'),
 		}),
 		contentType: "application/json; charset=utf-8",
 		type: "POST",
@@ -83,6 +83,17 @@ function stream_chart(chart_id, service, service_ip, is_http=0) {
         chart_id.update();
     }
 }
+function chartLabels(chartData) {
+    // Buckets start at chartData.start and are chartData.step seconds wide, labels are in the user time zone
+    let labels = [];
+    let count = chartData[Object.keys(chartData).find(key => Array.isArray(chartData[key]))].length;
+    let show_date = chartData.step * count > 86400;
+    for (let i = 0; i < count; i++) {
+        let date = new Date((chartData.start + i * chartData.step + chartData.tz_offset) * 1000).toISOString();
+        labels.push(show_date ? date.substring(5, 16).replace('T', ' ') : date.substring(11, 19));
+    }
+    return labels;
+}
 function getHttpChartData(server) {
     let hide_http_metrics = localStorage.getItem('hide_http_metrics');
     if (hide_http_metrics === 'disabled') {
@@ -102,35 +113,23 @@ function getHttpChartData(server) {
             data.push(result.chartData.http_5xx);
             data.push('HTTP statuses for '+result.chartData.server);
 
-            let labels = result.chartData.labels;
+            let labels = chartLabels(result.chartData);
             renderHttpChart(data, labels, server);
         }
     });
 }
 let charts = []
 function renderHttpChart(data, labels, server) {
-    // Преобразование данных в массивы
-    const dataArray0 = data[0].split(',');
-    const dataArray1 = data[1].split(',');
-    const dataArray2 = data[2].split(',');
-    const dataArray3 = data[3].split(',');
-
-    // Удаление последнего пустого элемента в каждом массиве
-    dataArray0.pop();
-    dataArray1.pop();
-    dataArray2.pop();
-    dataArray3.pop();
-
     let ctx = document.getElementById('http_' + server).getContext('2d');
     let myChart = new Chart(ctx, {
         type: 'line',
         data: {
-            labels: labels.split(','),
+            labels: labels,
             datasets: [
                 {
                     normalized: true,
                     label: '2xx',
-                    data: dataArray0,
+                    data: data[0],
                     borderColor: 'rgba(75, 192, 192, 1)',
                     backgroundColor: 'rgba(75, 192, 192, 0.2)',
                     fill: true
@@ -138,7 +137,7 @@ function renderHttpChart(data, labels, server) {
                 {
                     normalized: true,
                     label: '3xx',
-                    data: dataArray1,
+                    data: data[1],
                     borderColor: 'rgba(54, 162, 235, 1)',
                     backgroundColor: 'rgba(54, 162, 235, 0.2)',
                     fill: true
@@ -146,7 +145,7 @@ function renderHttpChart(data, labels, server) {
                 {
                     normalized: true,
                     label: '4xx',
-                    data: dataArray2,
+                    data: data[2],
                     borderColor: 'rgba(255, 206, 86, 1)',
                     backgroundColor: 'rgba(255, 206, 86, 0.2)',
                     fill: true
@@ -154,7 +153,7 @@ function renderHttpChart(data, labels, server) {
                 {
                     normalized: true,
                     label: '5xx',
-                    dataArray3,
+                    data: data[3],
                     borderColor: 'rgb(255,86,86)',
                     backgroundColor: 'rgba(255,86,86,0.2)',
                     fill: true
@@ -219,31 +218,22 @@ function getChartData(server) {
             data.push(result.chartData.sess_rate);
             data.push(result.chartData.server);
 
-            let labels = result.chartData.labels;
+            let labels = chartLabels(result.chartData);
             renderChart(data, labels, server);
         }
     });
 }
 function renderChart(data, labels, server) {
-    // Преобразование данных в массивы
-    const dataArray0 = data[0].split(',');
-    const dataArray1 = data[1].split(',');
-    const dataArray2 = data[2].split(',');
-
-    // Удаление последнего пустого элемента в каждом массиве
-    dataArray0.pop();
-    dataArray1.pop();
-    dataArray2.pop();
     let ctx = document.getElementById(server);
     let myChart = new Chart(ctx, {
         type: 'line',
         data: {
-            labels: labels.split(','),
+            labels: labels,
             datasets: [
                 {
                     normalized: true,
                     label: 'Connections',
-                    data: dataArray0,
+                    data: data[0],
                     borderColor: 'rgba(75, 192, 192, 1)',
                     backgroundColor: 'rgba(75, 192, 192, 0.2)',
                     fill: true
@@ -251,7 +241,7 @@ function renderChart(data, labels, server) {
                 {
                     normalized: true,
                     label: 'SSL Connections',
-                    data: dataArray1,
+                    data: data[1],
                     borderColor: 'rgba(54, 162, 235, 1)',
                     backgroundColor: 'rgba(54, 162, 235, 0.2)',
                     fill: true
@@ -259,7 +249,7 @@ function renderChart(data, labels, server) {
                 {
                     normalized: true,
                     label: 'Session rate',
-                    data: dataArray2,
+                    data: data[2],
                     borderColor: 'rgba(255, 206, 86, 1)',
                     backgroundColor: 'rgba(255, 206, 86, 0.2)',
                     fill: true
@@ -321,30 +311,20 @@ function getWafChartData(server) {
             let data = [];
             data.push(result.chartData.curr_con);
             data.push(result.chartData.server);
-            let labels = result.chartData.labels;
+            let labels = chartLabels(result.chartData);
             renderServiceChart(data, labels, server, 'waf');
         }
     });
 }
 function renderServiceChart(data, labels, server, service) {
-    const dataArray = data[0].split(',');
-
-    // Удаление последнего пустого элемента в каждом массиве
-    dataArray.pop();
-    dataArray.pop();
-    let label = labels.split(',');
-    label.pop();
-    label.pop();
     let ctx = document.getElementById(service + '_' + server).getContext('2d');
     let additional_title = '';
     if (service === 'waf') {
         additional_title = 'WAF ';
     }
     let config = return_service_chart_config();
-    for (let i=0; i<label.length; i++) {
-        config.data.labels.push(label[i])
-        config.data.datasets[0].data.push(dataArray[i])
-    }
+    config.data.labels = labels;
+    config.data.datasets[0].data = data[0];
     config.options.plugins.title.text = data[1] + ' ' + additional_title;
     let myChart = new Chart(ctx, config);
     myChart.update();
@@ -364,7 +344,7 @@ function getNginxChartData(server) {
             let data = [];
             data.push(result.chartData.curr_con);
             data.push(result.chartData.server);
-            let labels = result.chartData.labels;
+            let labels = chartLabels(result.chartData);
             renderServiceChart(data, labels, server, 'nginx');
         }
     });
@@ -380,7 +360,7 @@ function getApacheChartData(server) {
             let data = [];
             data.push(result.chartData.curr_con);
             data.push(result.chartData.server);
-            let labels = result.chartData.labels;
+            let labels = chartLabels(result.chartData);
             renderServiceChart(data, labels, server, 'apache');
         }
     });
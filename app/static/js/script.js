@@ -146,19 +146,21 @@ function showLog() {
 		file = findGetParameter('file');
 		url = "/logs/" + service + "/waf/" + serv + "/" + rows + file_from_get;
 	}
+	let data = {
+		show_log: rows,
+		waf: waf,
+		grep: grep,
+		exgrep: exgrep,
+		hour: hour,
+		minute: minute,
+		hour1: hour1,
+		minute1: minute1,
+		file: file,
+	};
+	lastLogRequest = {url: url, data: data};
 	$.ajax( {
 		url: url,
-		data: {
-			show_log: rows,
-			waf: waf,
-			grep: grep,
-			exgrep: exgrep,
-			hour: hour,
-			minute: minute,
-			hour1: hour1,
-			minute1: minute1,
-			file: file,
-		},
+		data: data,
 		type: "POST",
 		success: function( data ) {
 			toastr.clear();
@@ -166,6 +168,23 @@ function showLog() {
 		}
 	} );
 }
+// The last log request, so older lines of the same log can be asked for with a cursor
+var lastLogRequest = null;
+function loadOlderLog(cursor) {
+	if (lastLogRequest === null) {
+		return false;
+	}
+	let data = Object.assign({}, lastLogRequest.data, {cursor: cursor});
+	$.ajax( {
+		url: lastLogRequest.url,
+		data: data,
+		type: "POST",
+		success: function( data ) {
+			$("#ajax .log-older").remove();
+			$("#ajax").prepend(data);
+		}
+	} );
+}
 function showRemoteLogFiles() {
 	let serv = $('#serv').val();
 	if (serv === undefined || serv === null) {
@@ -406,19 +425,21 @@ function viewLogs() {
 			viewlogs = findGetParameter('viewlogs')
 		}
 		let url = "/logs/internal/" + viewlogs + "/" + rows;
+		let data = {
+			viewlogs: viewlogs,
+			serv: viewlogs,
+			rows: rows,
+			grep: grep,
+			exgrep: exgrep,
+			hour: hour,
+			minute: minute,
+			hour1: hour1,
+			minute1: minute1,
+		};
+		lastLogRequest = {url: url, data: data};
 		$.ajax({
 			url: url,
-			data: {
-				viewlogs: viewlogs,
-				serv: viewlogs,
-				rows: rows,
-				grep: grep,
-				exgrep: exgrep,
-				hour: hour,
-				minute: minute,
-				hour1: hour1,
-				minute1: minute1,
-			},
+			data: data,
 			type: "POST",
 			success: function (data) {
 				$("#ajax").html(data);
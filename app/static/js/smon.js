@@ -1010,18 +1010,23 @@ function agentAction(action, id, server_ip, dialog_id) {
 	});
 }
 var charts = []
-function getSmonHistoryCheckData(server) {
+function getSmonHistoryCheckData(server, days) {
+    let url = "/smon/history/metric/" + server;
+    // The 7- and 30-day views are read from the hourly and daily rollups
+    if (days && days !== '0') {
+        url += "/" + days;
+    }
     $.ajax({
-        url: "/smon/history/metric/" + server,
+        url: url,
         success: function (result) {
             let data = [];
             data.push(result.chartData.curr_con);
             let labels = result.chartData.labels;
-            renderSMONChart(data[0], labels, '3');
+            renderSMONChart(data[0], labels, '3', result.chartData.p95);
         }
     });
 }
-function renderSMONChart(data, labels, server) {
+function renderSMONChart(data, labels, server, p95) {
     const resp_time_word = translate_div.attr('data-resp_time');
     const ctx = document.getElementById('metrics_' + server);
 
@@ -1045,11 +1050,28 @@ function renderSMONChart(data, labels, server) {
         fill: true
     };
 
+    const datasets = [dataset];
+    if (p95) {
+        const p95Array = p95.split(',');
+        p95Array.pop();
+        dataset.label = resp_time_word + ' p50 (ms)';
+        datasets.push({
+            label: resp_time_word + ' p95 (ms)',
+            data: p95Array,
+            borderColor: 'rgba(240, 173, 78, 1)',
+            backgroundColor: 'rgba(240, 173, 78, 0.2)',
+            tension: 0.4,
+            pointRadius: 3,
+            borderWidth: 1,
+            fill: false
+        });
+    }
+
     const config = {
         type: 'line',
         data: {
             labels: labelArray,
-            datasets: [dataset]
+            datasets: datasets
         },
         options: {
             animation: true,
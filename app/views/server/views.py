@@ -10,6 +10,7 @@ import app.modules.db.server as server_sql
 import app.modules.roxywi.group as group_mod
 import app.modules.roxywi.common as roxywi_common
 import app.modules.server.server as server_mod
+import app.modules.server.ssh as ssh_mod
 from app.middleware import get_user_params, page_for_admin, check_group
 from app.modules.roxywi.class_models import BaseResponse, IdResponse, IdDataResponse, ServerRequest, GroupQuery, GroupRequest
 from app.modules.common.common_classes import SupportClass
@@ -287,6 +288,7 @@ class ServerView(MethodView):
                 body.firewall_enable, body.protected
             )
             server_ip = server_sql.get_server(server_id).ip
+            ssh_mod.invalidate_ssh_cache()
             roxywi_common.logging(server_ip, f'The server {body.hostname} has been update', roxywi=1, login=1, keep_history=1, service='server')
         except Exception as e:
             return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot update server')
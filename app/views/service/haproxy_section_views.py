@@ -11,7 +11,7 @@ import app.modules.db.add as add_sql
 import app.modules.db.server as server_sql
 import app.modules.config.config as config_mod
 import app.modules.config.common as config_common
-import app.modules.service.installation as service_mod
+import app.modules.config.section_render as section_render
 import app.modules.roxywi.common as roxywi_common
 from app.middleware import get_user_params, page_for_admin, check_group, check_services
 from app.modules.db.db_model import Server
@@ -62,22 +62,10 @@ class HaproxySectionView(MethodView):
         except Exception as e:
             return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot find a server')
         if query.generate:
-            cfg = '/tmp/haproxy-generated-config.cfg'
-            os.system(f'touch {cfg}')
-            inv = service_mod.generate_section_inv(body.model_dump(mode='json'), cfg, service)
-
             try:
-                output = service_mod.run_ansible_locally(inv, 'haproxy_section')
-                if len(output['failures']) > 0 or len(output['dark']) > 0:
-                    raise Exception('Cannot create HAProxy section. Check Apache error log')
+                conf = section_render.render_haproxy_section(body.model_dump(mode='json')).decode('utf-8')
             except Exception as e:
                 return roxywi_common.handler_exceptions_for_json_data(e, f'Cannot create HAProxy section: {e}')
-            try:
-                with open(cfg, 'r') as file:
-                    conf = file.read()
-            except Exception as e:
-                raise Exception(f'error: Cannot read config file: {e}')
-            os.remove(cfg)
             return DataStrResponse(data=conf).model_dump(mode='json'), 200
 
         try:
@@ -153,9 +141,9 @@ class HaproxySectionView(MethodView):
     def _edit_config(service, server: Server, body: HaproxyConfigRequest, action: Literal['create', 'delete'], **kwargs) -> str:
         cfg = config_common.generate_config_path(service, server.ip)
         if action == 'create':
-            inv = service_mod.generate_section_inv(body.model_dump(mode='json'), cfg, service)
+            section = body.model_dump(mode='json')
         else:
-            inv = service_mod.generate_section_inv_for_del(cfg, kwargs.get('section_type'), kwargs.get('section_name'))
+            section = {'type': kwargs.get('section_type'), 'name': kwargs.get('section_name')}
 
         try:
             config_mod.get_config(server.ip, cfg, service=service)
@@ -164,13 +152,7 @@ class HaproxySectionView(MethodView):
 
         os.system(f'cp {cfg} {cfg}.old')
 
-        try:
-            output = service_mod.run_ansible_locally(inv, 'haproxy_section')
-        except Exception as e:
-            raise e
-
-        if len(output['failures']) > 0 or len(output['dark']) > 0:
-            raise Exception('Cannot create HAProxy section. Check Apache error log')
+        section_render.edit_haproxy_config(cfg, section, action)
 
         if body:
             if body.action:
@@ -13,7 +13,7 @@ import app.modules.db.server as server_sql
 import app.modules.server.ssh as mod_ssh
 import app.modules.config.config as config_mod
 import app.modules.config.common as config_common
-import app.modules.service.installation as service_mod
+import app.modules.config.section_render as section_render
 import app.modules.roxywi.common as roxywi_common
 from app.middleware import get_user_params, page_for_admin, check_group, check_services
 from app.modules.db.db_model import Server
@@ -64,25 +64,10 @@ class NginxSectionView(MethodView):
         except Exception as e:
             return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot find a server')
         if query.generate:
-            cfg = '/tmp/nginx-generated-config.conf'
-            os.system(f'touch {cfg}')
-            inv = service_mod.generate_section_inv(body.model_dump(mode='json'), cfg, service)
-
             try:
-                output = service_mod.run_ansible_locally(inv, 'nginx_section')
-                if len(output['failures']) > 0 or len(output['dark']) > 0:
-                    raise Exception('Cannot create NGINX section. Check Apache error log')
+                conf = section_render.render_nginx_section(body.model_dump(mode='json'))
             except Exception as e:
                 return roxywi_common.handler_exceptions_for_json_data(e, f'Cannot create NGINX section: {e}')
-            try:
-                with open(cfg, 'r') as file:
-                    conf = file.read()
-            except Exception as e:
-                raise Exception(f'error: Cannot read config file: {e}')
-            try:
-                os.remove(cfg)
-            except Exception:
-                pass
             return DataStrResponse(data=conf).model_dump(mode='json'), 200
 
         try:
@@ -166,23 +151,13 @@ class NginxSectionView(MethodView):
         cfg = config_common.generate_config_path(service, server.ip)
         config_file_name = self._create_config_path(service, body.type, body.name)
 
-        if action in ('create', 'update'):
-            inv = service_mod.generate_section_inv(body.model_dump(mode='json'), cfg, service)
-        else:
-            inv = service_mod.generate_section_inv_for_del(cfg, kwargs.get('section_type'), kwargs.get('section_name'))
-
         if action == 'update':
             config_mod.get_config(server.ip, cfg, service=service, config_file_name=config_file_name)
 
         os.system(f'mv {cfg} {cfg}.old')
 
-        try:
-            output = service_mod.run_ansible_locally(inv, 'nginx_section')
-        except Exception as e:
-            raise e
-
-        if len(output['failures']) > 0 or len(output['dark']) > 0:
-            raise Exception('Cannot create NGINX section. Check Apache error log')
+        if action in ('create', 'update'):
+            section_render.write_nginx_section(cfg, body.model_dump(mode='json'))
 
         if body:
             if body.action:
@@ -13,6 +13,8 @@ import app.modules.db.service as service_sql
 import app.modules.roxywi.common as roxywi_common
 import app.modules.config.config as config_mod
 import app.modules.config.common as config_common
+import app.modules.config.version_store as version_store
+import app.modules.config.runtime_client as runtime_client
 import app.modules.server.server as server_mod
 import app.modules.service.action as service_action
 import app.modules.service.common as service_common
@@ -94,11 +96,11 @@ class ServiceView(MethodView):
             return roxywi_common.handler_exceptions_for_json_data(e, 'Cannot find a server')
 
         if service == 'haproxy':
-            cmd = 'echo "show info" |nc %s %s -w 1|grep -e "Ver\|CurrConns\|Maxco\|MB\|Uptime:\|Process_num"' % (
-                server.ip, sql.get_setting('haproxy_sock_port')
-            )
-            out = server_mod.subprocess_execute(cmd)
-            data = self.return_dict_from_out(out[0])
+            try:
+                info = runtime_client.get_client(server.ip).show_info()
+            except Exception:
+                info = {}
+            data = self.return_dict_from_out(info)
             if len(data) == 0:
                 data = ErrorResponse(error='Cannot get information').model_dump(mode='json')
             else:
@@ -213,17 +215,13 @@ class ServiceView(MethodView):
         return jsonify(data)
 
     @staticmethod
-    def return_dict_from_out(out):
+    def return_dict_from_out(info: dict) -> dict:
         data = {}
-        for k in out:
-            if "Ncat:" not in k:
-                k = k.split(':')
-                if k[0] == 'Process_num':
-                    data['Process'] = k[1].strip()
-                else:
-                    data[k[0]] = k[1].strip()
-            else:
-                data = {"error": "Cannot connect to HAProxy"}
+        for key, value in info.items():
+            if key == 'Process_num':
+                data['Process'] = value
+            elif key == 'Uptime' or any(s in key for s in ('Ver', 'CurrConns', 'Maxco', 'MB')):
+                data[key] = value
 
         return data
 
@@ -385,7 +383,10 @@ class ServiceConfigView(MethodView):
             configs_dir = config_common.get_config_dir(service)
             if '..' in configs_dir:
                 return ErrorResponse(error='nice try').model_dump(mode='json')
-            cfg = configs_dir + query.version
+            try:
+                cfg = version_store.materialize(service, query.version)
+            except Exception as e:
+                return ErrorResponse(error=str(e)).model_dump(mode='json')
         else:
             cfg = config_common.generate_config_path(service, server_ip)
             try:
@@ -588,9 +589,7 @@ class ServiceConfigVersionsView(MethodView):
         except Exception as e:
             return roxywi_common.handler_exceptions_for_json_data(e, '')
 
-        config_dir = config_common.get_config_dir(service)
-        file_format = config_common.get_file_format(service)
-        files = roxywi_common.get_files(config_dir, file_format, server_ip)
+        files = version_store.list_versions(server_ip, service)
         return DataResponse(data=files).model_dump(mode='json')
 
     @validate(body=VersionsForDelete)
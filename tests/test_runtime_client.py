@@ -0,0 +1,79 @@
+import os
+import sys
+import time
+import types
+import socket
+import threading
+import unittest
+import importlib.util
+from unittest import mock
+
+RUNTIME_CLIENT = os.path.join(os.path.dirname(__file__), '..', 'app', 'modules', 'config', 'runtime_client.py')
+
+
+def load_runtime_client():
+	# Importing the app package starts the whole application, the client only needs get_setting of the sql module
+	modules = {}
+	for name in ('app', 'app.modules', 'app.modules.db'):
+		modules[name] = types.ModuleType(name)
+		modules[name].__path__ = []
+	modules['app.modules.db.sql'] = types.ModuleType('app.modules.db.sql')
+	with mock.patch.dict(sys.modules, modules):
+		spec = importlib.util.spec_from_file_location('runtime_client', RUNTIME_CLIENT)
+		module = importlib.util.module_from_spec(spec)
+		spec.loader.exec_module(module)
+	return module
+
+
+class FakeRuntimeApi:
+	"""
+	Stats socket in prompt mode, answering "ok" to every command.
+	"""
+
+	def __init__(self):
+		self.connections = 0
+		self._server = socket.create_server(('127.0.0.1', 0))
+		self.port = self._server.getsockname()[1]
+		threading.Thread(target=self._accept, daemon=True).start()
+
+	def _accept(self):
+		while True:
+			try:
+				conn, _ = self._server.accept()
+			except OSError:
+				return
+			self.connections += 1
+			threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+	def _serve(self, conn):
+		with conn, conn.makefile('rb') as f:
+			for line in f:
+				if line.strip() == b'prompt':
+					conn.sendall(b'\n> ')
+				else:
+					conn.sendall(b'ok\n\n> ')
+
+	def close(self):
+		self._server.close()
+
+
+class RuntimeClientTest(unittest.TestCase):
+	def setUp(self):
+		self.runtime_client = load_runtime_client()
+		self.server = FakeRuntimeApi()
+		self.client = self.runtime_client.RuntimeClient('127.0.0.1', self.server.port, timeout=5)
+
+	def tearDown(self):
+		self.client.close()
+		self.server.close()
+
+	def test_connection_is_reused(self):
+		self.assertEqual(self.client.execute('show info'), 'ok')
+		started = time.monotonic()
+		self.assertEqual(self.client.execute('show info'), 'ok')
+		self.assertLess(time.monotonic() - started, 1)
+		self.assertEqual(self.server.connections, 1)
+
+
+if __name__ == '__main__':
+	unittest.main()